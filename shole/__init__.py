@@ -1,4 +1,36 @@
 """Imports for from-package syntax."""
 from .managers import ProcessHost, SingleProcessHandler, PoolProcessHandler, clear_and_close_queues, clear_queues
-from .drones import cam_process, SyncCam
+from .schedulers import HeadlessRoot, VirtualRoot, FramePacer
+from .metrics import MetricsRegistry
+from .tracing import Tracer
 name = "shole"
+
+_lazy_drones = ("cam_process", "SyncCam", "ChangeDetector")  # drones imports cv2 and numpy, so load it on first access.
+
+
+def __getattr__(attribute):
+    """
+    Load the drones module the first time one of its exports is accessed.
+
+    :Parameters:
+        :param str attribute: the name being looked up on this package.
+    :rtype: object
+    :return: the drones export.
+    :raises AttributeError: if attribute is not a lazily loaded export.
+    """
+    if attribute in _lazy_drones:
+        from . import drones
+        value = getattr(drones, attribute)
+        globals()[attribute] = value
+        return value
+    raise AttributeError("module {!r} has no attribute {!r}".format(__name__, attribute))
+
+
+def __dir__():
+    """
+    List this package's names, including exports which have not been loaded yet.
+
+    :rtype: list of str
+    :return list of str: the names.
+    """
+    return sorted(set(globals()) | set(_lazy_drones))
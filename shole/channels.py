@@ -0,0 +1,1440 @@
+"""Transport primitives for moving large payloads between processes without per-message pickling."""
+import os
+import pickle
+import struct
+import sys
+from collections import namedtuple, deque
+from time import monotonic
+from multiprocessing import get_context
+from multiprocessing.queues import Queue as _BaseMultiQueue
+from multiprocessing.reduction import ForkingPickler
+from multiprocessing.util import Finalize
+from threading import Lock
+from queue import Queue
+from queue import Empty as EmptyQueue
+from queue import Full as FullQueue
+try:
+    from multiprocessing import resource_tracker
+    from multiprocessing.shared_memory import SharedMemory
+except ImportError:  # Python < 3.8.
+    SharedMemory = None
+try:
+    from .constants import BLOCK, DROP_NEWEST, DROP_OLDEST, FRAME_RAW, FRAME_JPEG, FRAME_PNG, FRAME_WEBP
+except ImportError:  # Imported as a top-level module, with the package directory on sys.path.
+    from constants import BLOCK, DROP_NEWEST, DROP_OLDEST, FRAME_RAW, FRAME_JPEG, FRAME_PNG, FRAME_WEBP
+
+
+RingToken = namedtuple("RingToken", ("slot", "sequence"))  # The only part of a ring frame which crosses a queue.
+ControlMessage = namedtuple("ControlMessage", ("code", "signal"))  # A constants.CONTROL_* code and its signal.
+TimedMessage = namedtuple("TimedMessage", ("payload", "sequence", "put_at", "relayed_at"))  # Monotonic timestamps.
+
+
+class FrameRing(object):
+    """
+    Preallocated ring of same-shape frame buffers in shared memory.
+
+    The writing process copies each frame into the next slot and sends only the small RingToken returned by write
+    through its queue; the reading process turns that token back into a frame with read. Every slot carries a sequence
+    number which is invalidated while the slot is being written, so a reader which falls more than slots frames behind
+    gets None for an overwritten frame instead of a torn one.
+
+    Create the ring in the host process, pass it to the asynchronous process (it pickles as a reference to the same
+    shared memory), and call unlink from the host once every process is done with it.
+
+    numpy is imported when a ring is created or attached, so that importing this module does not need it.
+    """
+    def __init__(self, frame_shape, dtype="uint8", slots=8):
+        """
+        Allocate the shared memory backing the ring.
+
+        :Parameters:
+            :param tuple of ints frame_shape: shape of every frame written to the ring, e.g. (height, width, depth).
+            :param dtype: numpy dtype of every frame written to the ring.
+            :param int slots: number of frames which may be in flight before the oldest is overwritten.
+        :rtype: None
+        :return: None
+        """
+        import numpy as np
+        if SharedMemory is None:
+            raise RuntimeError("FrameRing requires multiprocessing.shared_memory (Python 3.8+).")
+        assert slots > 0, "A FrameRing needs at least one slot."
+        self.frame_shape = tuple(int(dimension) for dimension in frame_shape)
+        self.dtype = np.dtype(dtype)
+        self.slots = slots
+        self._memory = SharedMemory(create=True, size=self._header_size() + self._frame_size() * slots)
+        self._owner = True
+        self._write_count = 0
+        self._sequences = None
+        self._frames = None
+        self._map_memory()
+
+    def __getstate__(self):
+        """
+        Pickle as a reference to the shared memory rather than a copy of it.
+
+        :rtype: dict
+        :return dict state: attributes needed to attach to the same shared memory in another process.
+        """
+        return {"name": self._memory.name,
+                "frame_shape": self.frame_shape,
+                "dtype": self.dtype.str,
+                "slots": self.slots}
+
+    def __setstate__(self, state):
+        """
+        Attach to the shared memory created by the host process.
+
+        :Parameters:
+            :param dict state: attributes produced by __getstate__.
+        :rtype: None
+        :return: None
+        """
+        import numpy as np
+        self.frame_shape = state["frame_shape"]
+        self.dtype = np.dtype(state["dtype"])
+        self.slots = state["slots"]
+        self._memory = SharedMemory(name=state["name"])
+        self._owner = False
+        self._write_count = 0
+        self._sequences = None
+        self._frames = None
+        self._map_memory()
+
+    def _header_size(self):
+        """
+        Return the number of bytes used by the per-slot sequence numbers.
+
+        :rtype: int
+        :return int: size of the header in bytes.
+        """
+        return 8 * self.slots
+
+    def _frame_size(self):
+        """
+        Return the number of bytes used by a single frame slot.
+
+        :rtype: int
+        :return int: size of one frame in bytes.
+        """
+        import numpy as np
+        return int(np.prod(self.frame_shape, dtype=np.int64)) * self.dtype.itemsize
+
+    def _map_memory(self):
+        """
+        Create the numpy views over the header and frame slots.
+
+        :rtype: None
+        :return: None
+        """
+        import numpy as np
+        buffer = self._memory.buf
+        self._sequences = np.ndarray((self.slots,), dtype=np.int64, buffer=buffer)
+        self._frames = np.ndarray((self.slots,) + self.frame_shape, dtype=self.dtype, buffer=buffer,
+                                  offset=self._header_size())
+
+    def fits(self, frame):
+        """
+        Determine if a frame can be written to this ring.
+
+        :Parameters:
+            :param numpy.array frame: the frame to be checked.
+        :rtype: bool
+        :return bool: True if the frame's shape and dtype match this ring.
+        """
+        return frame.shape == self.frame_shape and frame.dtype == self.dtype
+
+    def write(self, frame):
+        """
+        Copy a frame into the next slot. Only one process should write to a given ring.
+
+        :Parameters:
+            :param numpy.array frame: the frame to be shared.
+        :rtype: RingToken or None
+        :return RingToken or None token: reference to the written frame, or None if the frame does not fit the ring.
+        """
+        if not self.fits(frame):
+            return None
+        self._write_count += 1
+        slot = self._write_count % self.slots
+        self._sequences[slot] = -self._write_count
+        self._frames[slot] = frame
+        self._sequences[slot] = self._write_count
+        return RingToken(slot, self._write_count)
+
+    def read(self, token):
+        """
+        Copy the frame referenced by a token out of the ring.
+
+        :Parameters:
+            :param RingToken token: reference produced by write.
+        :rtype: numpy.array or None
+        :return numpy.array or None frame: a private copy of the frame, or None if its slot was overwritten.
+        """
+        slot, sequence = token
+        if self._sequences[slot] != sequence:
+            return None
+        frame = self._frames[slot].copy()
+        if self._sequences[slot] != sequence:
+            return None
+        return frame
+
+    def close(self):
+        """
+        Detach this process from the shared memory.
+
+        :rtype: None
+        :return: None
+        """
+        self._sequences = None
+        self._frames = None
+        self._memory.close()
+
+    def unlink(self):
+        """
+        Detach from and destroy the shared memory. Call once, from the process which created the ring.
+
+        :rtype: None
+        :return: None
+        """
+        self.close()
+        if self._owner:
+            self._memory.unlink()
+
+
+def read_ring_message(frame_ring, msg):
+    """
+    Replace a ring token, bare or inside a TimedMessage, with its frame.
+
+    :Parameters:
+        :param FrameRing frame_ring: the ring the token refers to.
+        :param msg: a message from the process.
+    :rtype: object
+    :return: msg with its token replaced by the frame, msg unchanged if it holds no token, or None if the frame was
+        overwritten before it could be read.
+    """
+    if msg.__class__ is RingToken:
+        return frame_ring.read(msg)
+    if msg.__class__ is TimedMessage and msg.payload.__class__ is RingToken:
+        frame = frame_ring.read(msg.payload)
+        return None if frame is None else msg._replace(payload=frame)
+    return msg
+
+
+class EncodedFrame(namedtuple("EncodedFrame", ("encoding", "data", "encode_seconds"))):
+    """A frame compressed by FrameCodec.encode, with the encoding used and the seconds spent encoding it."""
+    __slots__ = ()
+
+    @property
+    def nbytes(self):
+        """
+        Return the size of the encoded data, so byte-budgeted queues weigh the frame by what is actually sent.
+
+        :rtype: int
+        :return int: the encoded size in bytes.
+        """
+        return self.data.nbytes
+
+
+class FrameCodec(object):
+    """
+    Compresses frames with cv2.imencode in the asynchronous process and restores them with cv2.imdecode in the host.
+
+    Give the codec to a host, which passes it to process_target as the frame_codec keyword and decodes each
+    EncodedFrame before message_callback. Encoded frames cost far fewer pipe bytes than raw arrays, in exchange for CPU
+    time on both sides; the host's codec totals both, as every EncodedFrame carries its own encoding time. cv2 is only
+    imported once a frame is encoded or decoded.
+    """
+    def __init__(self, encoding=FRAME_JPEG, quality=None):
+        """
+        Set the encoding and its quality.
+
+        :Parameters:
+            :param str encoding: one of constants.FRAME_RAW, constants.FRAME_JPEG, constants.FRAME_PNG or
+                constants.FRAME_WEBP. FRAME_RAW leaves frames unencoded.
+            :param int or None quality: 0 - 100 for JPEG and WebP, or the 0 - 9 compression level for PNG. None uses the
+                OpenCV default.
+        :rtype: None
+        :return: None
+        """
+        assert encoding in (FRAME_RAW, FRAME_JPEG, FRAME_PNG, FRAME_WEBP), "Unknown frame encoding {}.".format(encoding)
+        self.encoding = encoding
+        self.quality = quality
+        self.encode_seconds = 0.0
+        self.frames_decoded = 0
+        self.decode_seconds = 0.0
+        self.encoded_bytes = 0
+        self.decoded_bytes = 0
+        self._params = None
+
+    def __getstate__(self):
+        """
+        Pickle the settings without the totals, which belong to the process that counted them.
+
+        :rtype: tuple
+        :return tuple state: encoding and quality.
+        """
+        return self.encoding, self.quality
+
+    def __setstate__(self, state):
+        """
+        Restore the settings in another process with fresh totals.
+
+        :Parameters:
+            :param tuple state: attributes produced by __getstate__.
+        :rtype: None
+        :return: None
+        """
+        self.__init__(*state)
+
+    def _encode_params(self, cv2):
+        """
+        Build the cv2.imencode parameters for self.encoding and self.quality.
+
+        :Parameters:
+            :param module cv2: the imported OpenCV module.
+        :rtype: list
+        :return list: flag / value pairs for cv2.imencode.
+        """
+        if self.quality is None:
+            return []
+        flag = {FRAME_JPEG: cv2.IMWRITE_JPEG_QUALITY,
+                FRAME_PNG: cv2.IMWRITE_PNG_COMPRESSION,
+                FRAME_WEBP: cv2.IMWRITE_WEBP_QUALITY}[self.encoding]
+        return [flag, int(self.quality)]
+
+    def encode(self, frame):
+        """
+        Compress a frame. Called in the asynchronous process.
+
+        :Parameters:
+            :param numpy.array frame: the frame to be compressed.
+        :rtype: EncodedFrame or None
+        :return EncodedFrame or None: the compressed frame, or None if the frame should be sent as it is.
+        :raises ValueError: if OpenCV cannot encode the frame.
+        """
+        if self.encoding == FRAME_RAW:
+            return None
+        import cv2
+        if self._params is None:
+            self._params = self._encode_params(cv2)
+        started = monotonic()
+        success, data = cv2.imencode(self.encoding, frame, self._params)
+        elapsed = monotonic() - started
+        if not success:
+            raise ValueError("Could not encode frame as {}.".format(self.encoding))
+        return EncodedFrame(self.encoding, data, elapsed)
+
+    def decode(self, encoded):
+        """
+        Restore a compressed frame, adding the encoding time it reports to this codec's totals. Called in the host.
+
+        :Parameters:
+            :param EncodedFrame encoded: frame produced by encode.
+        :rtype: numpy.array
+        :return numpy.array frame: the restored frame.
+        :raises ValueError: if OpenCV cannot decode the frame.
+        """
+        import cv2
+        started = monotonic()
+        frame = cv2.imdecode(encoded.data, cv2.IMREAD_UNCHANGED)
+        elapsed = monotonic() - started
+        if frame is None:
+            raise ValueError("Could not decode {} frame.".format(encoded.encoding))
+        self.encode_seconds += encoded.encode_seconds
+        self.frames_decoded += 1
+        self.decode_seconds += elapsed
+        self.encoded_bytes += encoded.data.nbytes
+        self.decoded_bytes += frame.nbytes
+        return frame
+
+    @property
+    def mean_encode_seconds(self):
+        """
+        Return the average seconds the asynchronous process spent encoding each decoded frame.
+
+        :rtype: float
+        :return float: the average, or 0.0 before any frame is decoded.
+        """
+        return self.encode_seconds / self.frames_decoded if self.frames_decoded else 0.0
+
+    @property
+    def mean_decode_seconds(self):
+        """
+        Return the average seconds spent decoding each frame.
+
+        :rtype: float
+        :return float: the average, or 0.0 before any frame is decoded.
+        """
+        return self.decode_seconds / self.frames_decoded if self.frames_decoded else 0.0
+
+    @property
+    def compression_ratio(self):
+        """
+        Return how many times smaller the decoded frames were when sent.
+
+        :rtype: float
+        :return float: decoded bytes over encoded bytes, or 0.0 before any frame is decoded.
+        """
+        return self.decoded_bytes / self.encoded_bytes if self.encoded_bytes else 0.0
+
+
+class WakeupPipe(object):
+    """
+    Self-pipe which makes pending in-process messages visible to an event loop as a readable file descriptor.
+
+    The producing thread calls notify after queueing a message; the event loop watches fileno and calls clear before
+    draining its queue. Writes are coalesced, so a burst of messages costs a single byte and a single wakeup.
+    """
+    def __init__(self):
+        """
+        Open the non-blocking pipe.
+
+        :rtype: None
+        :return: None
+        """
+        self._read_fd, self._write_fd = os.pipe()
+        os.set_blocking(self._read_fd, False)
+        os.set_blocking(self._write_fd, False)
+        self._pending = False
+
+    def fileno(self):
+        """
+        Return the file descriptor which becomes readable after notify.
+
+        :rtype: int
+        :return int: the read end of the pipe.
+        """
+        return self._read_fd
+
+    def notify(self):
+        """
+        Wake the event loop watching this pipe if it has not already been woken.
+
+        :rtype: None
+        :return: None
+        """
+        if not self._pending:
+            self._pending = True
+            try:
+                os.write(self._write_fd, b"\0")
+            except BlockingIOError:  # Already full of wakeups.
+                pass
+
+    def clear(self):
+        """
+        Consume pending wakeups. Call before draining the queue this pipe signals for.
+
+        :rtype: None
+        :return: None
+        """
+        try:
+            while os.read(self._read_fd, 512):
+                pass
+        except BlockingIOError:
+            pass
+        self._pending = False  # Reset only after reading, so a concurrent notify is never lost.
+
+    def close(self):
+        """
+        Close both ends of the pipe.
+
+        :rtype: None
+        :return: None
+        """
+        os.close(self._read_fd)
+        os.close(self._write_fd)
+
+
+class Mailbox(object):
+    """
+    Conflating single-producer, single-consumer channel which only ever delivers the newest message.
+
+    Each put overwrites one slot in shared memory, so the consumer always takes the newest message at the moment it
+    asks for one, however long it has been since its last get, and superseded messages never cross a pipe. Signals
+    (str messages) are never overwritten - they are sent through a pipe, and are delivered after the newest message
+    in the slot, so the last message before an end signal is still delivered. The same pipe carries one empty
+    notification per fresh message, so that the consumer can watch it for readability.
+
+    The slot grows to fit the largest message put so far. Its shared memory is unlinked when the Mailbox is garbage
+    collected in, or at the exit of, the process which created it. Needs multiprocessing.shared_memory (Python 3.8+).
+
+    Implements the parts of the multiprocessing.Queue interface used by ProcessHost and SingleProcessHandler.
+    """
+    _SEQUENCE, _LENGTH, _GENERATION, _CAPACITY, _NOTIFIED = range(5)  # Indexes into the shared header.
+
+    def __init__(self, *, ctx=None):
+        """
+        Create the pipe, lock and shared header. The slot itself is created by the first put.
+
+        :Parameters:
+            :param ctx: multiprocessing context used to create the pipe, lock and header.
+        :rtype: None
+        :return: None
+        """
+        if SharedMemory is None:
+            raise RuntimeError("Mailbox requires multiprocessing.shared_memory (Python 3.8+).")
+        ctx = get_context() if ctx is None else ctx
+        self._reader, self._writer = ctx.Pipe(duplex=False)
+        self._lock = ctx.Lock()
+        self._header = ctx.RawArray("q", 5)
+        self._name_prefix = "shole_{}".format(os.urandom(6).hex())
+        self._finalizer = Finalize(self, _unlink_slot, args=(self._name_prefix, self._header), exitpriority=0)
+        resource_tracker.ensure_running()  # Shared with the producer, which creates the slots this process unlinks.
+        self._attach_state()
+
+    def __getstate__(self):
+        """
+        Pickle the shared pipe, lock and header without any process-local state.
+
+        :rtype: tuple
+        :return tuple state: pipe ends, lock, header and slot name prefix.
+        """
+        return self._reader, self._writer, self._lock, self._header, self._name_prefix
+
+    def __setstate__(self, state):
+        """
+        Restore the shared pipe, lock and header in another process.
+
+        :Parameters:
+            :param tuple state: attributes produced by __getstate__.
+        :rtype: None
+        :return: None
+        """
+        self._reader, self._writer, self._lock, self._header, self._name_prefix = state
+        self._finalizer = None
+        self._attach_state()
+
+    def _attach_state(self):
+        """
+        Reset the process-local state: this process's mapping of the slot and the consumer's bookkeeping.
+
+        :rtype: None
+        :return: None
+        """
+        self._memory = None
+        self._memory_generation = 0
+        self._taken = 0  # Sequence number of the newest message taken by the consumer.
+        self._signals = deque()  # Pickled signals read from the pipe but not yet taken.
+
+    def _map_slot(self):
+        """
+        Map the current slot into this process if it was replaced since it was last mapped. Call with self._lock held.
+
+        :rtype: memoryview or None
+        :return memoryview or None: the slot's buffer, or None if no slot has been created yet.
+        """
+        generation = self._header[self._GENERATION]
+        if generation != self._memory_generation:
+            if self._memory is not None:
+                self._memory.close()
+            self._memory = SharedMemory(name=_slot_name(self._name_prefix, generation))
+            self._memory_generation = generation
+        return None if self._memory is None else self._memory.buf
+
+    def _grow_slot(self, size):
+        """
+        Replace the slot with one large enough for size bytes. Call with self._lock held, from the producer.
+
+        :Parameters:
+            :param int size: bytes the slot must hold.
+        :rtype: None
+        :return: None
+        """
+        header = self._header
+        capacity = max(size, 2 * header[self._CAPACITY])
+        generation = header[self._GENERATION] + 1
+        memory = SharedMemory(name=_slot_name(self._name_prefix, generation), create=True, size=capacity)
+        if self._memory is not None:
+            self._memory.close()
+            self._memory.unlink()  # Consumers still mapping it keep their mapping until they move to the new slot.
+        self._memory = memory
+        self._memory_generation = generation
+        header[self._GENERATION] = generation
+        header[self._CAPACITY] = capacity
+
+    def put(self, obj, block=True, timeout=None):
+        """
+        Overwrite the slot with a message, or send a signal. Never waits for the consumer.
+
+        :Parameters:
+            :param obj: pickle-able message for the consumer.
+            :param bool block: unused - accepted for multiprocessing.Queue compatibility.
+            :param float timeout: unused - accepted for multiprocessing.Queue compatibility.
+        :rtype: None
+        :return: None
+        """
+        data = ForkingPickler.dumps(obj)
+        if isinstance(obj, str):
+            self._writer.send_bytes(data)
+            return
+        header = self._header
+        with self._lock:
+            if len(data) > header[self._CAPACITY]:
+                self._grow_slot(len(data))
+            self._map_slot()[:len(data)] = data
+            header[self._LENGTH] = len(data)
+            header[self._SEQUENCE] += 1
+            notify = not header[self._NOTIFIED]
+            header[self._NOTIFIED] = 1
+        if notify:
+            self._writer.send_bytes(b"")
+
+    def _take(self, deserialize=True):
+        """
+        Take the newest message if it has not been taken yet, otherwise the oldest signal. Call with self._lock held.
+
+        :Parameters:
+            :param bool deserialize: determines if the message is unpickled, instead of returned as bytes.
+        :rtype: tuple of bool, object
+        :returns:
+            :return bool taken: whether there was anything to take.
+            :return obj: the message, or its pickle if deserialize is False.
+        """
+        while self._reader.poll():
+            data = self._reader.recv_bytes()
+            if data:  # Otherwise a notification.
+                self._signals.append(data)
+        header = self._header
+        if header[self._SEQUENCE] != self._taken:
+            self._taken = header[self._SEQUENCE]
+            header[self._NOTIFIED] = 0
+            data = bytes(self._map_slot()[:header[self._LENGTH]])
+        elif self._signals:
+            data = self._signals.popleft()
+        else:
+            return False, None
+        return True, ForkingPickler.loads(data) if deserialize else data
+
+    def get(self, block=True, timeout=None):
+        """
+        Take the newest message, or the oldest signal once the newest message has been taken.
+
+        :Parameters:
+            :param bool block: determines if this waits for a message.
+            :param float or None timeout: most seconds to wait if block is True, or None to wait indefinitely.
+        :rtype: object
+        :return obj: the newest message sent by the producer.
+        :raises queue.Empty: if no message arrived in time.
+        """
+        deadline = None if timeout is None else monotonic() + timeout
+        while True:
+            with self._lock:
+                taken, obj = self._take()
+            if taken:
+                return obj
+            if not block:
+                raise EmptyQueue
+            if not self._reader.poll(None if deadline is None else max(deadline - monotonic(), 0)):
+                raise EmptyQueue
+
+    def get_nowait(self):
+        """
+        Take the newest message without waiting.
+
+        :rtype: object
+        :return obj: the newest message sent by the producer.
+        :raises queue.Empty: if no message is waiting.
+        """
+        return self.get(False)
+
+    def empty(self):
+        """
+        Determine if nothing is waiting.
+
+        :rtype: bool
+        :return bool: True if get_nowait would raise queue.Empty.
+        """
+        return not self._signals and self._header[self._SEQUENCE] == self._taken and not self._reader.poll()
+
+    def read_is_signal(self, signal):
+        """
+        Take the next message, and determine if it is signal, without unpickling it.
+
+        :Parameters:
+            :param str signal: the signal to be recognised.
+        :rtype: bool
+        :return bool: True if the message was signal.
+        """
+        with self._lock:
+            _, data = self._take(deserialize=False)
+        return data == bytes(ForkingPickler.dumps(signal))
+
+    def discard_pending(self):
+        """
+        Discard the newest message and every waiting signal without unpickling them.
+
+        :rtype: None
+        :return: None
+        """
+        with self._lock:
+            while self._take(deserialize=False)[0]:
+                pass
+
+    def close(self):
+        """
+        Close this process's ends of the pipe and its mapping of the slot.
+
+        :rtype: None
+        :return: None
+        """
+        self._reader.close()
+        self._writer.close()
+        if self._memory is not None:
+            self._memory.close()
+            self._memory = None
+
+
+def _slot_name(name_prefix, generation):
+    """
+    Name the shared memory of one generation of a Mailbox slot.
+
+    :Parameters:
+        :param str name_prefix: the Mailbox's unique prefix.
+        :param int generation: the slot's generation, counting from 1.
+    :rtype: str
+    :return str: the shared memory name.
+    """
+    return "{}_{}".format(name_prefix, generation)
+
+
+def _unlink_slot(name_prefix, header):
+    """
+    Unlink the current shared memory slot of a Mailbox, if one was created.
+
+    :Parameters:
+        :param str name_prefix: the Mailbox's unique prefix.
+        :param multiprocessing.sharedctypes.RawArray header: the Mailbox's shared header.
+    :rtype: None
+    :return: None
+    """
+    generation = header[Mailbox._GENERATION]
+    if not generation:
+        return
+    try:
+        memory = SharedMemory(name=_slot_name(name_prefix, generation))
+    except FileNotFoundError:
+        return
+    memory.close()
+    memory.unlink()
+
+
+def discard_pickled(queue):
+    """
+    Discard every message waiting in a multiprocessing.Queue's pipe without unpickling it.
+
+    :Parameters:
+        :param multiprocessing.Queue queue: the queue to be drained.
+    :rtype: int
+    :return int discarded: the number of messages discarded.
+    """
+    discarded = 0
+    with queue._rlock:
+        while queue._reader.poll():
+            queue._reader.recv_bytes()
+            discarded += 1
+    return discarded
+
+
+def read_is_signal(queue, signal):
+    """
+    Read the next message waiting in a queue's pipe, and determine if it is signal, without unpickling it - a message
+    is only ever equal to signal if it was pickled to the same bytes.
+
+    :Parameters:
+        :param multiprocessing.Queue queue: the queue to be read, which must have a message waiting.
+        :param str signal: the signal to be recognised.
+    :rtype: bool
+    :return bool: True if the message was signal.
+    """
+    if hasattr(queue, "read_is_signal"):
+        return queue.read_is_signal(signal)
+    pickled = bytes(ForkingPickler.dumps(signal))
+    with queue._rlock:
+        return queue._reader.recv_bytes() == pickled
+
+
+def payload_size(msg):
+    """
+    Estimate the number of bytes a message occupies, for byte-budgeted queues.
+
+    :Parameters:
+        :param msg: the message to be measured.
+    :rtype: int
+    :return int: the message's buffer size if it has one, otherwise its shallow object size.
+    """
+    nbytes = getattr(msg, "nbytes", None)
+    if nbytes is not None:
+        return int(nbytes)
+    if isinstance(msg, (bytes, bytearray, str)):
+        return len(msg)
+    return sys.getsizeof(msg)
+
+
+class BoundedQueue(Queue):
+    """
+    queue.Queue bounded by item count and/or total payload bytes, with a policy for puts made while it is full.
+
+    Signals (str messages) are never dropped or blocked and do not count against the bounds. With DROP_OLDEST, the
+    oldest non-signal message is discarded to make room.
+    """
+    def __init__(self, max_items=0, max_bytes=0, policy=BLOCK):
+        """
+        Set the bounds and overflow policy.
+
+        :Parameters:
+            :param int max_items: most non-signal messages held at once, or 0 for no count bound.
+            :param int max_bytes: most payload bytes held at once, or 0 for no byte bound. A single message larger
+                than max_bytes is still admitted into an otherwise empty queue.
+            :param str policy: one of constants.BLOCK, constants.DROP_NEWEST or constants.DROP_OLDEST.
+        :rtype: None
+        :return: None
+        """
+        assert policy in (BLOCK, DROP_NEWEST, DROP_OLDEST), "Unknown queue policy {}.".format(policy)
+        self.max_items = max_items
+        self.max_bytes = max_bytes
+        self.policy = policy
+        self.dropped = 0
+        self._items = 0
+        self._bytes = 0
+        Queue.__init__(self)
+
+    def _init(self, maxsize):
+        """Hold (weight, item) entries, where weight is None for signals. Called by queue.Queue.__init__."""
+        self.queue = deque()
+
+    def _qsize(self):
+        """Return the number of queued entries, signals included."""
+        return len(self.queue)
+
+    def _put(self, entry):
+        """Append a (weight, item) entry."""
+        self.queue.append(entry)
+
+    def _get(self):
+        """Pop the oldest entry, release its share of the bounds and return its item."""
+        weight, item = self.queue.popleft()
+        if weight is not None:
+            self._items -= 1
+            self._bytes -= weight
+        return item
+
+    def _is_over(self, size):
+        """
+        Determine if admitting a message of the given size would exceed the bounds. Call with self.mutex held.
+
+        :Parameters:
+            :param int size: payload size of the message to be admitted.
+        :rtype: bool
+        :return bool: True if the message does not fit.
+        """
+        if self.max_items and self._items >= self.max_items:
+            return True
+        return bool(self.max_bytes and self._items and self._bytes + size > self.max_bytes)
+
+    def _drop_oldest(self):
+        """
+        Discard the oldest non-signal message. Call with self.mutex held.
+
+        :rtype: bool
+        :return bool: True if a message was discarded.
+        """
+        for index, (weight, _) in enumerate(self.queue):
+            if weight is not None:
+                del self.queue[index]
+                self._items -= 1
+                self._bytes -= weight
+                self.dropped += 1
+                self.unfinished_tasks -= 1
+                if not self.unfinished_tasks:
+                    self.all_tasks_done.notify_all()
+                return True
+        return False
+
+    def put(self, item, block=True, timeout=None):
+        """
+        Put an item into the queue, applying the overflow policy if it is full.
+
+        :Parameters:
+            :param item: the message to be queued.
+            :param bool block: determines if a BLOCK policy put waits for space.
+            :param float or None timeout: most seconds a BLOCK policy put waits, or None to wait indefinitely.
+        :rtype: None
+        :return: None
+        :raises queue.Full: if a BLOCK policy put could not find space in time.
+        """
+        with self.not_full:
+            if isinstance(item, str):
+                weight = None
+            else:
+                weight = payload_size(item)
+                deadline = None if timeout is None else monotonic() + timeout
+                while self._is_over(weight):
+                    if self.policy == DROP_NEWEST:
+                        self.dropped += 1
+                        return
+                    if self.policy == DROP_OLDEST:
+                        self._drop_oldest()
+                        continue
+                    if not block:
+                        raise FullQueue
+                    if deadline is None:
+                        self.not_full.wait()
+                    else:
+                        remaining = deadline - monotonic()
+                        if remaining <= 0:
+                            raise FullQueue
+                        self.not_full.wait(remaining)
+                self._items += 1
+                self._bytes += weight
+            self._put((weight, item))
+            self.unfinished_tasks += 1
+            self.not_empty.notify()
+
+
+class BoundedMultiQueue(_BaseMultiQueue):
+    """
+    multiprocessing.Queue bounded by item count and/or total payload bytes, with a policy for puts made while it is
+    full. Usage and drop counts are shared between every process using the queue.
+
+    Signals (str messages) are never dropped or blocked and do not count against the bounds. With DROP_OLDEST, the
+    putting process takes the oldest message off the queue itself to make room; signals taken this way are re-queued.
+    """
+    def __init__(self, max_items=0, max_bytes=0, policy=BLOCK, *, ctx=None):
+        """
+        Set the bounds and overflow policy.
+
+        :Parameters:
+            :param int max_items: most non-signal messages held at once, or 0 for no count bound.
+            :param int max_bytes: most payload bytes held at once, or 0 for no byte bound. A single message larger
+                than max_bytes is still admitted into an otherwise empty queue.
+            :param str policy: one of constants.BLOCK, constants.DROP_NEWEST or constants.DROP_OLDEST.
+            :param ctx: multiprocessing context used to create the queue and its shared counters.
+        :rtype: None
+        :return: None
+        """
+        assert policy in (BLOCK, DROP_NEWEST, DROP_OLDEST), "Unknown queue policy {}.".format(policy)
+        ctx = get_context() if ctx is None else ctx
+        _BaseMultiQueue.__init__(self, 0, ctx=ctx)
+        self._bounds = (max_items, max_bytes, policy)
+        self._usage = ctx.Array("q", 3)  # Items, bytes, dropped.
+        self._space = ctx.Condition(self._usage.get_lock())
+
+    def __getstate__(self):
+        """Pickle the shared bounds and counters along with the underlying queue."""
+        return _BaseMultiQueue.__getstate__(self), self._bounds, self._usage, self._space
+
+    def __setstate__(self, state):
+        """Restore the shared bounds and counters along with the underlying queue."""
+        base_state, self._bounds, self._usage, self._space = state
+        _BaseMultiQueue.__setstate__(self, base_state)
+
+    @property
+    def dropped(self):
+        """
+        Return the number of messages discarded by the overflow policy, across every process.
+
+        :rtype: int
+        :return int: the drop count.
+        """
+        return self._usage[2]
+
+    def discard_pending(self):
+        """
+        Discard every message waiting in the pipe without unpickling it, releasing the whole of the bounds.
+
+        :rtype: None
+        :return: None
+        """
+        discard_pickled(self)
+        with self._space:
+            self._usage[0] = 0
+            self._usage[1] = 0
+            self._space.notify_all()
+
+    def read_is_signal(self, signal):
+        """
+        Read the next message waiting in the pipe, and determine if it is signal, without unpickling it. A discarded
+        message keeps its share of the bounds until discard_pending, as its weight is unknown.
+
+        :Parameters:
+            :param str signal: the signal to be recognised.
+        :rtype: bool
+        :return bool: True if the message was signal.
+        """
+        pickled = bytes(ForkingPickler.dumps((None, signal)))
+        with self._rlock:
+            return self._reader.recv_bytes() == pickled
+
+    def _is_over(self, size):
+        """
+        Determine if admitting a message of the given size would exceed the bounds. Call with self._space held.
+
+        :Parameters:
+            :param int size: payload size of the message to be admitted.
+        :rtype: bool
+        :return bool: True if the message does not fit.
+        """
+        max_items, max_bytes, _ = self._bounds
+        items, used_bytes = self._usage[0], self._usage[1]
+        if max_items and items >= max_items:
+            return True
+        return bool(max_bytes and items and used_bytes + size > max_bytes)
+
+    def _drop_oldest(self):
+        """
+        Take the oldest message off the queue and discard it, re-queueing it instead if it is a signal.
+
+        :rtype: None
+        :return: None
+        """
+        try:
+            weight, item = _BaseMultiQueue.get(self, timeout=0.1)
+        except EmptyQueue:  # Counted messages are still in another process's feeder buffer.
+            return
+        if weight is None:
+            _BaseMultiQueue.put(self, (weight, item))
+            return
+        with self._space:
+            self._usage[0] -= 1
+            self._usage[1] -= weight
+            self._usage[2] += 1
+
+    def put(self, obj, block=True, timeout=None):
+        """
+        Put an item into the queue, applying the overflow policy if it is full.
+
+        :Parameters:
+            :param obj: the pickle-able message to be queued.
+            :param bool block: determines if a BLOCK policy put waits for space.
+            :param float or None timeout: most seconds a BLOCK policy put waits, or None to wait indefinitely.
+        :rtype: None
+        :return: None
+        :raises queue.Full: if a BLOCK policy put could not find space in time.
+        """
+        if isinstance(obj, str):
+            _BaseMultiQueue.put(self, (None, obj))
+            return
+        weight = payload_size(obj)
+        policy = self._bounds[2]
+        deadline = None if timeout is None else monotonic() + timeout
+        while True:
+            with self._space:
+                if not self._is_over(weight):
+                    self._usage[0] += 1
+                    self._usage[1] += weight
+                    break
+                if policy == DROP_NEWEST:
+                    self._usage[2] += 1
+                    return
+                if policy == BLOCK:
+                    if not block:
+                        raise FullQueue
+                    remaining = None if deadline is None else deadline - monotonic()
+                    if remaining is not None and remaining <= 0:
+                        raise FullQueue
+                    self._space.wait(remaining)
+                    continue
+            self._drop_oldest()
+        _BaseMultiQueue.put(self, (weight, obj))
+
+    def get(self, block=True, timeout=None):
+        """
+        Remove and return an item from the queue, releasing its share of the bounds.
+
+        :Parameters:
+            :param bool block: determines if this waits for a message.
+            :param float or None timeout: most seconds to wait if block is True, or None to wait indefinitely.
+        :rtype: object
+        :return obj: the oldest queued message.
+        :raises queue.Empty: if no message arrived in time.
+        """
+        weight, obj = _BaseMultiQueue.get(self, block, timeout)
+        if weight is not None:
+            with self._space:  # Floored, as discard_pending may have released this message already.
+                self._usage[0] = max(self._usage[0] - 1, 0)
+                self._usage[1] = max(self._usage[1] - weight, 0)
+                self._space.notify_all()
+        return obj
+
+
+class PickleSerializer(object):
+    """
+    Serializes each message in-band as a single pickle, exactly as multiprocessing.Queue does.
+
+    Serializers turn a message into a list of frames and back, and send / receive those frames over a
+    multiprocessing.connection.Connection. They are passed to asynchronous processes, so must be pickle-able.
+    """
+    def dumps(self, obj):
+        """
+        Serialize a message.
+
+        :Parameters:
+            :param obj: pickle-able message.
+        :rtype: list
+        :return list frames: bytes-like frames which loads turns back into obj.
+        """
+        return [ForkingPickler.dumps(obj)]
+
+    def loads(self, frames):
+        """
+        Deserialize a message.
+
+        :Parameters:
+            :param list frames: frames produced by dumps.
+        :rtype: object
+        :return obj: the message.
+        """
+        return ForkingPickler.loads(frames[0])
+
+    def send(self, connection, obj):
+        """
+        Serialize a message and write it to a connection.
+
+        :Parameters:
+            :param multiprocessing.connection.Connection connection: the writable end of a pipe.
+            :param obj: pickle-able message.
+        :rtype: None
+        :return: None
+        """
+        for frame in self.dumps(obj):
+            connection.send_bytes(frame)
+
+    def recv(self, connection):
+        """
+        Read a message from a connection and deserialize it.
+
+        :Parameters:
+            :param multiprocessing.connection.Connection connection: the readable end of a pipe.
+        :rtype: object
+        :return obj: the message.
+        """
+        return ForkingPickler.loads(connection.recv_bytes())
+
+    def discard(self, connection):
+        """
+        Read a message from a connection without deserializing it.
+
+        :Parameters:
+            :param multiprocessing.connection.Connection connection: the readable end of a pipe.
+        :rtype: None
+        :return: None
+        """
+        connection.recv_bytes()
+
+    def read_matches(self, connection, frames):
+        """
+        Read a message from a connection without deserializing it, and determine if it was serialized as frames.
+
+        :Parameters:
+            :param multiprocessing.connection.Connection connection: the readable end of a pipe.
+            :param list frames: frames produced by dumps.
+        :rtype: bool
+        :return bool: True if the message's frames were the same.
+        """
+        return connection.recv_bytes() == bytes(frames[0])
+
+
+class OutOfBandSerializer(PickleSerializer):
+    """
+    Serializes messages with pickle protocol 5, sending large buffers (such as numpy array data) out-of-band.
+
+    A message is sent as a header frame - buffer sizes followed by the pickle, without the large buffers - and then
+    one frame per buffer, written straight from the object's memory. The receiver reads each frame with
+    recv_bytes_into into a buffer of its final size, and the unpickled arrays then use those buffers as they are, so
+    array data is never copied into or out of a pickle.
+
+    Receive buffers are pooled by size. The unpickled message owns its buffers for as long as anything references
+    them - an array kept from a message is never overwritten - and a buffer is only received into again once every
+    object using it has been released, so steady same-size frames reuse the same few buffers instead of allocating.
+    """
+    _count = struct.Struct("!I")
+
+    def __init__(self, min_out_of_band_bytes=65536, *, pooled_buffers=4, pooled_sizes=4):
+        """
+        Set the size above which buffers are sent out-of-band.
+
+        :Parameters:
+            :param int min_out_of_band_bytes: smallest buffer sent in its own frame. Smaller buffers stay in the pickle,
+                where they cost less than the extra frame.
+            :param int pooled_buffers: most receive buffers kept for each size.
+            :param int pooled_sizes: most buffer sizes kept, the least recently received size being dropped first.
+        :rtype: None
+        :return: None
+        """
+        if pickle.HIGHEST_PROTOCOL < 5:
+            raise RuntimeError("OutOfBandSerializer requires pickle protocol 5 (Python 3.8+).")
+        self.min_out_of_band_bytes = min_out_of_band_bytes
+        self.pooled_buffers = pooled_buffers
+        self.pooled_sizes = pooled_sizes
+        self._pool = {}  # Buffer size: buffers, in order of last use.
+        self._pool_lock = Lock()
+
+    def __getstate__(self):
+        """
+        Leave the receive buffers and their lock behind when the serializer is sent to another process.
+
+        :rtype: dict
+        :return dict: the picklable attributes.
+        """
+        state = dict(self.__dict__)
+        state["_pool"] = {}
+        del state["_pool_lock"]
+        return state
+
+    def __setstate__(self, state):
+        """
+        Restore the attributes, with an empty receive buffer pool.
+
+        :Parameters:
+            :param dict state: attributes from __getstate__.
+        :rtype: None
+        :return: None
+        """
+        self.__dict__.update(state)
+        self._pool_lock = Lock()
+
+    def dumps(self, obj):
+        """
+        Serialize a message.
+
+        :Parameters:
+            :param obj: pickle-able message.
+        :rtype: list
+        :return list frames: the header frame followed by a memoryview of each out-of-band buffer.
+        """
+        buffers = []
+
+        def keep_out_of_band(buffer):
+            raw = buffer.raw()
+            if raw.nbytes < self.min_out_of_band_bytes:
+                return True  # Pickled in-band.
+            buffers.append(raw)
+            return False
+
+        data = pickle.dumps(obj, protocol=5, buffer_callback=keep_out_of_band)
+        sizes = [buffer.nbytes for buffer in buffers]
+        header = self._count.pack(len(sizes)) + struct.pack("!{}Q".format(len(sizes)), *sizes) + data
+        return [header] + buffers
+
+    def loads(self, frames):
+        """
+        Deserialize a message.
+
+        :Parameters:
+            :param list frames: frames produced by dumps.
+        :rtype: object
+        :return obj: the message.
+        """
+        sizes, data = self._read_header(frames[0])
+        return pickle.loads(data, buffers=frames[1:1 + len(sizes)])
+
+    def recv(self, connection):
+        """
+        Read a message from a connection, receiving each out-of-band buffer into its final memory.
+
+        :Parameters:
+            :param multiprocessing.connection.Connection connection: the readable end of a pipe.
+        :rtype: object
+        :return obj: the message.
+        """
+        sizes, data = self._read_header(connection.recv_bytes())
+        buffers = []
+        for size in sizes:
+            buffer = self._receive_buffer(size)
+            connection.recv_bytes_into(buffer)
+            buffers.append(buffer)
+        return pickle.loads(data, buffers=buffers)
+
+    def _receive_buffer(self, size):
+        """
+        Take a pooled buffer of size bytes which nothing else references, or allocate one.
+
+        :Parameters:
+            :param int size: the buffer size.
+        :rtype: bytearray
+        :return bytearray: the buffer, which the caller and the pool then share.
+        """
+        with self._pool_lock:
+            pool = self._pool.pop(size, [])
+            self._pool[size] = pool  # Most recently received size last.
+            for index in range(len(pool)):
+                buffer = pool[index]
+                # Referenced only by the pool, buffer and getrefcount itself - no array still uses its memory.
+                if sys.getrefcount(buffer) <= 3:
+                    pool.append(pool.pop(index))
+                    return buffer
+            buffer = bytearray(size)
+            pool.append(buffer)
+            if len(pool) > self.pooled_buffers:
+                del pool[0]
+            while len(self._pool) > self.pooled_sizes:
+                del self._pool[next(iter(self._pool))]
+            return buffer
+
+    def discard(self, connection):
+        """
+        Read a message from a connection without deserializing it.
+
+        :Parameters:
+            :param multiprocessing.connection.Connection connection: the readable end of a pipe.
+        :rtype: None
+        :return: None
+        """
+        sizes, _ = self._read_header(connection.recv_bytes())
+        for _ in sizes:
+            connection.recv_bytes()
+
+    def read_matches(self, connection, frames):
+        """
+        Read a message from a connection without deserializing it, and determine if it was serialized as frames -
+        only ever true of messages without out-of-band buffers.
+
+        :Parameters:
+            :param multiprocessing.connection.Connection connection: the readable end of a pipe.
+            :param list frames: frames produced by dumps.
+        :rtype: bool
+        :return bool: True if the message's frames were the same.
+        """
+        header = connection.recv_bytes()
+        sizes, _ = self._read_header(header)
+        for _ in sizes:
+            connection.recv_bytes()
+        return len(frames) == 1 and header == bytes(frames[0])
+
+    def _read_header(self, header):
+        """
+        Split a header frame into its buffer sizes and pickle.
+
+        :Parameters:
+            :param bytes header: the first frame of a message.
+        :rtype: tuple
+        :return tuple: (buffer sizes, pickle data).
+        """
+        count = self._count.unpack_from(header)[0]
+        start = self._count.size
+        end = start + 8 * count
+        return struct.unpack("!{}Q".format(count), header[start:end]), memoryview(header)[end:]
+
+
+class SerializedQueue(object):
+    """
+    Multi-producer, multi-consumer queue which writes messages straight to a pipe with a pluggable serializer.
+
+    Unlike multiprocessing.Queue there is no feeder thread or intermediate buffer: put serializes and writes in the
+    calling thread, so it blocks while the pipe is full - back-pressure from a slow consumer rather than unbounded
+    memory growth in the producer.
+
+    Implements the parts of the multiprocessing.Queue interface used by ProcessHost and SingleProcessHandler.
+    """
+    def __init__(self, serializer=None, *, ctx=None):
+        """
+        Create the pipe and the locks keeping each message's frames together.
+
+        :Parameters:
+            :param serializer: PickleSerializer, OutOfBandSerializer or compatible object, defaulting to
+                PickleSerializer.
+            :param ctx: multiprocessing context used to create the pipe and locks.
+        :rtype: None
+        :return: None
+        """
+        ctx = get_context() if ctx is None else ctx
+        self.serializer = serializer if serializer is not None else PickleSerializer()
+        self._reader, self._writer = ctx.Pipe(duplex=False)
+        self._rlock = ctx.Lock()
+        self._wlock = ctx.Lock()
+
+    def put(self, obj, block=True, timeout=None):
+        """
+        Serialize a message and write it to the pipe.
+
+        :Parameters:
+            :param obj: message which the serializer can serialize.
+            :param bool block: unused - accepted for multiprocessing.Queue compatibility.
+            :param float timeout: unused - accepted for multiprocessing.Queue compatibility.
+        :rtype: None
+        :return: None
+        """
+        frames = self.serializer.dumps(obj)
+        with self._wlock:
+            for frame in frames:
+                self._writer.send_bytes(frame)
+
+    def get(self, block=True, timeout=None):
+        """
+        Read the next message from the pipe.
+
+        :Parameters:
+            :param bool block: determines if this waits for a message.
+            :param float or None timeout: most seconds to wait if block is True, or None to wait indefinitely.
+        :rtype: object
+        :return obj: the next message.
+        :raises queue.Empty: if no message arrived in time.
+        """
+        deadline = None if timeout is None else monotonic() + timeout
+        if not self._rlock.acquire(block, timeout):
+            raise EmptyQueue
+        try:
+            if not block:
+                wait = 0
+            elif deadline is None:
+                wait = None
+            else:
+                wait = max(deadline - monotonic(), 0)
+            if not self._reader.poll(wait):
+                raise EmptyQueue
+            return self.serializer.recv(self._reader)
+        finally:
+            self._rlock.release()
+
+    def get_nowait(self):
+        """
+        Read the next message without waiting.
+
+        :rtype: object
+        :return obj: the next message.
+        :raises queue.Empty: if no message is waiting.
+        """
+        return self.get(False)
+
+    def empty(self):
+        """
+        Determine if no message is waiting.
+
+        :rtype: bool
+        :return bool: True if get_nowait would raise queue.Empty.
+        """
+        return not self._reader.poll()
+
+    def discard_pending(self):
+        """
+        Discard every waiting message without deserializing it.
+
+        :rtype: None
+        :return: None
+        """
+        with self._rlock:
+            while self._reader.poll():
+                self.serializer.discard(self._reader)
+
+    def read_is_signal(self, signal):
+        """
+        Read the next message waiting in the pipe, and determine if it is signal, without deserializing it.
+
+        :Parameters:
+            :param str signal: the signal to be recognised.
+        :rtype: bool
+        :return bool: True if the message was signal.
+        """
+        frames = self.serializer.dumps(signal)
+        with self._rlock:
+            return self.serializer.read_matches(self._reader, frames)
+
+    def close(self):
+        """
+        Close this process's ends of the pipe.
+
+        :rtype: None
+        :return: None
+        """
+        self._reader.close()
+        self._writer.close()
@@ -4,3 +4,25 @@ DONE = "DONE"  # Command indicating the process exited after finishing/killing s
 CZEC = "CHECK"  # Command to verify that the subprocess is still running.
 QURY = "QUERY"  # Example command to interact with the subprocess.
 SRCE = "SOURCE"  # Example command to change camera source in a subprocess.
+TK_READABLE = 2  # tkinter.READABLE mask, used to register file handlers on a Tk root without importing tkinter.
+BLOCK = "BLOCK"  # Queue policy: wait for space when a bounded queue is full.
+DROP_NEWEST = "DROP_NEWEST"  # Queue policy: discard the message being put when a bounded queue is full.
+DROP_OLDEST = "DROP_OLDEST"  # Queue policy: discard the oldest queued message when a bounded queue is full.
+ROUND_ROBIN = "ROUND_ROBIN"  # Routing: send each payload to the next worker in turn.
+LEAST_LOADED = "LEAST_LOADED"  # Routing: send each payload to the worker with the fewest unanswered payloads.
+KEYED = "KEYED"  # Routing: send each payload to the worker chosen by the hash of its key.
+CONTROL_KILL = 0  # Control code: end the process early.
+CONTROL_CHECK = 1  # Control code: verify that the process is still running.
+CONTROL_FORWARD = 2  # Control code: pass the signal on to the process.
+CONTROL_FINISHED = 3  # Control code: the process reported finishing directly to the host.
+CONTROL_ENDED = 4  # Control code: the handler ended, and the signal is the one which ended it.
+CONTROL_DATA = 5  # Control code: handle the signal as if it had arrived in the handler's message queue.
+FRAME_RAW = "RAW"  # Frame encoding: send frames as uncompressed arrays.
+FRAME_JPEG = ".jpg"  # Frame encoding: JPEG, via cv2.imencode.
+FRAME_PNG = ".png"  # Frame encoding: lossless PNG, via cv2.imencode.
+FRAME_WEBP = ".webp"  # Frame encoding: WebP, via cv2.imencode.
+PROFILE_ON = "PROFILE ON"  # Command to start profiling the subprocess with cProfile.
+PROFILE_OFF = "PROFILE OFF"  # Command to stop profiling the subprocess and ship its statistics to the host.
+PACE_SLEEP = "SLEEP"  # Frame pacing: sleep a fixed frame_rate after every frame, however long the frame took.
+PACE_DEADLINE = "DEADLINE"  # Frame pacing: sleep until fixed deadlines, skipping deadlines already missed.
+PACE_CAMERA = "CAMERA"  # Frame pacing: let the blocking camera read set the pace, falling back to deadlines.
@@ -1,10 +1,20 @@
 """Examples and tools for asynchronous processes."""
 # USE EXAMPLES & TESTING TO BE COMPLETED.
 
-from time import sleep
+from threading import Condition, Thread
+from time import sleep, monotonic
 import numpy as np
 import cv2
-from constants import KILL, DONE, QURY, SRCE
+try:
+    from .constants import KILL, DONE, QURY, SRCE, PROFILE_ON, PROFILE_OFF, PACE_SLEEP, PACE_CAMERA, PACE_DEADLINE
+    from .channels import TimedMessage
+    from .schedulers import FramePacer
+    from .tracing import Tracer, span
+except ImportError:  # Imported as a top-level module, with the package directory on sys.path.
+    from constants import KILL, DONE, QURY, SRCE, PROFILE_ON, PROFILE_OFF, PACE_SLEEP, PACE_CAMERA, PACE_DEADLINE
+    from channels import TimedMessage
+    from schedulers import FramePacer
+    from tracing import Tracer, span
 
 
 def cam_process(return_queue, command_queue, frame_rate=0.015, cam_width=None, cam_height=None, *,
@@ -12,7 +22,14 @@ def cam_process(return_queue, command_queue, frame_rate=0.015, cam_width=None, c
                 kill_signal=KILL,
                 source_signal=SRCE,
                 command_signal=QURY,
-                set_cam_dimensions=False):
+                set_cam_dimensions=False,
+                frame_ring=None,
+                frame_codec=None,
+                timestamp_messages=False,
+                trace_queue=None,
+                pacing=PACE_DEADLINE,
+                grab_thread=False,
+                change_detector=None):
     """
     Init and start an async camera control process.
 
@@ -27,12 +44,29 @@ def cam_process(return_queue, command_queue, frame_rate=0.015, cam_width=None, c
         :param str source_signal: message to be used to change the camera source.
         :param str command_signal: message to be used to trigger a predetermined process on a camera frame.
         :param bool set_cam_dimensions: determines if camera frame dimensions are set using OpenCV.
+        :param channels.FrameRing frame_ring: shared memory ring used to send frames; only ring tokens are queued.
+        :param channels.FrameCodec frame_codec: codec used to compress frames before they are queued.
+        :param bool timestamp_messages: determines if frames are sent as channels.TimedMessages.
+        :param multiprocessing.Queue trace_queue: queue for tracing.TraceEvents and tracing.ProfileStats; spans are
+            only recorded when it is given.
+        :param str pacing: how frames are paced - constants.PACE_DEADLINE, PACE_CAMERA or PACE_SLEEP.
+        :param bool grab_thread: determines if a FrameGrabber thread keeps the camera's buffer empty, so that only
+            the newest frame is ever sent.
+        :param ChangeDetector change_detector: detector which suppresses frames too similar to the last one sent.
     :rtype: None
     :return: None
     """
     cam = SyncCam(command_queue, return_queue, frame_rate, kill_signal, source_signal, command_signal,
-                  set_cam_dimensions=set_cam_dimensions)
+                  set_cam_dimensions=set_cam_dimensions,
+                  frame_ring=frame_ring,
+                  frame_codec=frame_codec,
+                  timestamp_messages=timestamp_messages,
+                  trace_queue=trace_queue,
+                  pacing=pacing,
+                  grab_thread=grab_thread,
+                  change_detector=change_detector)
     cam.get_feed(cam_width=cam_width, cam_height=cam_height)
+    cam.ship_trace()
     return_queue.put(finished_signal)
 
 
@@ -54,7 +88,14 @@ class SyncCam(object):
 
     def __init__(self, command_queue, return_queue, frame_rate,
                  kill_signal, source_signal, command_signal, *,
-                 set_cam_dimensions=False):
+                 set_cam_dimensions=False,
+                 frame_ring=None,
+                 frame_codec=None,
+                 timestamp_messages=False,
+                 trace_queue=None,
+                 pacing=PACE_DEADLINE,
+                 grab_thread=False,
+                 change_detector=None):
         """
         Set camera control parameters.
 
@@ -66,6 +107,23 @@ class SyncCam(object):
             :param str source_signal: message to be used to change the camera source.
             :param str command_signal: message to be used to trigger a predetermined process on a camera frame.
             :param bool set_cam_dimensions: determines if a camera frame dimensions are set using OpenCV.
+            :param channels.FrameRing frame_ring: shared memory ring used to send frames which fit it.
+            :param channels.FrameCodec frame_codec: codec used to compress frames, in place of frame_ring, unless its
+                encoding is constants.FRAME_RAW.
+            :param bool timestamp_messages: determines if frames are sent as channels.TimedMessages, numbered in
+                capture order and stamped with the time they were queued.
+            :param multiprocessing.Queue trace_queue: queue for tracing.TraceEvents and tracing.ProfileStats. When
+                given, get_feed iterations, camera reads, sent frames and reactions are traced, and the
+                constants.PROFILE_ON / PROFILE_OFF commands profile this process.
+            :param str pacing: how frames are paced. constants.PACE_DEADLINE starts frames on fixed frame_rate
+                deadlines, skipping missed ones; constants.PACE_CAMERA lets the blocking camera read set the pace, and
+                falls back to deadlines while no live frame is read; constants.PACE_SLEEP sleeps frame_rate after each
+                frame.
+            :param bool grab_thread: determines if a FrameGrabber thread grabs every camera frame as it arrives, so
+                the camera's buffer never fills with stale frames. Only the frames which are sent are retrieved, and
+                commands never hold up capture.
+            :param ChangeDetector change_detector: detector consulted before every send; frames it finds unchanged
+                from the last frame sent are not sent, so paused and static feeds cost almost nothing to host.
         :rtype: None
         :return: None
         """
@@ -86,6 +144,17 @@ class SyncCam(object):
         self.kill_signal = kill_signal
         self.command_signal = command_signal
         self.source_signal = source_signal
+        self.frame_ring = frame_ring
+        self.frame_codec = frame_codec
+        self.timestamp_messages = timestamp_messages
+        self.frames_sent = 0
+        self.trace_queue = trace_queue
+        self.tracer = Tracer() if trace_queue is not None else None
+        self.pacing = pacing
+        self.pacer = FramePacer(frame_rate)
+        self.grab_thread = grab_thread
+        self.frame_grabber = None
+        self.change_detector = change_detector
 
     def get_feed(self, cam_width=None, cam_height=None):
         """
@@ -104,29 +173,176 @@ class SyncCam(object):
                 video_capture.set(cv2.CAP_PROP_FRAME_WIDTH, cam_width)
                 video_capture.set(cv2.CAP_PROP_FRAME_HEIGHT, cam_height)
             self.video_capture = video_capture
+        self._start_grabbing()
+        self.pacer.start()
         while True:
-            if not self.command_queue.empty():
-                msg = self.command_queue.get()
-                # print("{} for cam.".format(msg))
-                should_close = self.react(msg)
-                if should_close:
-                    break
-            rval, frame = self.video_capture.read()
-            if self.live_feed:
-                if not rval:
+            with span(self.tracer, "get_feed", "process"):
+                if not self.command_queue.empty():
+                    msg = self.command_queue.get()
+                    # print("{} for cam.".format(msg))
+                    with span(self.tracer, "react", "process", command=str(msg)):
+                        should_close = self.react(msg)
+                    if should_close:
+                        break
+                with span(self.tracer, "read", "process"):
+                    rval, frame = self.read_frame()
+                if self.live_feed:
+                    if not rval:
+                        if self.last_image is None:
+                            self.last_image = self.generate_bad_query_image(cam_width, cam_height,
+                                                                            query_message="WAITING ON CAM")
+
+                            self.send_frame(self.last_image)
+                    else:
+                        self.send_frame(frame)
+                else:
                     if self.last_image is None:
                         self.last_image = self.generate_bad_query_image(cam_width, cam_height,
-                                                                        query_message="WAITING ON CAM")
+                                                                        query_message="NO CAMERA")
+                    self.send_frame(self.last_image)
+            if self.tracer is not None and self.tracer.ship(self.trace_queue):
+                self.tracer.counter("fps", "process", target=self.pacer.target_fps, achieved=self.pacer.achieved_fps)
+            self._pace(rval and self.live_feed)
 
-                        self.return_queue.put(self.last_image)
-                else:
-                    self.return_queue.put(frame)
-            else:
-                if self.last_image is None:
-                    self.last_image = self.generate_bad_query_image(cam_width, cam_height,
-                                                                    query_message="NO CAMERA")
-                self.return_queue.put(self.last_image)
+    def _pace(self, read_live_frame):
+        """
+        Wait for the next frame according to self.pacing.
+
+        :Parameters:
+            :param bool read_live_frame: whether this frame's camera read returned a live frame.
+        :rtype: None
+        :return: None
+        """
+        if self.pacing == PACE_CAMERA and read_live_frame:
+            self.pacer.mark()  # The next read blocks until the camera has a frame.
+        elif self.pacing == PACE_SLEEP:
             sleep(self.frame_rate)
+            self.pacer.mark()
+        else:
+            self.pacer.wait()
+
+    def pacing_report(self):
+        """
+        Return the target frame rate, the frame rate achieved recently, and the frame and skipped frame counts.
+
+        :rtype: schedulers.PacingReport
+        :return schedulers.PacingReport: the current pacing.
+        """
+        return self.pacer.report()
+
+    def read_frame(self):
+        """
+        Read the next frame - the newest grabbed frame if a FrameGrabber is running, otherwise the next frame in the
+        camera's buffer.
+
+        :rtype: tuple of bool, numpy.array
+        :returns:
+            :return bool rval: whether a frame was read.
+            :return numpy.array frame: the frame, or None.
+        """
+        if self.frame_grabber is not None:
+            return self.frame_grabber.retrieve()
+        return self.video_capture.read()
+
+    def capture_call(self, method_name, *args):
+        """
+        Call a method of self.video_capture - between grabs if a FrameGrabber is running, as captures are not
+        thread-safe.
+
+        :Parameters:
+            :param str method_name: name of the cv2.VideoCapture method, e.g. "get".
+            :param args: positional arguments to be passed to the method.
+        :rtype: object
+        :return: the method's return value.
+        """
+        if self.frame_grabber is not None:
+            return self.frame_grabber.call(method_name, *args)
+        return getattr(self.video_capture, method_name)(*args)
+
+    def _start_grabbing(self):
+        """
+        Start a FrameGrabber on self.video_capture if self.grab_thread is True.
+
+        :rtype: None
+        :return: None
+        """
+        if self.grab_thread and self.frame_grabber is None:
+            self.video_capture.set(cv2.CAP_PROP_BUFFERSIZE, 1)  # Where the backend supports it.
+            self.frame_grabber = FrameGrabber(self.video_capture, retry_delay=self.frame_rate)
+            self.frame_grabber.start()
+
+    def _stop_grabbing(self):
+        """
+        Stop the FrameGrabber, if any, so that self.video_capture can be used or released by this thread.
+
+        :rtype: None
+        :return: None
+        """
+        if self.frame_grabber is not None:
+            self.frame_grabber.stop()
+            self.frame_grabber = None
+
+    def ship_trace(self):
+        """
+        Send any recorded spans, and the statistics of an unfinished profile, to the host.
+
+        :rtype: None
+        :return: None
+        """
+        if self.tracer is None:
+            return
+        if self.tracer.is_profiling:
+            self.trace_queue.put(self.tracer.stop_profiling())
+        self.tracer.ship(self.trace_queue, force=True)
+
+    def send_frame(self, frame):
+        """
+        Send a frame to the host process - compressed by self.frame_codec if it encodes frames, otherwise through
+        self.frame_ring when the frame fits it. Nothing is sent if self.change_detector finds the frame unchanged.
+
+        :Parameters:
+            :param numpy.array frame: the frame to be sent.
+        :rtype: None
+        :return: None
+        """
+        with span(self.tracer, "send_frame", "process"):
+            if self.change_detector is None or self.change_detector.changed(frame):
+                self._send_frame(frame)
+
+    def _send_frame(self, frame):
+        """
+        Encode frame or write it to the ring, then queue it - see send_frame.
+
+        :Parameters:
+            :param numpy.array frame: the frame to be sent.
+        :rtype: None
+        :return: None
+        """
+        if self.frame_codec is not None:
+            encoded = self.frame_codec.encode(frame)
+            if encoded is not None:
+                self._put(encoded)
+                return
+        if self.frame_ring is not None:
+            token = self.frame_ring.write(frame)
+            if token is not None:
+                self._put(token)
+                return
+        self._put(frame)
+
+    def _put(self, msg):
+        """
+        Queue a frame message for the host process, timestamped if self.timestamp_messages is True.
+
+        :Parameters:
+            :param msg: the frame, ring token or encoded frame to be sent.
+        :rtype: None
+        :return: None
+        """
+        self.frames_sent += 1
+        if self.timestamp_messages:
+            msg = TimedMessage(msg, self.frames_sent, monotonic(), None)
+        self.return_queue.put(msg)
 
     def _store_cam_dimensions(self, cam_width, cam_height):
         """
@@ -161,6 +377,7 @@ class SyncCam(object):
         """
         should_close = False
         if user_input == self.source_signal:  # for camera switch.
+            self._stop_grabbing()  # The current capture may be released.
             self.video_capture, self.camera_number, self.camera_number_increment, replaced = self.camera_cycle(
                 self.video_capture, self.camera_number, self.camera_number_increment)
             if replaced and self.camera_number != self.__class__.default_camera_number:
@@ -169,25 +386,27 @@ class SyncCam(object):
                 print("User Warning: Attempted to switch cameras, but could not find another camera.")
                 # self.video_capture.release()
                 # should_close = True
+            self._start_grabbing()
         elif user_input == self.command_signal:  # for image query mode toggle.
             if self.live_feed:
-                if self.video_capture.isOpened():
-                    rval, frame = self.video_capture.read()
+                if self.capture_call("isOpened"):
+                    rval, frame = self.read_frame()
                     try:
-                        processed_image = self.example_camera_command(frame,
-                                                                      self.image_count,
-                                                                      self.save_location,
-                                                                      self.title)
+                        with span(self.tracer, "example_camera_command", "process"):
+                            processed_image = self.example_camera_command(frame,
+                                                                          self.image_count,
+                                                                          self.save_location,
+                                                                          self.title)
                     except ValueError:
-                        image_width = self.video_capture.get(cv2.CAP_PROP_FRAME_WIDTH)
-                        image_height = self.video_capture.get(cv2.CAP_PROP_FRAME_HEIGHT)
+                        image_width = self.capture_call("get", cv2.CAP_PROP_FRAME_WIDTH)
+                        image_height = self.capture_call("get", cv2.CAP_PROP_FRAME_HEIGHT)
                         processed_image = self.generate_bad_query_image(image_width, image_height,
                                                                         query_message="BAD QUERY")
                     else:
                         self.image_count += 1
                 else:
-                    image_width = self.video_capture.get(cv2.CAP_PROP_FRAME_WIDTH)
-                    image_height = self.video_capture.get(cv2.CAP_PROP_FRAME_HEIGHT)
+                    image_width = self.capture_call("get", cv2.CAP_PROP_FRAME_WIDTH)
+                    image_height = self.capture_call("get", cv2.CAP_PROP_FRAME_HEIGHT)
                     processed_image = self.generate_bad_query_image(image_width, image_height,
                                                                     query_message="CAM CLOSED")
                 self.last_image = processed_image
@@ -195,8 +414,13 @@ class SyncCam(object):
             else:
                 self.live_feed = True
         elif user_input == self.kill_signal:
+            self._stop_grabbing()
             self.video_capture.release()
             should_close = True
+        elif user_input == PROFILE_ON and self.tracer is not None:
+            self.tracer.start_profiling()
+        elif user_input == PROFILE_OFF and self.tracer is not None and self.tracer.is_profiling:
+            self.trace_queue.put(self.tracer.stop_profiling())
         return should_close
 
     def camera_cycle(self, video_capture, camera_number, camera_number_increment):
@@ -455,3 +679,195 @@ class SyncCam(object):
         # Primary text.
         cv2.putText(image, message, (text_x, text_y), font, font_scale, fill_color, thickness, line_type)
         return image
+
+
+class FrameGrabber(Thread):
+    """
+    Grabs every frame from a cv2.VideoCapture as soon as the camera has it, so the driver's buffer never fills with
+    stale frames - only grabbing, not decoding. retrieve decodes the newest grabbed frame, and only the frames which
+    are retrieved are ever decoded.
+    """
+    def __init__(self, video_capture, *, retry_delay=0.015, retrieve_timeout=1.0):
+        """
+        Prepare the grabbing thread.
+
+        :Parameters:
+            :param cv2.VideoCapture video_capture: the capture to be grabbed from. It must only be used through this
+                object until stop is called.
+            :param float retry_delay: seconds to wait after a failed grab before trying again.
+            :param float retrieve_timeout: most seconds retrieve waits for a frame it has not retrieved yet.
+        :rtype: None
+        :return: None
+        """
+        Thread.__init__(self, name="FrameGrabber", daemon=True)
+        self.video_capture = video_capture
+        self.retry_delay = retry_delay
+        self.retrieve_timeout = retrieve_timeout
+        self.grabs = 0
+        self.grabbed_at = None
+        self.failing = False
+        self._retrieved = 0
+        self._waiting = False
+        self._running = True
+        self._condition = Condition()
+
+    def run(self):
+        """
+        Grab frames until stopped, handing each one straight to a waiting retrieve.
+
+        :rtype: None
+        :return: None
+        """
+        while self._running:
+            with self._condition:
+                grabbed = self.video_capture.grab()
+                self.failing = not grabbed
+                if grabbed:
+                    self.grabs += 1
+                    self.grabbed_at = monotonic()
+                self._condition.notify_all()
+                if grabbed and self._waiting:  # Let retrieve decode this frame before it is replaced.
+                    self._condition.wait_for(lambda: self._retrieved == self.grabs or not self._waiting
+                                             or not self._running, self.retrieve_timeout)
+            if not grabbed:
+                sleep(self.retry_delay)
+
+    def retrieve(self):
+        """
+        Decode the newest grabbed frame. A grab in progress is finished first, as its frame is newer, and the next grab
+        is waited for if the newest frame has already been retrieved.
+
+        :rtype: tuple of bool, numpy.array
+        :returns:
+            :return bool rval: whether a new frame was retrieved.
+            :return numpy.array frame: the frame, or None.
+        """
+        self._waiting = True
+        try:
+            with self._condition:
+                self._condition.wait_for(lambda: self.grabs != self._retrieved or self.failing or not self._running,
+                                         self.retrieve_timeout)
+                if self.grabs == self._retrieved:
+                    return False, None
+                self._retrieved = self.grabs
+                return self.video_capture.retrieve()
+        finally:
+            with self._condition:
+                self._waiting = False
+                self._condition.notify_all()
+
+    def call(self, method_name, *args):
+        """
+        Call a method of the capture between grabs, waiting for a grab in progress to finish. Like retrieve, this
+        holds the next grab back until the call is made, so a grabbing thread which never pauses cannot starve it.
+
+        :Parameters:
+            :param str method_name: name of the cv2.VideoCapture method, e.g. "get".
+            :param args: positional arguments to be passed to the method.
+        :rtype: object
+        :return: the method's return value.
+        """
+        self._waiting = True
+        try:
+            with self._condition:
+                return getattr(self.video_capture, method_name)(*args)
+        finally:
+            with self._condition:
+                self._waiting = False
+                self._condition.notify_all()
+
+    def stop(self):
+        """
+        Stop grabbing and wait for the thread to finish its current grab.
+
+        :rtype: None
+        :return: None
+        """
+        with self._condition:
+            self._running = False
+            self._condition.notify_all()
+        self.join()
+
+
+class ChangeDetector(object):
+    """
+    Decides whether a frame differs enough from the last frame sent to be worth sending.
+
+    Frames are compared on a strided, downsampled view: the mean absolute difference of every step-th pixel in each
+    direction, on the 0-255 scale, must exceed threshold. Sending the very same array object again, as a paused feed
+    does, is caught by identity without looking at any pixels. Frames are compared with the last frame sent rather
+    than the last frame seen, so slow drift still gets through once it adds up.
+    """
+    def __init__(self, threshold=1.0, *, step=8, refresh_interval=None):
+        """
+        Set the sensitivity.
+
+        :Parameters:
+            :param float threshold: mean absolute pixel difference a frame must exceed to be sent, or 0 to send any
+                frame whose sampled pixels differ at all.
+            :param int step: sampling stride in each direction - 8 compares one pixel in 64.
+            :param float refresh_interval: most seconds without a send, after which an unchanged frame is sent anyway,
+                or None to never resend unchanged frames.
+        :rtype: None
+        :return: None
+        """
+        self.threshold = threshold
+        self.step = step
+        self.refresh_interval = refresh_interval
+        self.frames_checked = 0
+        self.frames_suppressed = 0
+        self._last_frame = None
+        self._reference = None
+        self._sent_at = None
+
+    def changed(self, frame):
+        """
+        Determine if frame should be sent, remembering it as the reference if so.
+
+        :Parameters:
+            :param numpy.array frame: the candidate frame.
+        :rtype: bool
+        :return bool: True if frame should be sent.
+        """
+        self.frames_checked += 1
+        now = monotonic()
+        due = self._sent_at is not None and self.refresh_interval is not None and (
+            now - self._sent_at >= self.refresh_interval)
+        if frame is self._last_frame and not due:
+            self.frames_suppressed += 1
+            return False
+        sample = np.asarray(frame)[::self.step, ::self.step]
+        if self._reference is not None and sample.shape == self._reference.shape and not due:
+            if self.threshold > 0:
+                unchanged = np.abs(sample.astype(np.int16) - self._reference).mean() <= self.threshold
+            else:
+                unchanged = np.array_equal(sample, self._reference)
+            if unchanged:
+                self._last_frame = frame
+                self.frames_suppressed += 1
+                return False
+        self._last_frame = frame
+        self._reference = sample.astype(np.int16)
+        self._sent_at = now
+        return True
+
+    def __getstate__(self):
+        """
+        Pickle only the settings, so a detector passed to a new process starts without a reference frame.
+
+        :rtype: tuple
+        :return tuple: threshold, step and refresh_interval.
+        """
+        return self.threshold, self.step, self.refresh_interval
+
+    def __setstate__(self, state):
+        """
+        Restore the settings from __getstate__.
+
+        :Parameters:
+            :param tuple state: threshold, step and refresh_interval.
+        :rtype: None
+        :return: None
+        """
+        threshold, step, refresh_interval = state
+        self.__init__(threshold, step=step, refresh_interval=refresh_interval)
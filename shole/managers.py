@@ -1,13 +1,36 @@
 """Basic toolkit for asynchronous task communication / management using friendly threaded queues."""
 # USE EXAMPLES & TESTING TO BE COMPLETED.
 
+from importlib import import_module
+from collections import deque, namedtuple
+from functools import partial
+from itertools import count
 from threading import Thread
-from multiprocessing import Pool, Process
+from time import monotonic
+from multiprocessing import Pool, cpu_count, get_context
+from multiprocessing.connection import wait as wait_for_ready
 from multiprocessing.context import TimeoutError as TimesUpPencilsDown
-from multiprocessing import Queue as MultiQueue
 from queue import Queue
 from queue import Empty as EmptyQueue
-from constants import KILL, DONE, CZEC
+try:
+    from .constants import KILL, DONE, CZEC, TK_READABLE, BLOCK, ROUND_ROBIN, LEAST_LOADED, KEYED
+    from .constants import CONTROL_KILL, CONTROL_CHECK, CONTROL_FORWARD, CONTROL_FINISHED, CONTROL_ENDED
+    from .constants import CONTROL_DATA, PROFILE_ON, PROFILE_OFF
+    from .channels import ControlMessage, TimedMessage, WakeupPipe, Mailbox, BoundedQueue, BoundedMultiQueue
+    from .channels import discard_pickled, read_is_signal, SerializedQueue, EncodedFrame, read_ring_message
+    from .metrics import HostMetrics
+    from .tracing import span
+except ImportError:  # Imported as a top-level module, with the package directory on sys.path.
+    from constants import KILL, DONE, CZEC, TK_READABLE, BLOCK, ROUND_ROBIN, LEAST_LOADED, KEYED
+    from constants import CONTROL_KILL, CONTROL_CHECK, CONTROL_FORWARD, CONTROL_FINISHED, CONTROL_ENDED
+    from constants import CONTROL_DATA, PROFILE_ON, PROFILE_OFF
+    from channels import ControlMessage, TimedMessage, WakeupPipe, Mailbox, BoundedQueue, BoundedMultiQueue
+    from channels import discard_pickled, read_is_signal, SerializedQueue, EncodedFrame, read_ring_message
+    from metrics import HostMetrics
+    from tracing import span
+
+
+_host_numbers = count(1)  # Default metrics names for hosts.
 
 
 def clear_and_close_queues(*queues):
@@ -39,8 +62,13 @@ def clear_queues(*queues):
     """
     for queue in queues:
         try:
-            while not queue.empty():
-                _ = queue.get()
+            if hasattr(queue, "discard_pending"):
+                queue.discard_pending()
+            elif hasattr(queue, "_rlock") and hasattr(queue, "_reader"):
+                discard_pickled(queue)  # A multiprocessing.Queue - skip unpickling messages nobody will read.
+            else:
+                while not queue.empty():
+                    _ = queue.get()
         except OSError:
             pass
 
@@ -52,7 +80,14 @@ class ProcessHost(object):
     Send a target function to an instance of this class during __init__ or make_single_process_handler, and it will
     ensure the process completes, and pass any queue return messages to the function provided in message_callback
     during __init__.
+
+    :cvar int kill_check_delay: how often a non-blocking kill_process checks whether the process has ended.
+    :cvar bool block_on_end: determines if delivering an end signal waits for the process to end, instead of
+        finishing up from root.after callbacks.
     """
+    kill_check_delay = 10
+    block_on_end = True
+
     def __init__(self, root, message_callback, process_target=None, *process_args,
                  message_check_delay=1000,
                  running_check_delay=10000,
@@ -61,6 +96,27 @@ class ProcessHost(object):
                  finished_signal=DONE,
                  kill_signal=KILL,
                  check_signal=CZEC,
+                 frame_ring=None,
+                 direct_delivery=False,
+                 event_driven=False,
+                 messages_per_check=1,
+                 message_check_budget=None,
+                 batch_callback=None,
+                 queue_max_items=0,
+                 queue_max_bytes=0,
+                 queue_policy=BLOCK,
+                 kill_grace_delay=5000,
+                 terminate_grace_delay=1000,
+                 serializer=None,
+                 frame_codec=None,
+                 start_method=None,
+                 preload_modules=(),
+                 standby=False,
+                 metrics=None,
+                 metrics_name=None,
+                 timestamp_messages=False,
+                 tracer=None,
+                 trace_process=False,
                  **process_kwarg_dict):
         """Create private inter-process communication for a potentially newly started process.
 
@@ -76,22 +132,101 @@ class ProcessHost(object):
             :param str finished_signal: message to be used to indicate that the asynchronous process finished.
             :param str kill_signal: message to be used to finish the asynchronous process early.
             :param str check_signal: message to be used to check if the asynchronous process is still alive.
+            :param channels.FrameRing frame_ring: shared memory ring passed to process_target as the frame_ring
+                keyword; ring tokens sent by process_target are replaced with their frames before message_callback.
+            :param bool direct_delivery: determines if messages from process_target are read directly by this host
+                instead of being relayed by the SingleProcessHandler thread, which then only handles signals.
+            :param bool event_driven: determines if messages are delivered as soon as they arrive, by watching pipes
+                with root.add_reader(fd, callback) or Tkinter's root.tk.createfilehandler, instead of being polled
+                every message_check_delay.
+            :param int messages_per_check: most messages delivered per message check, or 0 for every pending message.
+            :param float message_check_budget: milliseconds after which a message check stops delivering messages,
+                leaving the rest for the next check.
+            :param function batch_callback: function / method used to process a list of every data message
+                delivered by a message check, in place of calling message_callback once per data message.
+            :param int queue_max_items: most data messages held by each message queue, or 0 for no count bound.
+            :param int queue_max_bytes: most payload bytes held by each message queue, or 0 for no byte bound.
+            :param str queue_policy: what a full message queue does with a new data message - constants.BLOCK,
+                constants.DROP_NEWEST or constants.DROP_OLDEST. Signals are never dropped.
+            :param int kill_grace_delay: how long a killed process has to report finishing before it is terminated.
+            :param int terminate_grace_delay: how long a terminated process has to exit before it is killed.
+            :param serializer: channels.PickleSerializer, channels.OutOfBandSerializer or compatible object used by
+                channels.SerializedQueue message queues in place of multiprocessing.Queue. Cannot be combined with
+                queue bounds.
+            :param channels.FrameCodec frame_codec: codec passed to process_target as the frame_codec keyword; encoded
+                frames sent by process_target are decoded before message_callback, and the codec totals the time
+                spent encoding and decoding them.
+            :param str start_method: multiprocessing start method used for the process and its queues - "fork",
+                "forkserver" or "spawn" - or None for the platform default.
+            :param tuple of str preload_modules: modules imported ahead of time by the fork server and by standby
+                processes, so process_target finds them already imported.
+            :param bool standby: determines if a process is always kept started, with preload_modules imported, and
+                waiting for the next process_target - so that starting or restarting a process only sends it the
+                target. process_target and its arguments must then be pickle-able, and cannot start processes of
+                their own, as standby processes are daemonic. This only pays off with the "spawn" and "forkserver"
+                start methods, or heavy preload_modules - a fork start is cheaper than handing a target over.
+            :param metrics.MetricsRegistry metrics: registry this host and its handler record queue depths, message and
+                byte counts, drops, delivery rates and callback durations into.
+            :param str metrics_name: value of the host label on this host's metrics, defaulting to the class name and
+                a number.
+            :param bool timestamp_messages: determines if process_target is passed timestamp_messages=True, asking it
+                to send channels.TimedMessages. Their timestamps and sequence numbers add per-hop latency, capture
+                rate and skipped message metrics; the host unwraps them before message_callback either way.
+            :param tracing.Tracer tracer: tracer this host records message checks and callbacks into, and its handler
+                records relayed messages into.
+            :param bool trace_process: determines if process_target is passed a trace_queue keyword, through which it
+                ships its own spans and profiles to tracer, as cam_process does. Needs tracer.
             :param process_kwarg_dict: dictionary to be passed to process_target.
         :rtype: None
         :return: None
         """
+        assert serializer is None or not (queue_max_items or queue_max_bytes), (
+            "Bounded message queues use their own serialization.")
         self.root = root
         self.message_check_rate = message_check_delay
         self.running_check_delay = running_check_delay
+        self.kill_grace_delay = kill_grace_delay
+        self.terminate_grace_delay = terminate_grace_delay
         self.message_callback = message_callback
-        self._to_host_queue = Queue()  # Please respect the privacy of these attributes. Altering them without
-        self._to_handler_queue = MultiQueue()  # consideration for processes relying on their private state can have
-        self.kill_signal = kill_signal  # unintended process opening / closing, especially with reuse.
+        self.messages_per_check = messages_per_check
+        self.message_check_budget = message_check_budget
+        self.batch_callback = batch_callback
+        self._messages_left_over = False
+        self._queue_bounds = (queue_max_items, queue_max_bytes, queue_policy)
+        self.serializer = serializer
+        self._context = get_context(start_method)
+        if start_method == "forkserver" and preload_modules:
+            self._context.set_forkserver_preload(list(preload_modules))
+        self.preload_modules = tuple(preload_modules)
+        # Please respect the privacy of these attributes. Altering them without consideration for processes relying on
+        # their private state can have unintended process opening / closing, especially with reuse.
+        self._to_host_queue = self._make_host_queue()
+        self._to_handler_queue = self._make_process_queue()
+        self.kill_signal = kill_signal
+        # Signals for the handler, never stuck behind data messages.
+        self._to_handler_control_queue = self._context.Queue()
+        self._to_host_control_queue = Queue()  # End notifications from the handler, never mistaken for data messages.
+        self._control_codes = {}
+        self._to_host_direct_queue = self._make_direct_queue() if direct_delivery else None
+        self._wakeup = WakeupPipe() if event_driven else None
+        self._watched_fds = []
         self.finished_signal = finished_signal
         self.check_signal = check_signal
+        self.frame_ring = frame_ring
+        self.frame_codec = frame_codec
+        if metrics is not None and metrics_name is None:
+            metrics_name = "{}-{}".format(self.__class__.__name__, next(_host_numbers))
+        self.metrics = HostMetrics(metrics, metrics_name) if metrics is not None else None
+        self.timestamp_messages = timestamp_messages
+        self.tracer = tracer
+        assert tracer is not None or not trace_process, "Tracing the process needs a tracer."
+        self._trace_queue = self._context.Queue() if trace_process else None
         self.is_running = False
         self._continue_running = run_process
         self._current_processor = None
+        self.exit_code = None  # Exit code of the most recently ended process.
+        self.use_standby = standby
+        self._standby = self._make_standby() if standby else None
         assert (self.kill_signal
                 != self.finished_signal
                 != self.check_signal
@@ -103,6 +238,74 @@ class ProcessHost(object):
                                              host_to_process_signals=host_to_process_signals,
                                              **process_kwarg_dict)
 
+    def _make_host_queue(self):
+        """
+        Create the in-process queue for messages from the handler thread, bounded if queue bounds were given.
+
+        :rtype: queue.Queue
+        :return queue.Queue: queue for messages from the handler to this host.
+        """
+        max_items, max_bytes, policy = self._queue_bounds
+        if max_items or max_bytes:
+            return BoundedQueue(max_items, max_bytes, policy)
+        return Queue()
+
+    def _make_process_queue(self):
+        """
+        Create a queue for messages from process_target, bounded if queue bounds were given, or serialized by
+        self.serializer if one was given.
+
+        :rtype: multiprocessing.Queue or channels.SerializedQueue
+        :return multiprocessing.Queue or channels.SerializedQueue: queue for messages from process_target.
+        """
+        max_items, max_bytes, policy = self._queue_bounds
+        if max_items or max_bytes:
+            return BoundedMultiQueue(max_items, max_bytes, policy, ctx=self._context)
+        if self.serializer is not None:
+            return SerializedQueue(self.serializer, ctx=self._context)
+        return self._context.Queue()
+
+    def _make_direct_queue(self):
+        """
+        Create the queue read directly by this host when direct_delivery is True.
+
+        :rtype: multiprocessing.Queue
+        :return multiprocessing.Queue: queue for messages from process_target to this host.
+        """
+        return self._make_process_queue()
+
+    def _make_standby(self):
+        """
+        Start a standby process holding the queue which the next process_target will return messages through.
+
+        :rtype: _StandbyProcess
+        :return _StandbyProcess: the started standby process.
+        """
+        process_queue = self._to_host_direct_queue if self._to_host_direct_queue is not None else self._to_handler_queue
+        return _StandbyProcess(self._context, process_queue, self.preload_modules, self._trace_queue)
+
+    def close_standby(self):
+        """
+        Stop the waiting standby process, if any. A new one is started by the next make_single_process_handler.
+
+        :rtype: None
+        :return: None
+        """
+        if self._standby is not None:
+            self._standby.discard()
+            self._standby = None
+
+    @property
+    def dropped_messages(self):
+        """
+        Return the number of data messages discarded by the queue_policy of this host's bounded queues.
+
+        :rtype: int
+        :return int: the total drop count.
+        """
+        return sum(getattr(queue, "dropped", 0)
+                   for queue in (self._to_host_queue, self._to_handler_queue, self._to_host_direct_queue))
+
     def make_single_process_handler(self, process_target, *process_args,
                                     host_to_process_signals=None,
                                     **process_kwarg_dict):
@@ -119,7 +322,19 @@ class ProcessHost(object):
         """
         assert not self.is_running, ("Please create a new SingleProcessHandler to start another process while this one "
                                      "is still running.")
-        _handler_to_process_queue = MultiQueue() if host_to_process_signals else None
+        if host_to_process_signals and self._trace_queue is not None:
+            host_to_process_signals = set(host_to_process_signals) | {PROFILE_ON, PROFILE_OFF}
+        standby, self._standby = self._standby, None
+        if standby is not None and not standby.is_alive():
+            standby = None
+        if standby is not None:
+            _handler_to_process_queue = standby.command_queue if host_to_process_signals else None
+        else:
+            _handler_to_process_queue = self._context.Queue() if host_to_process_signals else None
+        self._control_codes = {signal: CONTROL_FORWARD for signal in (host_to_process_signals or ())}
+        self._control_codes.update({self.kill_signal: CONTROL_KILL,
+                                    self.finished_signal: CONTROL_KILL,
+                                    self.check_signal: CONTROL_CHECK})
         self._continue_running = True
         self.is_running = True
         self._current_processor = SingleProcessHandler(process_target,
@@ -130,21 +345,124 @@ class ProcessHost(object):
                                                        kill_signal=self.kill_signal,
                                                        check_signal=self.check_signal,
                                                        host_to_process_signals=host_to_process_signals,
+                                                       frame_ring=self.frame_ring,
+                                                       frame_codec=self.frame_codec,
+                                                       metrics=self.metrics,
+                                                       timestamp_messages=self.timestamp_messages,
+                                                       tracer=self.tracer,
+                                                       trace_queue=self._trace_queue,
+                                                       process_to_host_queue=self._to_host_direct_queue,
+                                                       wakeup=self._wakeup,
+                                                       kill_grace=self.kill_grace_delay / 1000,
+                                                       terminate_grace=self.terminate_grace_delay / 1000,
+                                                       control_queue=self._to_handler_control_queue,
+                                                       handler_to_host_control_queue=self._to_host_control_queue,
+                                                       standby=standby,
+                                                       context=self._context,
                                                        **process_kwarg_dict)
         self._current_processor.start()
-        self.root.after(self.message_check_rate, self.check_message)
+        if self.use_standby:
+            self._standby = self._make_standby()  # Ready for the next start.
+        if self._wakeup is not None:
+            self._watch_messages()
+        else:
+            self.root.after(self.message_check_rate, self.check_message)
         self.root.after(self.running_check_delay, self.check_running)
 
+    def _watch_messages(self):
+        """
+        Register the message pipes with root so that _on_messages_ready runs whenever a message arrives.
+
+        :rtype: None
+        :return: None
+        """
+        self._watched_fds = [self._wakeup.fileno()]
+        if self._to_host_direct_queue is not None:
+            self._watched_fds.append(self._to_host_direct_queue._reader.fileno())
+        for fd in self._watched_fds:
+            if hasattr(self.root, "add_reader"):
+                self.root.add_reader(fd, self._on_messages_ready)
+            else:
+                self.root.tk.createfilehandler(fd, TK_READABLE, self._on_messages_ready)
+        self.root.after(0, self._on_messages_ready)  # Anything which arrived before registration.
+
+    def _unwatch_messages(self):
+        """
+        Unregister the message pipes registered by _watch_messages.
+
+        :rtype: None
+        :return: None
+        """
+        for fd in self._watched_fds:
+            if hasattr(self.root, "remove_reader"):
+                self.root.remove_reader(fd)
+            else:
+                self.root.tk.deletefilehandler(fd)
+        self._watched_fds = []
+
+    def _on_messages_ready(self, *_):
+        """
+        Deliver every pending message. Called by root when a watched pipe becomes readable.
+
+        :rtype: None
+        :return: None
+        """
+        if not self._continue_running:
+            return
+        self._wakeup.clear()
+        try:
+            with span(self.tracer, "check_message", "host"):
+                should_continue = self._drain_messages(self.message_callback, self.batch_callback)
+            if should_continue and self._messages_left_over:
+                self.root.after(0, self._on_messages_ready)  # Let root run before delivering the rest.
+        except AttributeError:
+            self.kill_process()
+
     def send_signal(self, signal):
         """
         Send signal to other process.
 
+        Built-in signals and host_to_process_signals go to the handler as a ControlMessage on the control queue, which
+        the handler reads before any data, so they never wait behind queued messages. So does everything else when
+        self.serializer is set, as a channels.SerializedQueue writes in the calling thread and would block it while
+        its pipe is full.
+
         :Parameters:
             :param signal: pickle-able object sent to subprocess.
         :rtype: None
         :return: None
         """
-        self._to_handler_queue.put(signal)
+        code = self._control_codes.get(signal) if signal.__class__ is str else None
+        if code is None and self.serializer is not None:
+            code = CONTROL_DATA
+        if code is None:
+            self._to_handler_queue.put(signal)
+        else:
+            self._to_handler_control_queue.put(ControlMessage(code, signal))
+
+    def start_profiling(self):
+        """
+        Ask the running process to start profiling itself with cProfile. Needs a tracer, trace_process and
+        host_to_process_signals, and a process_target which obeys constants.PROFILE_ON, as cam_process does.
+
+        :rtype: None
+        :return: None
+        """
+        assert self._control_codes.get(PROFILE_ON) == CONTROL_FORWARD, (
+            "Profiling needs trace_process and a process started with host_to_process_signals.")
+        self.send_signal(PROFILE_ON)
+
+    def stop_profiling(self):
+        """
+        Ask the running process to stop profiling itself. Its tracing.ProfileStats arrive in self.tracer.profiles
+        shortly after.
+
+        :rtype: None
+        :return: None
+        """
+        assert self._control_codes.get(PROFILE_OFF) == CONTROL_FORWARD, (
+            "Profiling needs trace_process and a process started with host_to_process_signals.")
+        self.send_signal(PROFILE_OFF)
 
     def check_message(self, *, message_callback=None):
         """
@@ -161,49 +479,245 @@ class ProcessHost(object):
         if message_callback is None:
             say_check_one_more_time = self._continue_running
             message_callback = self.message_callback
+            batch_callback = self.batch_callback
         else:
             say_check_one_more_time = False
+            batch_callback = None
         try:
-            if not self._to_host_queue.empty():
-                try:
-                    msg = self._to_host_queue.get_nowait()
-                except EmptyQueue:
-                    pass
-                else:
-                    if isinstance(msg, str):
-                        # print("{} for host.".format(msg))
-                        if msg in self.process_end_signals:
-                            say_check_one_more_time = False
-                            self.kill_process(need_to_signal=False)
-                    message_callback(msg)
-                finally:
-                    if say_check_one_more_time:
-                        self.root.after(self.message_check_rate, self.check_message)
-            elif say_check_one_more_time:
-                self.root.after(self.message_check_rate, self.check_message)
+            try:
+                with span(self.tracer, "check_message", "host"):
+                    should_continue = self._drain_messages(message_callback, batch_callback)
+                if not should_continue:
+                    say_check_one_more_time = False
+            finally:
+                if say_check_one_more_time:
+                    self.root.after(self.message_check_rate, self.check_message)
         except AttributeError:
             self.kill_process()
 
-    def kill_process(self, *, need_to_signal=True):
+    def _deliver(self, msg, message_callback):
+        """
+        Pass a message to message_callback, ending the process first if it is an end signal.
+
+        :Parameters:
+            :param msg: the message to be delivered, or the handler's ControlMessage when the process ended.
+            :param function message_callback: function / method used to process the message.
+        :rtype: bool
+        :return bool: False if the message ended the process and no more messages should be checked for.
+        """
+        if self._is_end(msg):
+            self.kill_process(need_to_signal=False, block=self.block_on_end)
+            message_callback(msg.signal if msg.__class__ is ControlMessage else msg)
+            return False
+        with span(self.tracer, "message_callback", "host"):
+            if self.metrics is None:
+                message_callback(msg)
+            else:
+                started = monotonic()
+                message_callback(msg)
+                self.metrics.callback_seconds.observe(monotonic() - started)
+        return True
+
+    def _is_end(self, msg):
+        """
+        Determine if a message ends the process. Messages relayed by the handler are only ever data, as the handler
+        reports ends on its control queue - only messages read directly from the process need checking for signals.
+
+        :Parameters:
+            :param msg: a message from _next_message.
+        :rtype: bool
+        :return bool: True if msg is an end signal.
+        """
+        if msg.__class__ is ControlMessage:
+            return True
+        return (self._to_host_direct_queue is not None
+                and msg.__class__ is str
+                and msg in self.process_end_signals)
+
+    def _drain_messages(self, message_callback, batch_callback=None):
+        """
+        Deliver pending messages in order, within the messages_per_check and message_check_budget limits.
+
+        :Parameters:
+            :param function message_callback: function / method used to process each message.
+            :param function batch_callback: function / method used to process the list of delivered data messages,
+                if any, in place of message_callback. End signals are always passed to message_callback.
+        :rtype: bool
+        :return bool: False if a message ended the process and no more messages should be checked for.
+        """
+        deadline = None if self.message_check_budget is None else monotonic() + self.message_check_budget / 1000
+        batch = []
+        delivered = 0
+        should_continue = True
+        self._messages_left_over = False
+        if self.metrics is not None:
+            self._record_queues()
+            if batch_callback is not None:
+                batch_callback = self._timed_batch_callback(batch_callback)
+        while True:
+            if ((self.messages_per_check and delivered >= self.messages_per_check)
+                    or (deadline is not None and monotonic() >= deadline)):
+                self._messages_left_over = True
+                break
+            try:
+                msg = self._unwrapped(self._next_message())
+            except EmptyQueue:
+                break
+            delivered += 1
+            if batch_callback is not None and not self._is_end(msg):
+                batch.append(msg)
+                continue
+            if batch:
+                batch_callback(batch)
+                batch = []
+            if not self._deliver(msg, message_callback):
+                should_continue = False
+                break
+        if batch:
+            batch_callback(batch)
+        return should_continue
+
+    def _unwrapped(self, msg):
+        """
+        Record a data message in self.metrics, take its payload out of any TimedMessage, and decode it if it is a
+        frame encoded by frame_codec.
+
+        :Parameters:
+            :param msg: a message from _next_message.
+        :rtype: object
+        :return msg: the payload for message_callback, or msg itself if it is an end signal.
+        """
+        if self._is_end(msg):
+            return msg
+        if self.metrics is not None:
+            msg = self.metrics.delivering(msg)
+        elif msg.__class__ is TimedMessage:
+            msg = msg.payload
+        if self.frame_codec is not None and msg.__class__ is EncodedFrame:
+            return self.frame_codec.decode(msg)
+        return msg
+
+    def _record_queues(self):
+        """
+        Record the depth of this host's message queues and its drop count in self.metrics.
+
+        :rtype: None
+        :return: None
+        """
+        self.metrics.queue_depth("host", self._to_host_queue)
+        self.metrics.queue_depth("handler", self._to_handler_queue)
+        if self._to_host_direct_queue is not None:
+            self.metrics.queue_depth("direct", self._to_host_direct_queue)
+        self.metrics.dropped_messages.set(self.dropped_messages)
+
+    def _timed_batch_callback(self, batch_callback):
+        """
+        Wrap a batch callback so that its duration is recorded in self.metrics.
+
+        :Parameters:
+            :param function batch_callback: function / method used to process a list of data messages.
+        :rtype: function
+        :return function: the wrapped callback.
+        """
+        def timed_batch_callback(batch):
+            started = monotonic()
+            batch_callback(batch)
+            self.metrics.callback_seconds.observe(monotonic() - started)
+        return timed_batch_callback
+
+    def _next_message(self):
+        """
+        Pull the next pending message, preferring handler messages over messages read directly from the process.
+        The handler's end notification is only pulled once no data is pending, so that it is delivered last.
+
+        :rtype: object
+        :return msg: the next message for message_callback.
+        :raises queue.Empty: if no message is pending.
+        """
+        try:
+            return self._to_host_queue.get_nowait()
+        except EmptyQueue:
+            pass
+        # Not once the process is being killed, as it may be terminated part way through writing a message.
+        while self._to_host_direct_queue is not None and self._continue_running:
+            try:
+                msg = self._to_host_direct_queue.get_nowait()
+            except EmptyQueue:
+                break
+            if self.frame_ring is not None:
+                msg = read_ring_message(self.frame_ring, msg)
+                if msg is None:  # Overwritten before it could be read.
+                    continue
+            return msg
+        return self._to_host_control_queue.get_nowait()
+
+    def kill_process(self, *, need_to_signal=True, block=True, callback=None):
         """
         End current process / clear queues.
 
+        The handler gives the process kill_grace_delay to report finishing, then terminates it, then kills it if it
+        is still alive after terminate_grace_delay - so this never waits on a wedged process indefinitely.
+
         :Parameters:
             :param bool need_to_signal: determines if a signal is sent to the process handler to end. Needs to be
                 True unless a signal has already been sent to the process handler.
+            :param bool block: determines if this waits for the process to end, instead of returning immediately and
+                finishing up from root.after callbacks.
+            :param function callback: function / method called with exit_code once the process has ended.
         :rtype: None
         :return: None
         """
         self._continue_running = False
+        if self._watched_fds:
+            self._unwatch_messages()
         if (self._current_processor is not None
                 and self._current_processor.is_alive()):
             if need_to_signal:
-                self._to_handler_queue.put(self.kill_signal)
+                self._to_handler_control_queue.put(ControlMessage(CONTROL_KILL, self.kill_signal))
                 clear_queues(self._to_host_queue)
+            elif self._to_host_direct_queue is not None:
+                # The handler cannot see end signals which the process sent directly to this host.
+                self._to_handler_control_queue.put(ControlMessage(CONTROL_FINISHED, self.finished_signal))
+            if not block:
+                self.root.after(self.kill_check_delay, self._finish_killing, callback)
+                return
             self._current_processor.join()
-        clear_queues(self._to_host_queue, self._to_handler_queue)
+        self._finish_killing(callback)
+
+    def _finish_killing(self, callback=None):
+        """
+        Clear queues once the process handler has ended, checking again later if it has not.
+
+        :Parameters:
+            :param function callback: function / method called with exit_code once the process has ended.
+        :rtype: None
+        :return: None
+        """
+        if (self._current_processor is not None
+                and self._current_processor.is_alive()):
+            clear_queues(self._to_host_queue)  # In case the handler is waiting on a full queue.
+            self.root.after(self.kill_check_delay, self._finish_killing, callback)
+            return
+        if self._current_processor is not None:
+            self.exit_code = self._current_processor.exitcode
+        if self.exit_code is not None and self.exit_code < 0:
+            # A terminated process may have been part way through writing a message, with the write lock held.
+            self._to_handler_queue = self._make_process_queue()
+            if self._to_host_direct_queue is not None:
+                self._to_host_direct_queue = self._make_direct_queue()
+            if self._trace_queue is not None:
+                self._trace_queue = self._context.Queue()
+            if self._standby is not None:  # It holds the replaced queue.
+                self._standby.discard()
+                self._standby = self._make_standby()
+        clear_queues(self._to_host_queue, self._to_handler_queue,
+                     self._to_host_control_queue, self._to_handler_control_queue)
+        if self._to_host_direct_queue is not None:
+            clear_queues(self._to_host_direct_queue)
         self._current_processor = None
         self.is_running = False
+        if callback is not None:
+            callback(self.exit_code)
 
     def check_running(self):
         """
@@ -215,7 +729,7 @@ class ProcessHost(object):
         if (self._continue_running
                 and self._current_processor is not None
                 and self._current_processor.is_alive()):
-            self._to_handler_queue.put(self.check_signal)
+            self._to_handler_control_queue.put(ControlMessage(CONTROL_CHECK, self.check_signal))
             self.root.after(self.running_check_delay, self.check_running)
 
 
@@ -227,7 +741,7 @@ class GreedyProcessHost(ProcessHost):
     ensure the process completes, and pass the most recent queue return messages to the function provided in
     message_callback during __init__ - while keeping the rest to itself. (Rude.)
     """
-    def __init__(self, *args, **kwargs):
+    def __init__(self, *args, conflate=False, **kwargs):
         """Create private inter-process communication for a potentially newly started process.
 
         :Parameters:
@@ -242,12 +756,46 @@ class GreedyProcessHost(ProcessHost):
             :param str finished_signal: message to be used to indicate that the asynchronous process finished.
             :param str kill_signal: message to be used to finish the asynchronous process early.
             :param str check_signal: message to be used to check if the asynchronous process is still alive.
+            :param channels.FrameRing frame_ring: shared memory ring passed to process_target as the frame_ring
+                keyword; ring tokens sent by process_target are replaced with their frames before message_callback.
+            :param bool direct_delivery: determines if messages from process_target are read directly by this host
+                instead of being relayed by the SingleProcessHandler thread, which then only handles signals.
+            :param bool event_driven: determines if messages are delivered as soon as they arrive, by watching pipes
+                with root.add_reader(fd, callback) or Tkinter's root.tk.createfilehandler, instead of being polled
+                every message_check_delay.
+            :param int queue_max_items: most data messages held by each message queue, or 0 for no count bound.
+            :param int queue_max_bytes: most payload bytes held by each message queue, or 0 for no byte bound.
+            :param str queue_policy: what a full message queue does with a new data message - constants.BLOCK,
+                constants.DROP_NEWEST or constants.DROP_OLDEST. Signals are never dropped.
+            :param serializer: channels.PickleSerializer, channels.OutOfBandSerializer or compatible object used by
+                channels.SerializedQueue message queues in place of multiprocessing.Queue. Cannot be combined with
+                queue bounds, and is not used by the conflating Mailbox.
+            :param channels.FrameCodec frame_codec: codec passed to process_target as the frame_codec keyword; the
+                delivered encoded frame is decoded before message_callback, and superseded ones are never decoded.
+            :param bool conflate: determines if process_target is given a channels.Mailbox read directly by this host,
+                which overwrites a shared-memory slot with each message, so that every check delivers the newest
+                message at that moment and superseded ones never cross a pipe. Needs Python 3.8+. Implies
+                direct_delivery.
             :param process_kwarg_dict: dictionary to be passed to process_target.
         :rtype: None
         :return: None
         """
+        self.conflate = conflate
+        if conflate:
+            kwargs["direct_delivery"] = True
         super(GreedyProcessHost, self).__init__(*args, **kwargs)
 
+    def _make_direct_queue(self):
+        """
+        Create the queue read directly by this host - a conflating Mailbox if self.conflate is True.
+
+        :rtype: multiprocessing.Queue or channels.Mailbox
+        :return multiprocessing.Queue or channels.Mailbox: queue for messages from process_target to this host.
+        """
+        if self.conflate:
+            return Mailbox(ctx=self._context)
+        return super(GreedyProcessHost, self)._make_direct_queue()
+
     def check_message(self, *, message_callback=None):
         """
         Initiate callbacks from inter-process communication. Overwrites the original check_message method in order
@@ -267,197 +815,1150 @@ class GreedyProcessHost(ProcessHost):
         else:
             say_check_one_more_time = False
         try:
-            if not self._to_host_queue.empty():
-                msg = None
-                try:
-                    while not self._to_host_queue.empty():
-                        msg = self._to_host_queue.get_nowait()
-                except EmptyQueue:
-                    pass
-                else:
-                    if isinstance(msg, str):
-                        # print("{} for greedy host.".format(msg))
-                        if msg in self.process_end_signals:
-                            say_check_one_more_time = False
-                            self.kill_process(need_to_signal=False)
-                    message_callback(msg)
-                finally:
-                    if say_check_one_more_time:
-                        self.root.after(self.message_check_rate, self.check_message)
-            elif say_check_one_more_time:
-                self.root.after(self.message_check_rate, self.check_message)
+            try:
+                with span(self.tracer, "check_message", "host"):
+                    should_continue = self._drain_messages(message_callback)
+                if not should_continue:
+                    say_check_one_more_time = False
+            finally:
+                if say_check_one_more_time:
+                    self.root.after(self.message_check_rate, self.check_message)
         except AttributeError:
             self.kill_process()
 
-
-class SingleProcessHandler(Thread):
-    """Manages single asynchronous processes - nothing in this object should be interacted with directly."""
-    def __init__(self, process_target, to_handler_queue, handler_to_host_queue, *process_args,
-                 handler_to_process_queue=None,
-                 finished_signal=DONE,
-                 kill_signal=KILL,
-                 check_signal=CZEC,
-                 host_to_process_signals=None,
-                 **process_kwarg_dict):
+    def _drain_messages(self, message_callback, batch_callback=None):
         """
-        Set runtime attributes for multi-process communication / management.
+        Deliver only the most recent pending message, so that only it is decoded - and the end signal after it, if
+        the process has ended, so that its last message is not lost.
 
         :Parameters:
-            :param function process_target: function / method to be run asynchronously.
-            :param multiprocessing.Queue to_handler_queue: queue for all communications sent to this class instance.
-            :param queue.Queue handler_to_host_queue: queue for communications to the host process from this instance.
-            :param process_args: positional arguments to be passed to process_target.
-            :param multiprocessing.Queue handler_to_process_queue: queue for communications from the host process
-                to the running asynchronous process_target.
-            :param str finished_signal: message to be used to indicate that the asynchronous process finished.
-            :param str kill_signal: message to be used to finish the asynchronous process early.
-            :param str check_signal: message to be used to check if the asynchronous process is still alive.
-            :param set host_to_process_signals: messages for the asynchronous process which may be sent to the handler.
-            :param process_kwarg_dict: dictionary to be passed to process_target.
-        :rtype: None
-        :return: None
+            :param function message_callback: function / method used to process the message.
+            :param function batch_callback: unused - a greedy host never delivers more than one message per check.
+        :rtype: bool
+        :return bool: False if the message ended the process and no more messages should be checked for.
         """
-        Thread.__init__(self)
-        self.host_to_process_signals = host_to_process_signals if host_to_process_signals else {}
-        self.kill_signal = kill_signal
-        self.finished_signal = finished_signal
-        self.check_signal = check_signal
-        assert (self.kill_signal
-                != self.finished_signal
-                != self.check_signal
-                != self.kill_signal), "Use unique built-in queue signals."
-        self.end_sigs = {self.kill_signal, self.finished_signal}
-        self.handler_to_host_queue = handler_to_host_queue
-        self.handler_to_process_queue = handler_to_process_queue
-        self.to_handler_queue = to_handler_queue
-        self.process_target = process_target
-        self.process_args = None
-        self._import_process_args(process_args, process_kwarg_dict)
-        self.handled_process = None
+        msg = None
+        end = None
+        received = False
+        try:
+            while end is None:
+                next_msg = self._next_message()
+                if self._is_end(next_msg):
+                    end = next_msg
+                else:
+                    msg = next_msg
+                    received = True
+        except EmptyQueue:
+            pass
+        if self.metrics is not None and (received or end is not None):
+            self._record_queues()
+        if received:
+            self._deliver(self._unwrapped(msg), message_callback)
+        if end is not None:
+            return self._deliver(end, message_callback)
+        return True
 
-    def _import_process_args(self, process_args=None, process_kwarg_dict=None):
-        """
-        Create the tuple of process args needed for multiprocessing.Process.
+
+class AsyncProcessHost(ProcessHost):
+    """
+    Multiprocessing/threading object for asyncio applications.
+
+    Send a target function to an instance of this class during __init__ or make_single_process_handler, and it will
+    ensure the process completes, and make its messages available through await recv() or async iteration. Messages are
+    read directly from the process's pipe whenever the event loop sees it become readable - nothing is polled. The
+    event loop is never blocked waiting for a process to end.
+    """
+    block_on_end = False
+
+    def __init__(self, process_target=None, *process_args, loop=None, **kwargs):
+        """Create private inter-process communication for a potentially newly started process.
 
         :Parameters:
+            :param function process_target: function / method to be run asynchronously.
             :param process_args: positional arguments to be passed to process_target.
-            :param process_kwarg_dict: dictionary to be passed to process_target.
+            :param asyncio.AbstractEventLoop loop: event loop used for scheduling, defaulting to the running loop - so
+                the host must be created in a coroutine unless loop is given. Must support add_reader, as the default
+                selector loops on Unix do.
+            :param kwargs: keyword arguments accepted by ProcessHost.__init__, other than message_callback options.
         :rtype: None
         :return: None
         """
-        if process_args and process_kwarg_dict:
-            self.process_args = process_args + (process_kwarg_dict,)
-        elif process_args:
-            self.process_args = process_args
-        elif process_kwarg_dict:
-            self.process_args = (process_kwarg_dict,)
-        if self.handler_to_process_queue:
-            if self.process_args:
-                self.process_args = (self.to_handler_queue, self.handler_to_process_queue) + self.process_args
-            else:
-                self.process_args = (self.to_handler_queue, self.handler_to_process_queue)
-        elif self.process_args:
-            self.process_args = (self.to_handler_queue,) + self.process_args
-        else:
-            self.process_args = (self.to_handler_queue,)
+        import asyncio  # Only asyncio applications pay for importing it.
+        if loop is None:
+            loop = asyncio.get_running_loop() if hasattr(asyncio, "get_running_loop") else asyncio.get_event_loop()
+        self.loop = loop
+        self._messages = asyncio.Queue()
+        self._ended = False
+        kwargs["direct_delivery"] = True
+        kwargs["event_driven"] = True
+        super(AsyncProcessHost, self).__init__(_LoopRoot(self.loop), self._queue_message, process_target,
+                                               *process_args, **kwargs)
 
-    def run(self):
+    def make_single_process_handler(self, *args, **kwargs):
         """
-        Start / maintain process communication.
+        Create a process handler and register its pipes with the event loop.
 
+        :Parameters:
+            :param args: positional arguments accepted by ProcessHost.make_single_process_handler.
+            :param kwargs: keyword arguments accepted by ProcessHost.make_single_process_handler.
         :rtype: None
         :return: None
         """
-        self.handled_process = Process(target=self.process_target,
-                                       args=self.process_args)
-        self.handled_process.start()
-        should_run = True
-        while should_run:
-            should_run = self._process_queues()
+        self._ended = False
+        super(AsyncProcessHost, self).make_single_process_handler(*args, **kwargs)
 
-    def _process_queues(self):
+    async def aclose(self):
         """
-        Transmit / interpret signals between processes.
+        End the current process without blocking the event loop.
 
-        :rtype: bool
-        :return bool should_run: determine whether the run() loop should continue.
+        :rtype: int or None
+        :return int or None: the exit code of the ended process.
         """
-        should_run = True
-        msg = self.to_handler_queue.get()
-        if isinstance(msg, str):
-            # print("{} for handler.".format(msg))
-            if msg in self.end_sigs:
-                self._kill_process()
-                self.handler_to_host_queue.put(msg)
-                should_run = False
-            elif msg == self.check_signal:
-                if not self.handled_process.is_alive():
-                    self.handler_to_host_queue.put(msg)
-                    should_run = False
-            elif msg in self.host_to_process_signals:
-                self.handler_to_process_queue.put(msg)
-            else:
-                self.handler_to_host_queue.put(msg)
-        else:
-            self.handler_to_host_queue.put(msg)
-        return should_run
+        finished = self.loop.create_future()
+        self.kill_process(block=False, callback=finished.set_result)
+        return await finished
 
-    def _kill_process(self):
+    def _queue_message(self, msg):
         """
-        Handle queue / process cleanup for end-process signals.
+        Make a message from the process available to recv.
 
+        :Parameters:
+            :param msg: the message from the process.
         :rtype: None
         :return: None
         """
-        if self.handled_process is not None:
-            if self.handler_to_process_queue:
-                self._okay_maybe_some_tears_but_be_quick()
-            else:
-                self._shh_no_more_tears(self.handled_process, self.to_handler_queue)
-            self.handled_process = None
+        self._messages.put_nowait(msg)
 
-    def _okay_maybe_some_tears_but_be_quick(self):
+    async def recv(self):
         """
-        Close process while allowing for one to-process-queue signal for cleanup.
+        Wait for the next message from the process. The process's end signal is received like any other message.
 
-        :rtype: None
-        :return: None
+        :rtype: object
+        :return msg: the next message from the process.
         """
-        self.handler_to_process_queue.put(self.kill_signal)
-        self.handler_to_process_queue = None
-        while True:
-            msg = self.to_handler_queue.get()
-            if isinstance(msg, self.finished_signal.__class__):
-                if msg == self.finished_signal:
-                    break
-        self._shh_no_more_tears(self.handled_process, self.to_handler_queue)
+        return await self._messages.get()
 
-    @classmethod
-    def _shh_no_more_tears(cls, process, queue_process_populates):
+    def __aiter__(self):
         """
-        Close process without queue signal for cleanup.
+        Iterate asynchronously over messages until the process ends.
 
-        :rtype: None
-        :return: None
+        :rtype: AsyncProcessHost
+        :return AsyncProcessHost: self.
         """
-        if process.is_alive():
-            process.terminate()
-            clear_and_close_queues(queue_process_populates)
-            process.join()
+        return self
 
+    async def __anext__(self):
+        """
+        Wait for the next data message from the process.
 
-class PoolProcessHandler(Thread):
-    """Manages pool'd asynchronous processes."""
-    def __init__(self, run_target, return_queue, pool_args, *, pool_size=4, time_limit=15):
+        :rtype: object
+        :return msg: the next message from the process.
+        :raises StopAsyncIteration: once the process has sent or been ended by an end signal.
         """
-        Set runtime attributes for a pooled multiprocessing application.
+        if self._ended:
+            raise StopAsyncIteration
+        msg = await self._messages.get()
+        if isinstance(msg, str) and msg in self.process_end_signals:
+            self._ended = True
+            raise StopAsyncIteration
+        return msg
 
-        :Parameters:
+
+class ProcessHostGroup(object):
+    """
+    Multiprocessing/threading object which spreads payloads across several copies of one asynchronous process.
+
+    Starts workers copies of process_target, each called with (return_queue, command_queue, *process_args), routes
+    payloads sent with send_signal to one of them, and passes every worker's messages to message_callback as
+    (worker_id, msg) from a single root.after message check chain.
+
+    :cvar int kill_check_delay: how often ending workers are checked on, until their handlers have ended.
+    """
+    kill_check_delay = 10
+
+    def __init__(self, root, message_callback, process_target=None, *process_args,
+                 workers=2,
+                 routing=ROUND_ROBIN,
+                 message_check_delay=1000,
+                 running_check_delay=10000,
+                 run_process=True,
+                 finished_signal=DONE,
+                 kill_signal=KILL,
+                 check_signal=CZEC,
+                 start_method=None,
+                 **process_kwarg_dict):
+        """Create private inter-process communication for potentially newly started worker processes.
+
+        :Parameters:
+            :param Tkinter.Tk root: root / object with .after(delay, callback) used for scheduling.
+            :param function message_callback: function / method called with (worker_id, msg) for each message.
+            :param function process_target: function / method to be run asynchronously by every worker.
+            :param process_args: positional arguments to be passed to process_target.
+            :param int workers: number of copies of process_target to run.
+            :param str routing: how send_signal picks a worker - constants.ROUND_ROBIN, constants.LEAST_LOADED or
+                constants.KEYED.
+            :param int message_check_delay: how often message checks are scheduled using root.
+            :param int running_check_delay: how often checks on whether the workers are running are run.
+            :param bool run_process: determines whether to run the process_target immediately after __init__.
+            :param str finished_signal: message to be used to indicate that a worker process finished.
+            :param str kill_signal: message to be used to finish the worker processes early.
+            :param str check_signal: message to be used to check if the worker processes are still alive.
+            :param str start_method: multiprocessing start method used for the worker processes and their queues -
+                "fork", "forkserver" or "spawn" - or None for the platform default.
+            :param process_kwarg_dict: dictionary to be passed to process_target.
+        :rtype: None
+        :return: None
+        """
+        assert routing in (ROUND_ROBIN, LEAST_LOADED, KEYED), "Unknown routing {}.".format(routing)
+        assert workers > 0, "A ProcessHostGroup needs at least one worker."
+        self.root = root
+        self.message_callback = message_callback
+        self.message_check_rate = message_check_delay
+        self.running_check_delay = running_check_delay
+        self.worker_count = workers
+        self.routing = routing
+        self.kill_signal = kill_signal
+        self.finished_signal = finished_signal
+        self.check_signal = check_signal
+        assert (self.kill_signal
+                != self.finished_signal
+                != self.check_signal
+                != self.kill_signal), "Use unique built-in queue signals."
+        self.process_end_signals = {self.kill_signal, self.finished_signal, self.check_signal}
+        self.is_running = False
+        self._continue_running = False
+        self._context = get_context(start_method)
+        self._kill_callback = None
+        self._to_host_queue = Queue()  # (worker_id, msg) from every worker's handler.
+        self._workers = []
+        self._next_worker = 0
+        if process_target is not None and run_process:
+            self.make_process_handlers(process_target, *process_args, **process_kwarg_dict)
+
+    def make_process_handlers(self, process_target, *process_args, **process_kwarg_dict):
+        """
+        Start the worker processes and their handlers.
+
+        :Parameters:
+            :param function process_target: function / method to be run asynchronously by every worker.
+            :param process_args: positional arguments to be passed to process_target.
+            :param process_kwarg_dict: dictionary to be passed to process_target.
+        :rtype: None
+        :return: None
+        """
+        assert not self.is_running, "Please kill the running workers before starting new ones."
+        self._continue_running = True
+        self.is_running = True
+        self._workers = []
+        for worker_id in range(self.worker_count):
+            worker = _GroupWorker(worker_id, self._context)
+            worker.handler = SingleProcessHandler(process_target,
+                                                  worker.to_handler_queue,
+                                                  _WorkerQueue(self._to_host_queue, worker_id), *process_args,
+                                                  handler_to_process_queue=self._context.Queue(),
+                                                  finished_signal=self.finished_signal,
+                                                  kill_signal=self.kill_signal,
+                                                  check_signal=self.check_signal,
+                                                  process_to_host_queue=worker.to_host_queue,
+                                                  forward_payloads=True,
+                                                  context=self._context,
+                                                  **process_kwarg_dict)
+            worker.handler.start()
+            self._workers.append(worker)
+        self.root.after(self.message_check_rate, self.check_message)
+        self.root.after(self.running_check_delay, self.check_running)
+
+    def send_signal(self, payload, *, key=None):
+        """
+        Send a payload to one worker process, chosen by routing.
+
+        :Parameters:
+            :param payload: pickle-able object sent to a worker process.
+            :param key: hashable object which picks the worker when routing is constants.KEYED.
+        :rtype: int
+        :return int worker_id: the worker the payload was sent to.
+        """
+        running = [worker for worker in self._workers if worker.running]
+        assert running, "No worker processes are running."
+        if self.routing == KEYED:
+            worker = running[hash(key) % len(running)]
+        elif self.routing == LEAST_LOADED:
+            worker = min(running, key=lambda candidate: candidate.outstanding)
+        else:
+            worker = running[self._next_worker % len(running)]
+            self._next_worker += 1
+        worker.outstanding += 1
+        worker.to_handler_queue.put(payload)
+        return worker.worker_id
+
+    def broadcast_signal(self, signal):
+        """
+        Send a signal to every running worker process.
+
+        :Parameters:
+            :param signal: pickle-able object sent to every worker process.
+        :rtype: None
+        :return: None
+        """
+        for worker in self._workers:
+            if worker.running:
+                worker.to_handler_queue.put(signal)
+
+    def check_message(self):
+        """
+        Pass every pending worker message to message_callback.
+
+        :rtype: None
+        :return: None
+        """
+        try:
+            while True:
+                try:
+                    worker_id, msg = self._to_host_queue.get_nowait()
+                except EmptyQueue:
+                    break
+                self._deliver(self._workers[worker_id], msg)
+            for worker in self._workers:
+                while worker.running:
+                    try:
+                        msg = worker.to_host_queue.get_nowait()
+                    except EmptyQueue:
+                        break
+                    self._deliver(worker, msg)
+        finally:
+            if any(worker.running for worker in self._workers):
+                if self._continue_running:
+                    self.root.after(self.message_check_rate, self.check_message)
+
+    def _deliver(self, worker, msg):
+        """
+        Pass a worker message to message_callback, ending the worker first if it is an end signal.
+
+        :Parameters:
+            :param _GroupWorker worker: the worker which sent the message.
+            :param msg: the message to be delivered.
+        :rtype: None
+        :return: None
+        """
+        if not worker.running:  # Its handler's own echo of the end signal.
+            return
+        if isinstance(msg, str) and msg in self.process_end_signals:
+            self._end_worker(worker)
+        elif worker.outstanding:
+            worker.outstanding -= 1
+        self.message_callback(worker.worker_id, msg)
+
+    def _end_worker(self, worker, *, need_to_signal=False):
+        """
+        Stop routing payloads to a worker and tell its handler to end, finishing up from root.after callbacks.
+
+        :Parameters:
+            :param _GroupWorker worker: the worker to be ended.
+            :param bool need_to_signal: determines if the worker process is sent kill_signal, instead of having
+                already finished.
+        :rtype: None
+        :return: None
+        """
+        worker.running = False
+        if worker.handler is not None and worker.handler.is_alive():
+            worker.to_handler_queue.put(self.kill_signal if need_to_signal else self.finished_signal)
+        self._finish_worker(worker)
+
+    def _finish_worker(self, worker):
+        """
+        Clear a worker's queues once its handler has ended, checking again later if it has not.
+
+        :Parameters:
+            :param _GroupWorker worker: the worker being ended.
+        :rtype: None
+        :return: None
+        """
+        if worker.handler is not None and worker.handler.is_alive():
+            self.root.after(self.kill_check_delay, self._finish_worker, worker)
+            return
+        if worker.handler is not None:
+            worker.exit_code = worker.handler.exitcode
+        clear_queues(worker.to_handler_queue, worker.to_host_queue)
+        worker.handler = None
+        if not any(other.running or other.handler is not None for other in self._workers):
+            self._finish_killing()
+
+    def _finish_killing(self):
+        """
+        Clear the shared queue once every worker has ended, and pass their exit codes to the kill_process callback.
+
+        :rtype: None
+        :return: None
+        """
+        clear_queues(self._to_host_queue)
+        self.is_running = False
+        callback, self._kill_callback = self._kill_callback, None
+        if callback is not None:
+            callback([worker.exit_code for worker in self._workers])
+
+    def kill_process(self, *, callback=None):
+        """
+        End every worker process / clear queues, without waiting on the handlers - is_running stays True until
+        every one of them has ended.
+
+        :Parameters:
+            :param function callback: function / method called with the list of worker exit codes once every worker
+                process has ended.
+        :rtype: None
+        :return: None
+        """
+        self._continue_running = False
+        self._kill_callback = callback
+        for worker in self._workers:
+            if worker.running:
+                self._end_worker(worker, need_to_signal=True)
+        if not any(worker.handler is not None for worker in self._workers):
+            self._finish_killing()
+
+    def check_running(self):
+        """
+        Maintain communication with the worker processes to ensure they're running.
+
+        :rtype: None
+        :return: None
+        """
+        if self._continue_running and any(worker.running for worker in self._workers):
+            self.broadcast_signal(self.check_signal)
+            self.root.after(self.running_check_delay, self.check_running)
+
+
+class _GroupWorker(object):
+    """Queues, handler and load of one ProcessHostGroup worker."""
+    def __init__(self, worker_id, context):
+        """
+        Create the worker's queues.
+
+        :Parameters:
+            :param int worker_id: index of this worker within its group.
+            :param multiprocessing.context.BaseContext context: context the worker's queues are created with.
+        :rtype: None
+        :return: None
+        """
+        self.worker_id = worker_id
+        self.to_handler_queue = context.Queue()
+        self.to_host_queue = context.Queue()
+        self.handler = None
+        self.outstanding = 0
+        self.running = True
+        self.exit_code = None
+
+
+class _WorkerQueue(object):
+    """Tags messages put by one worker's handler with its worker_id before sharing a group queue."""
+    def __init__(self, queue, worker_id):
+        """
+        Wrap the shared queue.
+
+        :Parameters:
+            :param queue.Queue queue: the queue shared by every worker's handler.
+            :param int worker_id: the id put alongside each message.
+        :rtype: None
+        :return: None
+        """
+        self.queue = queue
+        self.worker_id = worker_id
+
+    def put(self, msg):
+        """
+        Put (worker_id, msg) in the shared queue.
+
+        :Parameters:
+            :param msg: the message from the worker's handler.
+        :rtype: None
+        :return: None
+        """
+        self.queue.put((self.worker_id, msg))
+
+
+class _LoopRoot(object):
+    """Adapts an asyncio event loop to the root interface used by ProcessHost."""
+    def __init__(self, loop):
+        """
+        Wrap an event loop.
+
+        :Parameters:
+            :param asyncio.AbstractEventLoop loop: the loop to be wrapped.
+        :rtype: None
+        :return: None
+        """
+        self.loop = loop
+
+    def after(self, delay, callback, *args):
+        """
+        Schedule a callback after delay milliseconds.
+
+        :Parameters:
+            :param int delay: milliseconds to wait.
+            :param function callback: function / method to be called.
+            :param args: positional arguments to be passed to callback.
+        :rtype: asyncio.TimerHandle
+        :return asyncio.TimerHandle: handle which can cancel the callback.
+        """
+        return self.loop.call_later(delay / 1000, callback, *args)
+
+    def add_reader(self, fd, callback):
+        """
+        Call callback whenever fd is readable.
+
+        :Parameters:
+            :param int fd: file descriptor to be watched.
+            :param function callback: function / method to be called.
+        :rtype: None
+        :return: None
+        """
+        self.loop.add_reader(fd, callback)
+
+    def remove_reader(self, fd):
+        """
+        Stop watching fd.
+
+        :Parameters:
+            :param int fd: file descriptor to stop watching.
+        :rtype: None
+        :return: None
+        """
+        self.loop.remove_reader(fd)
+
+
+def _run_standby(assignments, process_queue, command_queue, preload_modules, trace_queue=None, inherited=None):
+    """
+    Import preload_modules, then wait for a process_target and run it. Run in a standby process.
+
+    :Parameters:
+        :param multiprocessing.connection.Connection assignments: pipe which delivers the target, or None to exit.
+        :param multiprocessing.Queue process_queue: queue for all communications to the host process.
+        :param multiprocessing.Queue command_queue: queue for communications from the host process to this process.
+        :param tuple of str preload_modules: modules to be imported before waiting.
+        :param multiprocessing.Queue trace_queue: the host's trace queue, if it traces its process.
+        :param multiprocessing.connection.Connection inherited: the sending end of assignments, when inherited
+            through fork - closed so that assignments reaches EOF once the host process is gone.
+    :rtype: None
+    :return: None
+    """
+    if inherited is not None:
+        inherited.close()
+    for module_name in preload_modules:
+        import_module(module_name)
+    try:
+        assignment = assignments.recv()
+    except EOFError:
+        return
+    if assignment is None:
+        return
+    process_target, with_commands, with_trace, process_args, process_kwargs = assignment
+    if with_trace:
+        process_kwargs["trace_queue"] = trace_queue
+    queues = (process_queue, command_queue) if with_commands else (process_queue,)
+    process_target(*(queues + process_args), **process_kwargs)
+
+
+class _StandbyProcess(object):
+    """A started process, holding its host's return queue and a command queue, which waits for a process_target."""
+    def __init__(self, context, process_queue, preload_modules=(), trace_queue=None):
+        """
+        Start the standby process.
+
+        :Parameters:
+            :param context: multiprocessing context used to start the process and create its queues.
+            :param multiprocessing.Queue process_queue: queue the process_target will return messages through.
+            :param tuple of str preload_modules: modules imported by the process while it waits.
+            :param multiprocessing.Queue trace_queue: the host's trace queue, which the process_target may be given.
+        :rtype: None
+        :return: None
+        """
+        self.process_queue = process_queue
+        self.trace_queue = trace_queue
+        self.command_queue = context.Queue()
+        reader, self._assignments = context.Pipe(duplex=False)
+        inherited = self._assignments if context.get_start_method() == "fork" else None
+        self.process = context.Process(target=_run_standby,
+                                       args=(reader, process_queue, self.command_queue, tuple(preload_modules),
+                                             trace_queue, inherited),
+                                       daemon=True)
+        self.process.start()
+        reader.close()
+
+    def is_alive(self):
+        """
+        Determine if the standby process is still waiting to be used.
+
+        :rtype: bool
+        :return bool: True if the process is alive.
+        """
+        return self.process.is_alive()
+
+    def assign(self, process_target, process_args, process_kwargs):
+        """
+        Hand the standby process its target.
+
+        :Parameters:
+            :param function process_target: pickle-able function / method to be run by the standby process.
+            :param tuple process_args: arguments for process_target, starting with self.process_queue and then
+                self.command_queue if the target is given one.
+            :param dict process_kwargs: keyword arguments for process_target. A trace_queue keyword must be
+                self.trace_queue.
+        :rtype: multiprocessing.Process
+        :return multiprocessing.Process: the now running process.
+        """
+        assert process_args[0] is self.process_queue, "A standby process only returns messages through its own queue."
+        with_commands = len(process_args) > 1 and process_args[1] is self.command_queue
+        remaining_args = tuple(process_args[2 if with_commands else 1:])
+        process_kwargs = dict(process_kwargs)
+        trace_queue = process_kwargs.pop("trace_queue", None)
+        assert trace_queue is None or trace_queue is self.trace_queue, "A standby process only traces to its own queue."
+        self._assignments.send((process_target, with_commands, trace_queue is not None, remaining_args, process_kwargs))
+        self._assignments.close()
+        return self.process
+
+    def discard(self):
+        """
+        Tell the standby process to exit without running anything.
+
+        :rtype: None
+        :return: None
+        """
+        try:
+            self._assignments.send(None)
+            self._assignments.close()
+        except OSError:  # Already assigned or exited.
+            pass
+        clear_and_close_queues(self.command_queue)
+
+
+class SingleProcessHandler(Thread):
+    """Manages single asynchronous processes - nothing in this object should be interacted with directly."""
+    def __init__(self, process_target, to_handler_queue, handler_to_host_queue, *process_args,
+                 handler_to_process_queue=None,
+                 finished_signal=DONE,
+                 kill_signal=KILL,
+                 check_signal=CZEC,
+                 host_to_process_signals=None,
+                 frame_ring=None,
+                 frame_codec=None,
+                 metrics=None,
+                 timestamp_messages=False,
+                 tracer=None,
+                 trace_queue=None,
+                 process_to_host_queue=None,
+                 wakeup=None,
+                 forward_payloads=False,
+                 kill_grace=5.0,
+                 terminate_grace=1.0,
+                 control_queue=None,
+                 handler_to_host_control_queue=None,
+                 standby=None,
+                 context=None,
+                 **process_kwarg_dict):
+        """
+        Set runtime attributes for multi-process communication / management.
+
+        :Parameters:
+            :param function process_target: function / method to be run asynchronously.
+            :param multiprocessing.Queue to_handler_queue: queue for all communications sent to this class instance.
+            :param queue.Queue handler_to_host_queue: queue for communications to the host process from this instance.
+            :param process_args: positional arguments to be passed to process_target.
+            :param multiprocessing.Queue handler_to_process_queue: queue for communications from the host process
+                to the running asynchronous process_target.
+            :param str finished_signal: message to be used to indicate that the asynchronous process finished.
+            :param str kill_signal: message to be used to finish the asynchronous process early.
+            :param str check_signal: message to be used to check if the asynchronous process is still alive.
+            :param set host_to_process_signals: messages for the asynchronous process which may be sent to the handler.
+            :param channels.FrameRing frame_ring: shared memory ring passed to process_target as the frame_ring
+                keyword; ring tokens received from process_target are replaced with their frames for the host.
+            :param channels.FrameCodec frame_codec: codec passed to process_target as the frame_codec keyword. Encoded
+                frames are relayed as they are, and decoded by the host.
+            :param metrics.HostMetrics metrics: the host's metrics, which record every relayed message and stamp
+                relayed channels.TimedMessages.
+            :param bool timestamp_messages: determines if process_target is passed timestamp_messages=True.
+            :param tracing.Tracer tracer: the host's tracer, which records relayed messages and collects what
+                process_target ships through trace_queue.
+            :param multiprocessing.Queue trace_queue: queue passed to process_target as the trace_queue keyword.
+                Needs tracer.
+            :param multiprocessing.Queue process_to_host_queue: queue read directly by the host which replaces
+                to_handler_queue as process_target's return queue. to_handler_queue then only carries host signals.
+            :param channels.WakeupPipe wakeup: notified whenever a message is put in handler_to_host_queue.
+            :param bool forward_payloads: determines if every message from the host other than the built-in signals
+                is forwarded to handler_to_process_queue. Requires process_to_host_queue, so that messages from
+                process_target are never mistaken for messages from the host.
+            :param float or None kill_grace: seconds a killed process has to report finishing before it is terminated.
+            :param float or None terminate_grace: seconds a terminated process has to exit before it is killed.
+            :param multiprocessing.Queue control_queue: queue of channels.ControlMessage signals from the host, always
+                read before to_handler_queue. String signals in to_handler_queue are still obeyed.
+            :param queue.Queue handler_to_host_control_queue: queue for the channels.ControlMessage reporting the end
+                of this handler, in place of relaying the end signal through handler_to_host_queue.
+            :param _StandbyProcess standby: started process which is given process_target instead of starting a new
+                process. It must hold process_to_host_queue, or to_handler_queue if there is none.
+            :param context: multiprocessing context used to start the process, defaulting to the platform default.
+            :param process_kwarg_dict: dictionary to be passed to process_target.
+        :rtype: None
+        :return: None
+        """
+        Thread.__init__(self)
+        self.host_to_process_signals = host_to_process_signals if host_to_process_signals else {}
+        self.kill_signal = kill_signal
+        self.finished_signal = finished_signal
+        self.check_signal = check_signal
+        assert (self.kill_signal
+                != self.finished_signal
+                != self.check_signal
+                != self.kill_signal), "Use unique built-in queue signals."
+        self.end_sigs = {self.kill_signal, self.finished_signal}
+        self.handler_to_host_queue = handler_to_host_queue
+        self.wakeup = wakeup
+        self.forward_payloads = forward_payloads
+        self.kill_grace = kill_grace
+        self.terminate_grace = terminate_grace
+        assert not forward_payloads or (process_to_host_queue is not None and handler_to_process_queue is not None), (
+            "Forwarding payloads needs both process_to_host_queue and handler_to_process_queue.")
+        self.handler_to_process_queue = handler_to_process_queue
+        self.to_handler_queue = to_handler_queue
+        self.process_to_host_queue = process_to_host_queue
+        self.process_queue = process_to_host_queue if process_to_host_queue is not None else to_handler_queue
+        self.control_queue = control_queue
+        self.handler_to_host_control_queue = handler_to_host_control_queue
+        self.process_target = process_target
+        self.standby = standby
+        self.context = context if context is not None else get_context()
+        self.frame_ring = frame_ring
+        self.process_kwargs = {"frame_ring": frame_ring} if frame_ring is not None else {}
+        if frame_codec is not None:
+            self.process_kwargs["frame_codec"] = frame_codec
+        if timestamp_messages:
+            self.process_kwargs["timestamp_messages"] = True
+        self.metrics = metrics
+        self.tracer = tracer
+        self.trace_queue = trace_queue
+        if trace_queue is not None:
+            self.process_kwargs["trace_queue"] = trace_queue
+        self.process_args = None
+        self._import_process_args(process_args, process_kwarg_dict)
+        self.handled_process = None
+        self.exitcode = None
+
+    def _import_process_args(self, process_args=None, process_kwarg_dict=None):
+        """
+        Create the tuple of process args needed for multiprocessing.Process.
+
+        :Parameters:
+            :param process_args: positional arguments to be passed to process_target.
+            :param process_kwarg_dict: dictionary to be passed to process_target.
+        :rtype: None
+        :return: None
+        """
+        if process_args and process_kwarg_dict:
+            self.process_args = process_args + (process_kwarg_dict,)
+        elif process_args:
+            self.process_args = process_args
+        elif process_kwarg_dict:
+            self.process_args = (process_kwarg_dict,)
+        if self.handler_to_process_queue:
+            if self.process_args:
+                self.process_args = (self.process_queue, self.handler_to_process_queue) + self.process_args
+            else:
+                self.process_args = (self.process_queue, self.handler_to_process_queue)
+        elif self.process_args:
+            self.process_args = (self.process_queue,) + self.process_args
+        else:
+            self.process_args = (self.process_queue,)
+
+    def run(self):
+        """
+        Start / maintain process communication.
+
+        :rtype: None
+        :return: None
+        """
+        if self.standby is not None:
+            self.handled_process = self.standby.assign(self.process_target, self.process_args, self.process_kwargs)
+            self.standby = None
+        else:
+            self.handled_process = self.context.Process(target=self.process_target,
+                                                        args=self.process_args,
+                                                        kwargs=self.process_kwargs)
+            self.handled_process.start()
+        self._ready_handles = [self.to_handler_queue._reader, self.handled_process.sentinel]
+        if self.trace_queue is not None:
+            self._ready_handles.insert(0, self.trace_queue._reader)
+        if self.control_queue is not None:
+            self._ready_handles.insert(0, self.control_queue._reader)
+        should_run = True
+        while should_run:
+            should_run = self._process_queues()
+
+    def _process_queues(self):
+        """
+        Transmit / interpret signals between processes.
+
+        :rtype: bool
+        :return bool should_run: determine whether the run() loop should continue.
+        """
+        ready = wait_for_ready(self._ready_handles)
+        if self.control_queue is not None and self._ready_handles[0] in ready:
+            return self._process_control(self.control_queue.get())
+        if self.trace_queue is not None and self.trace_queue._reader in ready:
+            self.tracer.collect(self.trace_queue.get())
+            return True
+        if self.to_handler_queue._reader not in ready:
+            return self._process_exited()
+        with span(self.tracer, "receive", "handler"):
+            msg = self.to_handler_queue.get()
+        return self._process_message(msg)
+
+    def _process_message(self, msg):
+        """
+        Act on a message from the handler's message queue.
+
+        :Parameters:
+            :param msg: the message, from the handled process or the host.
+        :rtype: bool
+        :return bool should_run: determine whether the run() loop should continue.
+        """
+        should_run = True
+        if msg.__class__ is str:
+            # print("{} for handler.".format(msg))
+            if msg in self.end_sigs:
+                if msg == self.finished_signal and self.process_to_host_queue is not None:
+                    self._await_finished_process()
+                else:
+                    self._kill_process()
+                self._report_end(msg)
+                should_run = False
+            elif msg == self.check_signal:
+                if not self.handled_process.is_alive():
+                    self._report_end(msg)
+                    should_run = False
+            elif msg in self.host_to_process_signals or self.forward_payloads:
+                self.handler_to_process_queue.put(msg)
+            else:
+                self._relay(msg)
+        elif self.forward_payloads:
+            self.handler_to_process_queue.put(msg)
+        elif self.frame_ring is not None:
+            msg = read_ring_message(self.frame_ring, msg)
+            if msg is not None:  # Otherwise the frame was overwritten before it could be read.
+                self._relay(msg)
+        else:
+            self._relay(msg)
+        return should_run
+
+    def _process_control(self, control):
+        """
+        Act on a signal from the control queue.
+
+        :Parameters:
+            :param channels.ControlMessage control: the signal from the host.
+        :rtype: bool
+        :return bool should_run: determine whether the run() loop should continue.
+        """
+        if control.code == CONTROL_FORWARD:
+            self.handler_to_process_queue.put(control.signal)
+        elif control.code == CONTROL_DATA:
+            return self._process_message(control.signal)
+        elif control.code == CONTROL_CHECK:
+            if not self.handled_process.is_alive():
+                self._report_end(control.signal)
+                return False
+        else:
+            if control.code == CONTROL_FINISHED:
+                self._await_finished_process()
+            else:
+                self._kill_process()
+            self._report_end(control.signal)
+            return False
+        return True
+
+    def _await_message(self, queue, timeout=None):
+        """
+        Wait until queue has a message or the handled process exits, whichever comes first.
+
+        :Parameters:
+            :param multiprocessing.Queue queue: queue populated by the handled process and / or the host.
+            :param float or None timeout: most seconds to wait, or None to wait indefinitely.
+        :rtype: bool
+        :return bool: True if queue has a message, False if the process exited or timeout expired first.
+        """
+        if not queue.empty():
+            return True
+        ready = wait_for_ready([queue._reader, self.handled_process.sentinel], timeout)
+        return queue._reader in ready
+
+    def _process_exited(self):
+        """
+        Handle a handled process which exited without the usual end signal - reporting it to the host immediately,
+        unless it exited cleanly after reporting directly to the host.
+
+        :rtype: bool
+        :return bool should_run: False, as there is no longer a process to communicate with.
+        """
+        self._forget_process()
+        if self.process_to_host_queue is None or self.exitcode != 0:
+            self._report_end(self.check_signal)
+        return False
+
+    def _forget_process(self):
+        """
+        Reap the handled process and record its exit code.
+
+        :rtype: None
+        :return: None
+        """
+        if self.handled_process is not None:
+            self.handled_process.join()
+            self.exitcode = self.handled_process.exitcode
+            self.handled_process = None
+            self._collect_trace()
+
+    def _collect_trace(self):
+        """
+        Collect whatever the ended process left in the trace queue.
+
+        :rtype: None
+        :return: None
+        """
+        if self.trace_queue is None:
+            return
+        while True:
+            try:
+                self.tracer.collect(self.trace_queue.get_nowait())
+            except EmptyQueue:
+                break
+
+    def _relay(self, msg):
+        """
+        Pass a message on to the host.
+
+        :Parameters:
+            :param msg: the message for the host.
+        :rtype: None
+        :return: None
+        """
+        with span(self.tracer, "relay", "handler"):
+            if self.metrics is not None:
+                msg = self.metrics.relayed(msg)
+            self.handler_to_host_queue.put(msg)
+            if self.wakeup is not None:
+                self.wakeup.notify()
+
+    def _report_end(self, signal):
+        """
+        Tell the host that this handler is ending, and which signal ended it.
+
+        :Parameters:
+            :param str signal: the end signal.
+        :rtype: None
+        :return: None
+        """
+        if self.handler_to_host_control_queue is None:
+            self._relay(signal)
+            return
+        self.handler_to_host_control_queue.put(ControlMessage(CONTROL_ENDED, signal))
+        if self.wakeup is not None:
+            self.wakeup.notify()
+
+    def _kill_process(self):
+        """
+        Handle queue / process cleanup for end-process signals.
+
+        :rtype: None
+        :return: None
+        """
+        if self.handled_process is not None:
+            if self.handler_to_process_queue:
+                self._okay_maybe_some_tears_but_be_quick()
+            else:
+                self._shh_no_more_tears(self.handled_process, self.terminate_grace)
+            self._forget_process()
+
+    def _await_finished_process(self):
+        """
+        Handle process cleanup after the process reported finishing directly to the host.
+
+        :rtype: None
+        :return: None
+        """
+        self._forget_process()
+
+    def _okay_maybe_some_tears_but_be_quick(self):
+        """
+        Close process while allowing for one to-process-queue signal for cleanup.
+
+        :rtype: None
+        :return: None
+        """
+        self.handler_to_process_queue.put(self.kill_signal)
+        self.handler_to_process_queue = None
+        deadline = None if self.kill_grace is None else monotonic() + self.kill_grace
+        # Until the process reports finishing, exits without reporting, or runs out of grace. Messages nobody will
+        # read are discarded without being deserialized.
+        while self._await_message(self.process_queue, None if deadline is None else max(deadline - monotonic(), 0)):
+            if read_is_signal(self.process_queue, self.finished_signal):
+                self._await_exit(deadline)  # Terminating it now could leave a queue's write lock held.
+                break
+        self._collect_trace()  # Unblocks a process still flushing its last spans, before it could be terminated.
+        self._shh_no_more_tears(self.handled_process, self.terminate_grace)
+
+    def _await_exit(self, deadline=None):
+        """
+        Wait for a process which reported finishing to flush its queues and exit by itself, collecting the trace
+        events it is still shipping.
+
+        :Parameters:
+            :param float or None deadline: time.monotonic() after which to stop waiting, or None to wait indefinitely.
+        :rtype: None
+        :return: None
+        """
+        handles = [self.handled_process.sentinel]
+        if self.trace_queue is not None:
+            handles.append(self.trace_queue._reader)
+        while self.handled_process.is_alive():
+            timeout = None if deadline is None else deadline - monotonic()
+            if timeout is not None and timeout <= 0:
+                return
+            if self.trace_queue is not None and self.trace_queue._reader in wait_for_ready(handles, timeout):
+                self._collect_trace()
+
+    @classmethod
+    def _shh_no_more_tears(cls, process, terminate_grace=None):
+        """
+        Close process without queue signal for cleanup, killing it if it survives terminate_grace.
+
+        The queues it populates are not read afterwards, as it may have been terminated part way through writing a
+        message - the host replaces them once the process has ended.
+
+        :Parameters:
+            :param multiprocessing.Process process: the process to be closed.
+            :param float or None terminate_grace: seconds to wait for the terminated process before killing it.
+        :rtype: None
+        :return: None
+        """
+        if process.is_alive():
+            process.terminate()
+            process.join(terminate_grace)
+            if process.is_alive():
+                process.kill()
+                process.join()
+
+
+_worker_state = None  # Set in each WarmPool worker by its initializer.
+
+
+def worker_state():
+    """
+    Return the state created by the WarmPool initializer in the current worker process.
+
+    :rtype: object
+    :return: the initializer's return value, or None outside of a WarmPool worker.
+    """
+    return _worker_state
+
+
+def _initialize_worker(initializer, initargs):
+    """
+    Run a WarmPool initializer in a worker process and keep its return value for worker_state.
+
+    :Parameters:
+        :param function initializer: function / method called once per worker process.
+        :param tuple initargs: positional arguments to be passed to initializer.
+    :rtype: None
+    :return: None
+    """
+    global _worker_state
+    _worker_state = initializer(*initargs)
+
+
+class WarmPool(object):
+    """
+    Long-lived multiprocessing.Pool which many PoolProcessHandler jobs can share.
+
+    Worker processes are started once, so jobs only pay for their own work instead of process startup, imports and
+    teardown. Shut the pool down explicitly, or use it as a context manager.
+    """
+    def __init__(self, pool_size=4, *, initializer=None, initargs=(), max_tasks_per_child=None):
+        """
+        Start the worker processes.
+
+        :Parameters:
+            :param int or None pool_size: number of worker processes.
+            :param function initializer: function / method called once in each worker process; its return value is
+                available to run_targets in that worker through worker_state().
+            :param tuple initargs: positional arguments to be passed to initializer.
+            :param int or None max_tasks_per_child: tasks a worker completes before being replaced, or None to keep
+                workers for the life of the pool.
+        :rtype: None
+        :return: None
+        """
+        self.pool_size = pool_size
+        if initializer is not None:
+            self.pool = Pool(pool_size, _initialize_worker, (initializer, initargs), max_tasks_per_child)
+        else:
+            self.pool = Pool(pool_size, maxtasksperchild=max_tasks_per_child)
+
+    def shutdown(self, *, wait=True):
+        """
+        Stop the worker processes.
+
+        :Parameters:
+            :param bool wait: determines if queued tasks finish before the workers exit, instead of being terminated.
+        :rtype: None
+        :return: None
+        """
+        if wait:
+            self.pool.close()
+        else:
+            self.pool.terminate()
+        self.pool.join()
+
+    def __enter__(self):
+        """Use the pool for the duration of a with block."""
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        """Shut the pool down, terminating outstanding tasks if the with block raised."""
+        self.shutdown(wait=exc_type is None)
+
+
+PartialResults = namedtuple("PartialResults", ("results", "timed_out", "cancelled"))
+PartialResults.__doc__ = """
+Results of a PoolProcessHandler job run with partial_results=True.
+
+:ivar dict results: run_target results by pool_args index, for every task which completed in time.
+:ivar list timed_out: pool_args indices which exceeded task_time_limit or were unfinished at time_limit.
+:ivar list cancelled: pool_args indices which were never scheduled because cancel was called.
+"""
+
+
+class PoolProcessHandler(Thread):
+    """Manages pool'd asynchronous processes."""
+    def __init__(self, run_target, return_queue, pool_args, *, pool_size=4, time_limit=15, warm_pool=None,
+                 stream_results=False,
+                 partial_results=False,
+                 task_time_limit=None,
+                 finished_signal=DONE):
+        """
+        Set runtime attributes for a pooled multiprocessing application.
+
+        :Parameters:
             :param function run_target: function / method to be run asynchronously - called once per pool_arg.
             :param queue.Queue return_queue: queue to return the results of run_target(s).
             :param list pool_args: list of objects to be mapped to run_target instances.
             :param int or None pool_size: number of sub-processes to be mapped to run_target.
             :param int or None time_limit: amount of time to await the results of run_target.
+            :param WarmPool warm_pool: long-lived pool to run on instead of starting and stopping a pool of pool_size
+                for this job. Tasks still running when time_limit expires keep their warm_pool worker busy.
+            :param bool stream_results: determines if each result is put in return_queue as an (index, result) tuple
+                as soon as it completes, in completion order, followed by finished_signal once every result is in or
+                time_limit expires - instead of putting a single list of every result.
+            :param bool partial_results: determines if a PartialResults of every task which completed in time is put
+                in return_queue, instead of None when any task misses time_limit. With stream_results, partial_results
+                or task_time_limit, an exception raised by run_target is returned in place of its result.
+            :param int or None task_time_limit: amount of time to await the result of each run_target call, after
+                which its index is reported as timed out.
+            :param str finished_signal: message put in return_queue after the last streamed result.
         :rtype: None
         :return: None
         """
@@ -467,6 +1968,27 @@ class PoolProcessHandler(Thread):
         self.pool_args = pool_args
         self.time_limit = time_limit
         self.pool_size = pool_size
+        self.warm_pool = warm_pool
+        self.stream_results = stream_results
+        self.partial_results = partial_results
+        self.task_time_limit = task_time_limit
+        self.finished_signal = finished_signal
+        self.timed_out = []
+        self.cancelled = []
+        self._completions = Queue()
+        self._cancel_requested = False
+
+    def cancel(self):
+        """
+        Stop scheduling the remaining pool_args. Tasks already running are still awaited.
+
+        Only effective with stream_results, partial_results or task_time_limit; other jobs are mapped all at once.
+
+        :rtype: None
+        :return: None
+        """
+        self._cancel_requested = True
+        self._completions.put(None)  # Wake the scheduling loop.
 
     def run(self):
         """
@@ -475,10 +1997,108 @@ class PoolProcessHandler(Thread):
         :rtype: None
         :return: None
         """
-        with Pool(self.pool_size) as pool:
-            result = pool.map_async(self.run_target, self.pool_args)
-            try:
-                results_list = result.get(timeout=self.time_limit)
-            except TimesUpPencilsDown:
-                results_list = None
+        if self.stream_results or self.partial_results or self.task_time_limit is not None:
+            run_pool = self._schedule
+        else:
+            run_pool = self._map
+        if self.warm_pool is not None:
+            results_list = run_pool(self.warm_pool.pool, self.warm_pool.pool_size)
+        else:
+            with Pool(self.pool_size) as pool:
+                results_list = run_pool(pool, self.pool_size)
         self.return_queue.put(results_list)
+
+    def _schedule(self, pool, pool_size):
+        """
+        Run tasks one by one, keeping at most pool_size in flight, while enforcing deadlines and cancellation.
+
+        :Parameters:
+            :param multiprocessing.pool.Pool pool: the pool to run on.
+            :param int or None pool_size: number of worker processes in pool.
+        :rtype: str, PartialResults, list or None
+        :return str, PartialResults, list or None: finished_signal to follow streamed results, the collected
+            PartialResults if partial_results is True, otherwise the results in pool_args order, or None if any task
+            timed out or was cancelled.
+        """
+        width = pool_size or cpu_count()
+        deadline = None if self.time_limit is None else monotonic() + self.time_limit
+        pending = deque(enumerate(self.pool_args))
+        in_flight = {}  # pool_args index: time scheduled.
+        results = {}
+        while pending or in_flight:
+            while pending and len(in_flight) < width and not self._cancel_requested:
+                index, arg = pending.popleft()
+                pool.apply_async(self.run_target, (arg,),
+                                 callback=partial(self._complete, index),
+                                 error_callback=partial(self._complete, index))
+                in_flight[index] = monotonic()
+            if not in_flight:
+                break
+            wait_until = deadline
+            if self.task_time_limit is not None:
+                task_deadline = min(in_flight.values()) + self.task_time_limit
+                wait_until = task_deadline if wait_until is None else min(wait_until, task_deadline)
+            try:
+                completion = self._completions.get(timeout=None if wait_until is None
+                                                   else max(wait_until - monotonic(), 0))
+            except EmptyQueue:
+                completion = None
+            if completion is not None and completion[0] in in_flight:
+                index, result = completion
+                del in_flight[index]
+                if self.stream_results:
+                    self.return_queue.put(completion)
+                else:
+                    results[index] = result
+            now = monotonic()
+            if deadline is not None and now >= deadline:
+                self.timed_out.extend(in_flight)
+                self.timed_out.extend(index for index, _ in pending)
+                pending.clear()
+                break
+            if self.task_time_limit is not None:
+                for index, scheduled in list(in_flight.items()):
+                    if now - scheduled >= self.task_time_limit:
+                        del in_flight[index]
+                        self.timed_out.append(index)
+                        width -= 1  # Its worker stays busy until the task returns.
+                if width <= 0:
+                    self.timed_out.extend(index for index, _ in pending)
+                    pending.clear()
+        self.cancelled = [index for index, _ in pending]
+        if self.stream_results:
+            return self.finished_signal
+        if self.partial_results:
+            return PartialResults(results, self.timed_out, self.cancelled)
+        if self.timed_out or self.cancelled:
+            return None
+        return [results[index] for index in range(len(self.pool_args))]
+
+    def _complete(self, index, result):
+        """
+        Record a finished task. Called from the pool's result thread.
+
+        :Parameters:
+            :param int index: the pool_args index of the task.
+            :param result: the task's result, or the exception it raised.
+        :rtype: None
+        :return: None
+        """
+        self._completions.put((index, result))
+
+    def _map(self, pool, pool_size):
+        """
+        Map run_target over pool_args using pool.
+
+        :Parameters:
+            :param multiprocessing.pool.Pool pool: the pool to run on.
+            :param int or None pool_size: number of worker processes in pool.
+        :rtype: list or None
+        :return list or None results_list: results in pool_args order, or None if time_limit expired.
+        """
+        result = pool.map_async(self.run_target, self.pool_args)
+        try:
+            results_list = result.get(timeout=self.time_limit)
+        except TimesUpPencilsDown:
+            results_list = None
+        return results_list
@@ -0,0 +1,445 @@
+"""Live statistics for hosts, handlers and their processes, readable in-process or exported in Prometheus format."""
+from bisect import bisect_left
+from collections import deque
+from threading import Lock, Thread
+from time import monotonic
+try:
+    from .channels import TimedMessage, payload_size
+except ImportError:  # Imported as a top-level module, with the package directory on sys.path.
+    from channels import TimedMessage, payload_size
+
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)  # Seconds.
+
+
+class Counter(object):
+    """Monotonically increasing count."""
+    kind = "counter"
+
+    def __init__(self):
+        """
+        Start the count at zero.
+
+        :rtype: None
+        :return: None
+        """
+        self._lock = Lock()
+        self.value = 0
+
+    def inc(self, amount=1):
+        """
+        Increase the count.
+
+        :Parameters:
+            :param int or float amount: how much to add.
+        :rtype: None
+        :return: None
+        """
+        with self._lock:
+            self.value += amount
+
+    def samples(self):
+        """
+        Return the exported samples.
+
+        :rtype: list of tuple
+        :return list of tuple: (name suffix, extra labels, value) for each sample.
+        """
+        return [("_total", (), self.value)]
+
+
+class Gauge(object):
+    """Value which goes up and down, remembering the highest value it has been set to."""
+    kind = "gauge"
+
+    def __init__(self):
+        """
+        Start the value and high-water mark at zero.
+
+        :rtype: None
+        :return: None
+        """
+        self.value = 0
+        self.high_water = 0
+
+    def set(self, value):
+        """
+        Replace the value.
+
+        :Parameters:
+            :param int or float value: the new value.
+        :rtype: None
+        :return: None
+        """
+        self.value = value
+        if value > self.high_water:
+            self.high_water = value
+
+    def samples(self):
+        """
+        Return the exported samples.
+
+        :rtype: list of tuple
+        :return list of tuple: (name suffix, extra labels, value) for each sample.
+        """
+        return [("", (), self.value), ("_high_water", (), self.high_water)]
+
+
+class Rate(Gauge):
+    """Gauge of events per second over a sliding window, such as frames per second."""
+    def __init__(self, window=1.0):
+        """
+        Create the empty window.
+
+        :Parameters:
+            :param float window: seconds of events the rate is measured over.
+        :rtype: None
+        :return: None
+        """
+        Gauge.__init__(self)
+        self.window = window
+        self._events = deque()  # (time, count).
+        self._count = 0
+
+    def mark(self, count=1, now=None):
+        """
+        Record events and update the rate.
+
+        :Parameters:
+            :param int count: number of events.
+            :param float or None now: time.monotonic() of the events, defaulting to the current time.
+        :rtype: None
+        :return: None
+        """
+        now = monotonic() if now is None else now
+        self._events.append((now, count))
+        self._count += count
+        while self._events and self._events[0][0] < now - self.window:
+            self._count -= self._events.popleft()[1]
+        self.set(self._count / self.window)
+
+
+class Histogram(object):
+    """Distribution of observed values in cumulative buckets, as Prometheus histograms are."""
+    kind = "histogram"
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        """
+        Create the empty buckets.
+
+        :Parameters:
+            :param tuple of float buckets: ascending upper bounds; an unbounded bucket is added after the last.
+        :rtype: None
+        :return: None
+        """
+        self._lock = Lock()
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        """
+        Record a value.
+
+        :Parameters:
+            :param float value: the observed value.
+        :rtype: None
+        :return: None
+        """
+        with self._lock:
+            self.counts[bisect_left(self.buckets, value)] += 1
+            self.count += 1
+            self.sum += value
+
+    def quantile(self, fraction):
+        """
+        Estimate a quantile from the buckets, interpolating within the bucket which holds it.
+
+        :Parameters:
+            :param float fraction: the quantile as a fraction, e.g. 0.99.
+        :rtype: float or None
+        :return float or None: the estimate, or None before any value is observed. Values in the unbounded bucket are
+            reported as the last bound.
+        """
+        if not self.count:
+            return None
+        rank = fraction * self.count
+        seen = 0
+        lower = 0.0
+        for upper, in_bucket in zip(self.buckets, self.counts):
+            if in_bucket and seen + in_bucket >= rank:
+                return lower + (upper - lower) * (rank - seen) / in_bucket
+            seen += in_bucket
+            lower = upper
+        return self.buckets[-1]
+
+    def samples(self):
+        """
+        Return the exported samples.
+
+        :rtype: list of tuple
+        :return list of tuple: (name suffix, extra labels, value) for each sample.
+        """
+        samples = []
+        cumulative = 0
+        for upper, in_bucket in zip(self.buckets + ("+Inf",), self.counts):
+            cumulative += in_bucket
+            samples.append(("_bucket", (("le", str(upper)),), cumulative))
+        samples.append(("_count", (), self.count))
+        samples.append(("_sum", (), self.sum))
+        return samples
+
+
+class MetricsRegistry(object):
+    """
+    Named, labelled metrics shared by any number of hosts and handlers in one process.
+
+    Metrics are created on first request and returned again for the same name and labels, so instrumented objects
+    simply ask for what they record into.
+    """
+    def __init__(self, prefix="shole_"):
+        """
+        Create the empty registry.
+
+        :Parameters:
+            :param str prefix: prepended to every metric name.
+        :rtype: None
+        :return: None
+        """
+        self.prefix = prefix
+        self._lock = Lock()
+        self._metrics = {}  # (name, labels): metric.
+        self._help = {}
+
+    def _get(self, metric_class, name, documentation, labels, *args):
+        """
+        Return the metric with this name and labels, creating it if needed.
+
+        :Parameters:
+            :param type metric_class: Counter, Gauge, Rate or Histogram.
+            :param str name: metric name, without the registry prefix.
+            :param str documentation: help text for the metric name.
+            :param dict labels: label names and values.
+            :param args: positional arguments for metric_class.
+        :rtype: object
+        :return: the metric.
+        """
+        key = (self.prefix + name, tuple(sorted(labels.items())))
+        with self._lock:
+            metric = self._metrics.get(key)
+            if metric is None:
+                metric = self._metrics[key] = metric_class(*args)
+                self._help.setdefault(key[0], documentation)
+            return metric
+
+    def counter(self, name, documentation="", **labels):
+        """Return the Counter with this name and labels."""
+        return self._get(Counter, name, documentation, labels)
+
+    def gauge(self, name, documentation="", **labels):
+        """Return the Gauge with this name and labels."""
+        return self._get(Gauge, name, documentation, labels)
+
+    def rate(self, name, documentation="", window=1.0, **labels):
+        """Return the Rate with this name and labels."""
+        return self._get(Rate, name, documentation, labels, window)
+
+    def histogram(self, name, documentation="", buckets=LATENCY_BUCKETS, **labels):
+        """Return the Histogram with this name and labels."""
+        return self._get(Histogram, name, documentation, labels, buckets)
+
+    def snapshot(self):
+        """
+        Read every metric in-process.
+
+        :rtype: dict
+        :return dict: {(name, labels): value} - the value for counters, (value, high_water) for gauges and
+            {"count", "sum", "p50", "p99"} for histograms.
+        """
+        with self._lock:
+            metrics = list(self._metrics.items())
+        snapshot = {}
+        for key, metric in metrics:
+            if metric.kind == "histogram":
+                snapshot[key] = {"count": metric.count, "sum": metric.sum,
+                                 "p50": metric.quantile(0.5), "p99": metric.quantile(0.99)}
+            elif metric.kind == "gauge":
+                snapshot[key] = (metric.value, metric.high_water)
+            else:
+                snapshot[key] = metric.value
+        return snapshot
+
+    def to_prometheus(self):
+        """
+        Render every metric in the Prometheus text exposition format.
+
+        :rtype: str
+        :return str: the exposition.
+        """
+        with self._lock:
+            metrics = sorted(self._metrics.items(), key=lambda item: item[0])
+        families = {}  # Sample family name: (name, kind, lines), in first-seen order.
+        for (name, labels), metric in metrics:
+            for suffix, extra_labels, value in metric.samples():
+                family = name if metric.kind == "histogram" else name + suffix
+                if family not in families:
+                    families[family] = (name, metric.kind, [])
+                rendered = ",".join('{}="{}"'.format(label, str(label_value).replace('"', '\\"'))
+                                    for label, label_value in labels + extra_labels)
+                families[family][2].append("{}{}{} {}".format(name, suffix, "{" + rendered + "}" if rendered else "",
+                                                              value))
+        lines = []
+        for family, (name, kind, samples) in families.items():
+            if self._help.get(name):
+                lines.append("# HELP {} {}".format(family, self._help[name]))
+            lines.append("# TYPE {} {}".format(family, kind))
+            lines.extend(samples)
+        return "\n".join(lines) + "\n"
+
+    def serve(self, port=9464, address="127.0.0.1"):
+        """
+        Serve to_prometheus over HTTP from a daemon thread.
+
+        :Parameters:
+            :param int port: port to listen on, or 0 for any free port.
+            :param str address: address to listen on - local only by default.
+        :rtype: http.server.HTTPServer
+        :return http.server.HTTPServer: the running threading server; call shutdown to stop it.
+        """
+        from http.server import BaseHTTPRequestHandler, HTTPServer  # Only serving registries pay for it.
+        from socketserver import ThreadingMixIn  # http.server.ThreadingHTTPServer is Python 3.7+.
+        registry = self
+
+        class _MetricsRequestHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                body = registry.to_prometheus().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *_):
+                pass
+
+        class _ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+            daemon_threads = True
+
+        server = _ThreadingHTTPServer((address, port), _MetricsRequestHandler)
+        Thread(target=server.serve_forever, name="MetricsServer", daemon=True).start()
+        return server
+
+
+class HostMetrics(object):
+    """The metrics recorded by one ProcessHost and its SingleProcessHandler, labelled with the host's name."""
+    def __init__(self, registry, host_name):
+        """
+        Create or look up the host's metrics.
+
+        :Parameters:
+            :param MetricsRegistry registry: the registry to record into.
+            :param str host_name: value of the host label.
+        :rtype: None
+        :return: None
+        """
+        self.registry = registry
+        self.host_name = host_name
+        self.relayed_messages = registry.counter("relayed_messages", "Messages relayed by the handler.", host=host_name)
+        self.relayed_bytes = registry.counter("relayed_bytes", "Payload bytes relayed by the handler.", host=host_name)
+        self.delivered_messages = registry.counter("delivered_messages", "Data messages passed to the callbacks.",
+                                                   host=host_name)
+        self.delivered_bytes = registry.counter("delivered_bytes", "Payload bytes passed to the callbacks.",
+                                                host=host_name)
+        self.skipped_messages = registry.counter("skipped_messages",
+                                                 "Timestamped messages which were sent but never delivered.",
+                                                 host=host_name)
+        self.dropped_messages = registry.gauge("dropped_messages", "Messages discarded by bounded queue policies.",
+                                               host=host_name)
+        self.callback_seconds = registry.histogram("callback_seconds", "Time spent in message and batch callbacks.",
+                                                   host=host_name)
+        self.capture_rate = registry.rate("capture_fps", "Timestamped messages sent by the process per second.",
+                                          host=host_name)
+        self.delivery_rate = registry.rate("delivered_fps", "Data messages passed to the callbacks per second.",
+                                           host=host_name)
+        self._hops = {}
+        self._depths = {}
+        self._last_sequence = None
+
+    def hop(self, hop_name):
+        """
+        Return the latency histogram for one hop.
+
+        :Parameters:
+            :param str hop_name: "process_to_handler", "handler_to_host" or "end_to_end".
+        :rtype: Histogram
+        :return Histogram: the hop's latency histogram, in seconds.
+        """
+        histogram = self._hops.get(hop_name)
+        if histogram is None:
+            histogram = self._hops[hop_name] = self.registry.histogram(
+                "hop_latency_seconds", "Time messages take between two points on their way to the callbacks.",
+                host=self.host_name, hop=hop_name)
+        return histogram
+
+    def queue_depth(self, queue_name, queue):
+        """
+        Record how many messages a queue holds, if the queue can tell.
+
+        :Parameters:
+            :param str queue_name: value of the queue label.
+            :param queue: queue.Queue, multiprocessing.Queue or compatible object.
+        :rtype: None
+        :return: None
+        """
+        try:
+            depth = queue.qsize()
+        except (AttributeError, NotImplementedError):  # multiprocessing.Queue on macOS, or a pipe-only channel.
+            return
+        gauge = self._depths.get(queue_name)
+        if gauge is None:
+            gauge = self._depths[queue_name] = self.registry.gauge("queue_depth", "Messages waiting in a queue.",
+                                                                   host=self.host_name, queue=queue_name)
+        gauge.set(depth)
+
+    def relayed(self, msg):
+        """
+        Record a message relayed by the handler, stamping it if it is timestamped. Called from the handler thread.
+
+        :Parameters:
+            :param msg: the message being relayed.
+        :rtype: object
+        :return msg: the message to relay in its place.
+        """
+        if msg.__class__ is TimedMessage:
+            now = monotonic()
+            self.hop("process_to_handler").observe(now - msg.put_at)
+            self.relayed_messages.inc()
+            self.relayed_bytes.inc(payload_size(msg.payload))
+            return msg._replace(relayed_at=now)
+        self.relayed_messages.inc()
+        self.relayed_bytes.inc(payload_size(msg))
+        return msg
+
+    def delivering(self, msg):
+        """
+        Record a data message about to be passed to the callbacks, unwrapping it if it is timestamped.
+
+        :Parameters:
+            :param msg: the message from the host's queues.
+        :rtype: object
+        :return msg: the payload to deliver.
+        """
+        now = monotonic()
+        if msg.__class__ is TimedMessage:
+            if msg.relayed_at is not None:
+                self.hop("handler_to_host").observe(now - msg.relayed_at)
+            self.hop("end_to_end").observe(now - msg.put_at)
+            if self._last_sequence is not None and msg.sequence > self._last_sequence:
+                self.capture_rate.mark(msg.sequence - self._last_sequence, now)
+                self.skipped_messages.inc(msg.sequence - self._last_sequence - 1)
+            self._last_sequence = msg.sequence
+            msg = msg.payload
+        self.delivered_messages.inc()
+        self.delivered_bytes.inc(payload_size(msg))
+        self.delivery_rate.mark(1, now)
+        return msg
@@ -0,0 +1,558 @@
+"""Headless stand-ins for a Tkinter root, for running hosts on servers and in tests, and frame pacing."""
+import selectors
+import traceback
+from collections import deque, namedtuple
+from heapq import heappush, heappop
+from itertools import count
+from threading import Lock, Thread, current_thread
+from time import monotonic, sleep
+try:
+    from .channels import WakeupPipe
+except ImportError:  # Imported as a top-level module, with the package directory on sys.path.
+    from channels import WakeupPipe
+
+PacingReport = namedtuple("PacingReport", ("target_fps", "achieved_fps", "frames", "skipped"))  # From FramePacer.
+
+
+class ScheduledCall(object):
+    """Handle for a callback scheduled with after, which can cancel it."""
+    __slots__ = ("when", "callback", "args", "cancelled")
+
+    def __init__(self, when, callback, args):
+        """
+        Record the scheduled callback.
+
+        :Parameters:
+            :param float when: scheduler time in seconds at which the callback runs.
+            :param function callback: function / method to be called.
+            :param tuple args: positional arguments to be passed to callback.
+        :rtype: None
+        :return: None
+        """
+        self.when = when
+        self.callback = callback
+        self.args = args
+        self.cancelled = False
+
+    def cancel(self):
+        """
+        Stop the callback from running, if it has not run already.
+
+        :rtype: None
+        :return: None
+        """
+        self.cancelled = True
+
+
+class _Scheduler(object):
+    """Heap of ScheduledCalls ordered by time, then by scheduling order. Subclasses supply the clock as time()."""
+    def __init__(self):
+        """
+        Create the empty schedule.
+
+        :rtype: None
+        :return: None
+        """
+        self._calls = []
+        self._order = count()
+        self._readers = {}
+
+    def after(self, delay, callback, *args):
+        """
+        Schedule a callback after delay milliseconds.
+
+        :Parameters:
+            :param float delay: milliseconds to wait - fractions of a millisecond are honoured.
+            :param function callback: function / method to be called.
+            :param args: positional arguments to be passed to callback.
+        :rtype: ScheduledCall
+        :return ScheduledCall: handle which can cancel the callback.
+        """
+        call = ScheduledCall(self.time() + max(delay, 0) / 1000, callback, args)
+        heappush(self._calls, (call.when, next(self._order), call))
+        return call
+
+    def after_idle(self, callback, *args):
+        """
+        Schedule a callback as soon as possible.
+
+        :Parameters:
+            :param function callback: function / method to be called.
+            :param args: positional arguments to be passed to callback.
+        :rtype: ScheduledCall
+        :return ScheduledCall: handle which can cancel the callback.
+        """
+        return self.after(0, callback, *args)
+
+    @staticmethod
+    def after_cancel(call):
+        """
+        Cancel a scheduled callback, as Tkinter's after_cancel does.
+
+        :Parameters:
+            :param ScheduledCall call: handle returned by after.
+        :rtype: None
+        :return: None
+        """
+        call.cancel()
+
+    def _pop_due(self, now):
+        """
+        Remove and return the earliest call due by now, skipping cancelled calls.
+
+        :Parameters:
+            :param float now: scheduler time in seconds.
+        :rtype: ScheduledCall or None
+        :return ScheduledCall or None: the due call, or None if nothing is due.
+        """
+        while self._calls and self._calls[0][0] <= now:
+            call = heappop(self._calls)[2]
+            if not call.cancelled:
+                return call
+        return None
+
+    def _next_when(self):
+        """
+        Return the time of the earliest pending call, discarding cancelled calls at the front of the heap.
+
+        :rtype: float or None
+        :return float or None: scheduler time in seconds, or None if nothing is scheduled.
+        """
+        while self._calls and self._calls[0][2].cancelled:
+            heappop(self._calls)
+        return self._calls[0][0] if self._calls else None
+
+    @staticmethod
+    def _invoke(callback, args=()):
+        """
+        Run a callback, reporting rather than propagating its exceptions, as Tkinter does.
+
+        :Parameters:
+            :param function callback: function / method to be called.
+            :param tuple args: positional arguments to be passed to callback.
+        :rtype: None
+        :return: None
+        """
+        try:
+            callback(*args)
+        except Exception:
+            traceback.print_exc()
+
+
+class HeadlessRoot(_Scheduler):
+    """
+    Runs after callbacks and add_reader callbacks on one scheduler thread, in place of a Tkinter root.
+
+    Pass the same instance to any number of hosts as their root; every callback of every host runs on this thread,
+    one at a time. Waits are made in a selector, so file descriptors registered with add_reader (as event_driven hosts
+    do) wake the thread immediately. Waits shorter than spin_threshold are slept instead, as selectors only time out
+    to the millisecond.
+
+    :cvar float spin_threshold: seconds below which a wait is slept instead of selected.
+    """
+    spin_threshold = 0.002
+    _shared = None
+    _shared_lock = Lock()
+
+    def __init__(self, name="HeadlessRoot"):
+        """
+        Start the scheduler thread.
+
+        :Parameters:
+            :param str name: name of the scheduler thread.
+        :rtype: None
+        :return: None
+        """
+        _Scheduler.__init__(self)
+        self._lock = Lock()
+        self._wakeup = WakeupPipe()
+        self._selector = selectors.DefaultSelector()
+        self._selector.register(self._wakeup.fileno(), selectors.EVENT_READ)
+        self._running = True
+        self._thread = Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+
+    @classmethod
+    def shared(cls):
+        """
+        Return the process-wide HeadlessRoot, starting it on first use.
+
+        :rtype: HeadlessRoot
+        :return HeadlessRoot: the shared scheduler.
+        """
+        with cls._shared_lock:
+            if cls._shared is None or not cls._shared.is_running:
+                cls._shared = cls()
+            return cls._shared
+
+    @property
+    def is_running(self):
+        """
+        Determine if the scheduler thread is still running callbacks.
+
+        :rtype: bool
+        :return bool: False once close has been called.
+        """
+        return self._running
+
+    def time(self):
+        """
+        Return the scheduler's current time.
+
+        :rtype: float
+        :return float: time.monotonic().
+        """
+        return monotonic()
+
+    def after(self, delay, callback, *args):
+        """
+        Schedule a callback after delay milliseconds. Safe to call from any thread.
+
+        :Parameters:
+            :param float delay: milliseconds to wait - fractions of a millisecond are honoured.
+            :param function callback: function / method to be called.
+            :param args: positional arguments to be passed to callback.
+        :rtype: ScheduledCall
+        :return ScheduledCall: handle which can cancel the callback.
+        """
+        with self._lock:
+            call = _Scheduler.after(self, delay, callback, *args)
+            earliest = self._calls[0][2] is call
+        if earliest and current_thread() is not self._thread:
+            self._wakeup.notify()
+        return call
+
+    def add_reader(self, fd, callback):
+        """
+        Call callback on the scheduler thread whenever fd is readable. Safe to call from any thread.
+
+        :Parameters:
+            :param int fd: file descriptor to be watched.
+            :param function callback: function / method to be called.
+        :rtype: None
+        :return: None
+        """
+        with self._lock:
+            if fd in self._readers:
+                self._selector.modify(fd, selectors.EVENT_READ, callback)
+            else:
+                self._selector.register(fd, selectors.EVENT_READ, callback)
+            self._readers[fd] = callback
+        self._wakeup.notify()
+
+    def remove_reader(self, fd):
+        """
+        Stop watching fd. Safe to call from any thread.
+
+        :Parameters:
+            :param int fd: file descriptor to stop watching.
+        :rtype: None
+        :return: None
+        """
+        with self._lock:
+            if self._readers.pop(fd, None) is not None:
+                self._selector.unregister(fd)
+
+    def _run(self):
+        """
+        Wait for the next due call or readable file descriptor and run its callback, until closed.
+
+        :rtype: None
+        :return: None
+        """
+        while self._running:
+            with self._lock:
+                when = self._next_when()
+            timeout = None if when is None else max(when - monotonic(), 0)
+            if timeout is not None and timeout < self.spin_threshold:
+                events = self._selector.select(0)
+                if not events and timeout:
+                    sleep(timeout)
+            else:
+                events = self._selector.select(timeout)
+            for key, _ in events:
+                if key.data is None:
+                    self._wakeup.clear()
+                elif key.fd in self._readers:  # Not removed by an earlier callback.
+                    self._invoke(key.data)
+            while self._running:
+                with self._lock:
+                    call = self._pop_due(monotonic())
+                if call is None:
+                    break
+                self._invoke(call.callback, call.args)
+
+    def close(self):
+        """
+        Stop the scheduler thread, dropping any callbacks which have not run.
+
+        :rtype: None
+        :return: None
+        """
+        if not self._running:
+            return
+        self._running = False
+        self._wakeup.notify()
+        if current_thread() is not self._thread:
+            self._thread.join()
+        self._selector.close()
+        self._wakeup.close()
+
+    def __enter__(self):
+        """Use the scheduler for the duration of a with block."""
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback_):
+        """Stop the scheduler thread."""
+        self.close()
+
+
+class VirtualRoot(_Scheduler):
+    """
+    Runs after callbacks on a virtual clock, in place of a Tkinter root, so timing-sensitive tests run fast and in a
+    deterministic order.
+
+    Nothing runs until advance or run_until is called from the test; the clock then jumps straight to each due call.
+    File descriptors registered with add_reader are polled, without waiting, before every call.
+    """
+    def __init__(self, start=0.0):
+        """
+        Set the virtual clock.
+
+        :Parameters:
+            :param float start: initial clock value in seconds.
+        :rtype: None
+        :return: None
+        """
+        _Scheduler.__init__(self)
+        self.now = start
+        self._selector = selectors.DefaultSelector()
+
+    def time(self):
+        """
+        Return the virtual time.
+
+        :rtype: float
+        :return float: seconds on the virtual clock.
+        """
+        return self.now
+
+    def add_reader(self, fd, callback):
+        """
+        Call callback whenever fd is found readable while the clock advances.
+
+        :Parameters:
+            :param int fd: file descriptor to be watched.
+            :param function callback: function / method to be called.
+        :rtype: None
+        :return: None
+        """
+        if fd in self._readers:
+            self._selector.modify(fd, selectors.EVENT_READ, callback)
+        else:
+            self._selector.register(fd, selectors.EVENT_READ, callback)
+        self._readers[fd] = callback
+
+    def remove_reader(self, fd):
+        """
+        Stop watching fd.
+
+        :Parameters:
+            :param int fd: file descriptor to stop watching.
+        :rtype: None
+        :return: None
+        """
+        if self._readers.pop(fd, None) is not None:
+            self._selector.unregister(fd)
+
+    def _poll_readers(self):
+        """
+        Run the callback of every readable registered file descriptor.
+
+        :rtype: None
+        :return: None
+        """
+        if self._readers:
+            for key, _ in self._selector.select(0):
+                if key.fd in self._readers:
+                    self._invoke(key.data)
+
+    def step(self):
+        """
+        Advance the clock to the next scheduled call and run it.
+
+        :rtype: bool
+        :return bool: False if nothing was scheduled.
+        """
+        self._poll_readers()
+        when = self._next_when()
+        if when is None:
+            return False
+        self.now = max(self.now, when)
+        call = self._pop_due(self.now)
+        self._invoke(call.callback, call.args)
+        return True
+
+    def advance(self, delay):
+        """
+        Run every call due within delay milliseconds, in order, then leave the clock delay milliseconds later.
+
+        :Parameters:
+            :param float delay: milliseconds to advance the clock by.
+        :rtype: None
+        :return: None
+        """
+        target = self.now + delay / 1000
+        while True:
+            when = self._next_when()
+            if when is None or when > target:
+                break
+            self.step()
+        self._poll_readers()
+        self.now = target
+
+    def run_until(self, finished, max_steps=100000):
+        """
+        Run scheduled calls in order until finished returns True or nothing is left to run.
+
+        :Parameters:
+            :param function finished: called before each call; returns True to stop.
+            :param int max_steps: most calls to run, as recurring checks never leave the schedule empty.
+        :rtype: bool
+        :return bool: the last value returned by finished.
+        """
+        for _ in range(max_steps):
+            if finished():
+                return True
+            if not self.step():
+                break
+        return bool(finished())
+
+    def close(self):
+        """
+        Drop every scheduled call and watched file descriptor.
+
+        :rtype: None
+        :return: None
+        """
+        self._calls = []
+        self._readers = {}
+        self._selector.close()
+
+
+class FramePacer(object):
+    """
+    Paces a frame loop to absolute deadlines on the monotonic clock, so that time spent on each frame does not add to
+    the period.
+
+    Each wait sleeps until the deadline one interval after the last. A frame which overruns its deadline by less than
+    an interval starts immediately; deadlines missed entirely are skipped, rather than caught up on in a burst, so lag
+    never accumulates and frames stay in phase with the original schedule.
+    """
+    def __init__(self, interval, *, window=120, clock=monotonic, sleeper=sleep):
+        """
+        Set the target period.
+
+        :Parameters:
+            :param float interval: target seconds per frame, or 0 to never sleep.
+            :param int window: number of recent frames achieved_fps is measured over.
+            :param function clock: returns the current time in seconds.
+            :param function sleeper: sleeps for the given seconds.
+        :rtype: None
+        :return: None
+        """
+        self.interval = interval
+        self.clock = clock
+        self.sleeper = sleeper
+        self.frames = 0
+        self.skipped = 0
+        self._deadline = None
+        self._frame_times = deque(maxlen=window)
+
+    def start(self):
+        """
+        Anchor the schedule to now, for a loop which is about to start its first frame.
+
+        :rtype: None
+        :return: None
+        """
+        self._deadline = self.clock()
+        self._frame_times.clear()
+        self._frame_times.append(self._deadline)
+
+    def wait(self):
+        """
+        Finish a frame: sleep until the next deadline, skipping any deadlines which have already passed.
+
+        :rtype: int
+        :return int: the number of deadlines skipped.
+        """
+        now = self.clock()
+        if self._deadline is None:
+            self._deadline = now
+        self._deadline += self.interval
+        missed = 0
+        if self.interval > 0 and now - self._deadline >= self.interval:
+            missed = int((now - self._deadline) // self.interval)
+            self._deadline += missed * self.interval
+            self.skipped += missed
+        if self._deadline > now:
+            self.sleeper(self._deadline - now)
+        self._count_frame(max(now, self._deadline))
+        return missed
+
+    def mark(self):
+        """
+        Finish a frame which was paced by something else, such as a blocking camera read, without sleeping. The
+        schedule is re-anchored to now, so a following wait keeps the target period.
+
+        :rtype: None
+        :return: None
+        """
+        now = self.clock()
+        self._deadline = now
+        self._count_frame(now)
+
+    def _count_frame(self, started):
+        """
+        Record the time the next frame starts.
+
+        :Parameters:
+            :param float started: clock time in seconds.
+        :rtype: None
+        :return: None
+        """
+        self.frames += 1
+        self._frame_times.append(started)
+
+    @property
+    def target_fps(self):
+        """
+        Return the frame rate the interval asks for.
+
+        :rtype: float or None
+        :return float or None: frames per second, or None if the interval is 0.
+        """
+        return 1 / self.interval if self.interval > 0 else None
+
+    @property
+    def achieved_fps(self):
+        """
+        Return the frame rate over the last window frames.
+
+        :rtype: float or None
+        :return float or None: frames per second, or None until two frames have finished.
+        """
+        if len(self._frame_times) < 2:
+            return None
+        elapsed = self._frame_times[-1] - self._frame_times[0]
+        return (len(self._frame_times) - 1) / elapsed if elapsed > 0 else None
+
+    def report(self):
+        """
+        Return the target and achieved frame rates, with the frame and skip counts.
+
+        :rtype: PacingReport
+        :return PacingReport: the current pacing.
+        """
+        return PacingReport(self.target_fps, self.achieved_fps, self.frames, self.skipped)
@@ -1,2 +1,4 @@
 from .example_cam_and_ui import run_example_cam
+from .import_time import measure_import, check_manager_imports
+from .benchmarks import run_suite
 name = "sholetests"
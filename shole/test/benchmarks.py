@@ -0,0 +1,557 @@
+"""Headless throughput and latency benchmarks for the managers and the SyncCam pipeline, using synthetic payloads."""
+import argparse
+import json
+import os
+import struct
+import sys
+from multiprocessing import Queue as MultiQueue
+from queue import Queue
+from queue import Empty as EmptyQueue
+from threading import Event
+from time import monotonic, sleep
+PACKAGE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if PACKAGE_DIR not in sys.path:
+    sys.path.insert(0, PACKAGE_DIR)
+
+from channels import OutOfBandSerializer, FrameRing, FrameCodec
+from constants import DONE, KILL, QURY, SRCE, FRAME_PNG, PACE_CAMERA
+from managers import ProcessHost, GreedyProcessHost, SingleProcessHandler, PoolProcessHandler
+from schedulers import HeadlessRoot
+
+PAYLOADS = {"signal": None,  # A short string.
+            "1KiB": 1024,
+            "64KiB": 64 * 1024,
+            "VGA": (480, 640, 3),
+            "1080p": (1080, 1920, 3),
+            "4K": (2160, 3840, 3)}
+MODES = {"queue": {},
+         "direct": {"direct_delivery": True},
+         "event": {"direct_delivery": True, "event_driven": True},
+         "serialized": {"direct_delivery": True, "serializer": OutOfBandSerializer()},
+         "conflate": {"conflate": True},  # GreedyProcessHost only.
+         "ring": {"frame_ring": lambda shape: FrameRing(shape)},  # SyncCam only. Factories are called per run.
+         "codec": {"frame_codec": lambda shape: FrameCodec(FRAME_PNG)},  # SyncCam only; lossless, so stamps survive.
+         "grab": {"grab_thread": True}}  # SyncCam only.
+CAMERA_ONLY_MODES = ("ring", "codec", "grab")
+MANAGERS = ("ProcessHost", "GreedyProcessHost", "SingleProcessHandler", "PoolProcessHandler", "SyncCam")
+
+
+class FeedFinished(Exception):
+    """Raised by FakeVideoCapture once it has captured every frame, ending SyncCam.get_feed."""
+
+
+class FakeVideoCapture(object):
+    """
+    Stands in for cv2.VideoCapture in SyncCam: captures count synthetic frames at rate per second, blocking between
+    frames as a camera does, and stamps each with the time it was captured. Frames grabbed over by a FrameGrabber
+    are dropped, as with a real camera.
+    """
+    def __init__(self, payload_name, count, rate):
+        """
+        Prepare the synthetic camera.
+
+        :Parameters:
+            :param str payload_name: key of PAYLOADS with a frame shape.
+            :param int count: number of frames captured before the feed ends.
+            :param float rate: frames captured per second, or 0 to capture as fast as possible.
+        :rtype: None
+        :return: None
+        """
+        self.frame = make_payload(payload_name)
+        self.count = count
+        self.interval = 1 / rate if rate else 0
+        self.captured = 0
+        self.captured_at = None
+        self._retrieved = 0
+        self._next_capture = monotonic()
+
+    def grab(self):
+        """
+        Wait for the next frame and capture it. Once count frames have been captured, wait without capturing.
+
+        :rtype: bool
+        :return bool: True, as the synthetic camera never fails.
+        """
+        if self.interval:
+            delay = self._next_capture - monotonic()
+            if delay > 0:
+                sleep(delay)
+            self._next_capture = max(self._next_capture + self.interval, monotonic())
+        if self.captured >= self.count:
+            sleep(self.interval or 0.001)  # Keep a FrameGrabber from spinning until retrieve ends the feed.
+            return True
+        self.captured += 1
+        self.captured_at = monotonic()
+        return True
+
+    def retrieve(self):
+        """
+        Return a copy of the frame, as decoding a real capture does, stamped with its capture time.
+
+        :rtype: tuple of bool, numpy.array
+        :return: True and the frame.
+        :raises FeedFinished: once count frames have been captured and the last one has been retrieved.
+        """
+        if self.captured >= self.count and self._retrieved == self.captured:
+            raise FeedFinished
+        self._retrieved = self.captured
+        frame = self.frame.copy()
+        stamp_frame(frame, self.captured_at)
+        return True, frame
+
+    def read(self):
+        """
+        Grab and retrieve the next frame.
+
+        :rtype: tuple of bool, numpy.array
+        :return: True and the frame.
+        :raises FeedFinished: once count frames have been captured and the last one has been retrieved.
+        """
+        self.grab()
+        return self.retrieve()
+
+    def set(self, *_):
+        """Ignore capture properties, as some cv2 backends do."""
+        return False
+
+    def get(self, *_):
+        """Report capture properties as unknown."""
+        return 0.0
+
+    def isOpened(self):
+        """Report the synthetic camera as open."""
+        return True
+
+    def release(self):
+        """Nothing to release."""
+
+
+def stamp_frame(frame, captured_at):
+    """
+    Write a capture time into the first eight bytes of a frame.
+
+    :Parameters:
+        :param numpy.array frame: contiguous frame to be stamped.
+        :param float captured_at: time.monotonic() when the frame was captured.
+    :rtype: None
+    :return: None
+    """
+    frame.reshape(-1)[:8] = bytearray(struct.pack("d", captured_at))
+
+
+def frame_stamp(frame):
+    """
+    Read the capture time written by stamp_frame.
+
+    :Parameters:
+        :param numpy.array frame: the stamped frame.
+    :rtype: float
+    :return float: time.monotonic() when the frame was captured.
+    """
+    return struct.unpack("d", frame.reshape(-1)[:8].tobytes())[0]
+
+
+def make_payload(payload_name):
+    """
+    Create a synthetic payload - a numpy frame for frame sizes when numpy is installed, otherwise bytes.
+
+    :Parameters:
+        :param str payload_name: key of PAYLOADS.
+    :rtype: str, bytearray or numpy.array
+    :return: the payload.
+    """
+    size = PAYLOADS[payload_name]
+    if size is None:
+        return "synthetic"
+    if isinstance(size, tuple):
+        try:
+            import numpy as np
+        except ImportError:
+            return bytearray(size[0] * size[1] * size[2])
+        return np.zeros(size, dtype=np.uint8)
+    return bytearray(size)
+
+
+def payload_bytes(payload_name):
+    """
+    Return the size of a synthetic payload in bytes.
+
+    :Parameters:
+        :param str payload_name: key of PAYLOADS.
+    :rtype: int
+    :return int: the payload size.
+    """
+    size = PAYLOADS[payload_name]
+    if size is None:
+        return len(make_payload(payload_name))
+    if isinstance(size, tuple):
+        return size[0] * size[1] * size[2]
+    return size
+
+
+def synthetic_producer(return_queue, payload_name, count, rate, finished_signal=DONE):
+    """
+    Stand-in for cam_process: send count (sequence, sent_at, payload) messages at rate per second, then finish.
+
+    :Parameters:
+        :param multiprocessing.Queue return_queue: queue for all communications to the host process.
+        :param str payload_name: key of PAYLOADS.
+        :param int count: number of messages to send.
+        :param float rate: messages sent per second, or 0 to send as fast as possible.
+        :param str finished_signal: message to be used to indicate that this process finished.
+    :rtype: None
+    :return: None
+    """
+    payload = make_payload(payload_name)
+    interval = 1 / rate if rate else 0
+    next_send = monotonic()
+    for sequence in range(count):
+        if interval:
+            delay = next_send - monotonic()
+            if delay > 0:
+                sleep(delay)
+            next_send += interval
+        return_queue.put((sequence, monotonic(), payload))
+    return_queue.put(finished_signal)
+
+
+def camera_producer(return_queue, command_queue, payload_name, count, rate, grab_thread=False, **cam_kwargs):
+    """
+    Run SyncCam on a FakeVideoCapture until it has captured count frames, then finish as cam_process does.
+
+    :Parameters:
+        :param multiprocessing.Queue return_queue: queue for all communications to the host process.
+        :param multiprocessing.Queue command_queue: queue for communications from the host process to this process.
+        :param str payload_name: key of PAYLOADS with a frame shape.
+        :param int count: number of frames to capture.
+        :param float rate: frames captured per second, or 0 to capture as fast as possible.
+        :param bool grab_thread: determines if SyncCam captures on a FrameGrabber thread.
+        :param cam_kwargs: keyword arguments passed on by the host, such as frame_ring and frame_codec.
+    :rtype: None
+    :return: None
+    """
+    from drones import SyncCam  # Needs cv2, so only camera benchmarks import it.
+    cam = SyncCam(command_queue, return_queue, 0, KILL, SRCE, QURY, pacing=PACE_CAMERA, grab_thread=grab_thread,
+                  **cam_kwargs)
+    cam.video_capture = FakeVideoCapture(payload_name, count, rate)
+    try:
+        cam.get_feed()
+    except FeedFinished:
+        pass
+    return_queue.put(DONE)
+
+
+def synthetic_task(payload_name):
+    """
+    Stand-in for a pool run_target: return a freshly made payload.
+
+    :Parameters:
+        :param str payload_name: key of PAYLOADS.
+    :rtype: str, bytearray or numpy.array
+    :return: the payload.
+    """
+    return make_payload(payload_name)
+
+
+def percentile(values, fraction):
+    """
+    Return the nearest-rank percentile of values.
+
+    :Parameters:
+        :param list of float values: the measurements.
+        :param float fraction: the percentile as a fraction, e.g. 0.99.
+    :rtype: float or None
+    :return float or None: the percentile, or None if there are no values.
+    """
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, int(round(fraction * len(ordered))) - 1))]
+
+
+def summarize(manager, mode, payload_name, rate, message_check_delay, sent, arrivals, completed):
+    """
+    Turn raw (sent_at, arrived_at) pairs into a result record.
+
+    :Parameters:
+        :param str manager: name of the benchmarked class.
+        :param str mode: key of MODES, or None.
+        :param str payload_name: key of PAYLOADS.
+        :param float rate: producer messages per second, or 0 for unthrottled.
+        :param int or None message_check_delay: the host's message_check_delay, if it has one.
+        :param int sent: number of payloads sent.
+        :param list of tuple arrivals: (sent_at, arrived_at) for every delivered payload.
+        :param bool completed: whether the run finished before its timeout.
+    :rtype: dict
+    :return dict: the JSON-serializable result record.
+    """
+    latencies = [arrived_at - sent_at for sent_at, arrived_at in arrivals]
+    seconds = (max(arrived for _, arrived in arrivals) - min(sent for sent, _ in arrivals)) if arrivals else 0.0
+    size = payload_bytes(payload_name)
+    p50 = percentile(latencies, 0.5)
+    p99 = percentile(latencies, 0.99)
+    return {"manager": manager,
+            "mode": mode,
+            "payload": payload_name,
+            "payload_bytes": size,
+            "rate": rate,
+            "message_check_delay": message_check_delay,
+            "sent": sent,
+            "delivered": len(arrivals),
+            "completed": completed,
+            "seconds": seconds,
+            "messages_per_second": len(arrivals) / seconds if seconds else None,
+            "bytes_per_second": len(arrivals) * size / seconds if seconds else None,
+            "latency_p50_ms": None if p50 is None else p50 * 1000,
+            "latency_p99_ms": None if p99 is None else p99 * 1000}
+
+
+def bench_host(host_class, mode, payload_name, count, rate, message_check_delay, timeout=60):
+    """
+    Measure delivery from a synthetic producer to a host's message_callback.
+
+    :Parameters:
+        :param type host_class: ProcessHost or GreedyProcessHost.
+        :param str mode: key of MODES.
+        :param str payload_name: key of PAYLOADS.
+        :param int count: number of payloads to send.
+        :param float rate: producer messages per second, or 0 for unthrottled.
+        :param int message_check_delay: the host's message_check_delay.
+        :param float timeout: most seconds to run.
+    :rtype: dict
+    :return dict: the result record.
+    """
+    arrivals = []
+    completed = run_host(host_class, MODES[mode], lambda msg: arrivals.append((msg[1], monotonic())), timeout,
+                         synthetic_producer, payload_name, count, rate, message_check_delay=message_check_delay)
+    return summarize(host_class.__name__, mode, payload_name, rate, message_check_delay, count, arrivals, completed)
+
+
+def bench_camera(mode, payload_name, count, rate, message_check_delay, timeout=60):
+    """
+    Measure the SyncCam pipeline, from each frame's capture by a FakeVideoCapture to the host's message_callback.
+
+    :Parameters:
+        :param str mode: key of MODES, other than conflate.
+        :param str payload_name: key of PAYLOADS with a frame shape.
+        :param int count: number of frames to capture.
+        :param float rate: frames captured per second, or 0 for unthrottled.
+        :param int message_check_delay: the host's message_check_delay.
+        :param float timeout: most seconds to run.
+    :rtype: dict
+    :return dict: the result record.
+    """
+    shape = PAYLOADS[payload_name]
+    options = {key: value(shape) if callable(value) else value for key, value in MODES[mode].items()}
+    grab_thread = options.pop("grab_thread", False)  # For SyncCam, rather than the host.
+    arrivals = []
+    try:
+        completed = run_host(ProcessHost, options, lambda msg: arrivals.append((frame_stamp(msg), monotonic())),
+                             timeout, camera_producer, payload_name, count, rate, grab_thread,
+                             message_check_delay=message_check_delay, host_to_process_signals={QURY})
+    finally:
+        if "frame_ring" in options:
+            options["frame_ring"].close()
+            options["frame_ring"].unlink()
+    return summarize("SyncCam", mode, payload_name, rate, message_check_delay, count, arrivals, completed)
+
+
+def run_host(host_class, options, on_data, timeout, process_target, *process_args, **host_kwargs):
+    """
+    Run process_target under a host on the shared HeadlessRoot until it finishes or timeout expires.
+
+    :Parameters:
+        :param type host_class: ProcessHost or GreedyProcessHost.
+        :param dict options: host keyword arguments for the mode.
+        :param function on_data: called with every data message, on the scheduler thread.
+        :param float timeout: most seconds to run.
+        :param function process_target: the process to be run.
+        :param process_args: positional arguments to be passed to process_target.
+        :param host_kwargs: further host keyword arguments.
+    :rtype: bool
+    :return bool: whether the process finished before timeout.
+    """
+    root = HeadlessRoot.shared()
+    ended = Event()
+
+    def on_message(msg):
+        if isinstance(msg, str):
+            ended.set()
+        else:
+            on_data(msg)
+
+    options = dict(options, **host_kwargs)
+    if host_class is ProcessHost:
+        options["messages_per_check"] = 0
+    host = host_class(root, on_message, process_target, *process_args, **options)
+    completed = ended.wait(timeout)
+    if host.is_running:
+        root.after(0, host.kill_process)  # On the scheduler thread, like every other host callback.
+        while host.is_running:
+            sleep(0.01)
+    return completed
+
+
+def bench_handler(payload_name, count, rate, timeout=60):
+    """
+    Measure relaying from a synthetic producer through a SingleProcessHandler thread, without a host.
+
+    :Parameters:
+        :param str payload_name: key of PAYLOADS.
+        :param int count: number of payloads to send.
+        :param float rate: producer messages per second, or 0 for unthrottled.
+        :param float timeout: most seconds to run.
+    :rtype: dict
+    :return dict: the result record.
+    """
+    to_host_queue = Queue()
+    handler = SingleProcessHandler(synthetic_producer, MultiQueue(), to_host_queue, payload_name, count, rate)
+    handler.start()
+    arrivals = []
+    completed = False
+    deadline = monotonic() + timeout
+    while monotonic() < deadline:
+        try:
+            msg = to_host_queue.get(timeout=max(deadline - monotonic(), 0))
+        except EmptyQueue:
+            break
+        arrived_at = monotonic()
+        if isinstance(msg, str):
+            completed = True
+            break
+        arrivals.append((msg[1], arrived_at))
+    handler.join(timeout)
+    return summarize("SingleProcessHandler", None, payload_name, rate, None, count, arrivals, completed)
+
+
+def bench_pool(payload_name, count, pool_size=4, timeout=60):
+    """
+    Measure streamed results from a PoolProcessHandler running a synthetic task, timing each from job submission.
+
+    :Parameters:
+        :param str payload_name: key of PAYLOADS.
+        :param int count: number of tasks to run.
+        :param int pool_size: number of worker processes.
+        :param float timeout: most seconds to run.
+    :rtype: dict
+    :return dict: the result record.
+    """
+    return_queue = Queue()
+    handler = PoolProcessHandler(synthetic_task, return_queue, [payload_name] * count,
+                                 pool_size=pool_size, time_limit=timeout, stream_results=True)
+    submitted_at = monotonic()
+    handler.start()
+    arrivals = []
+    completed = False
+    while True:
+        msg = return_queue.get()
+        arrived_at = monotonic()
+        if isinstance(msg, str):
+            completed = not handler.timed_out
+            break
+        arrivals.append((submitted_at, arrived_at))
+    handler.join()
+    return summarize("PoolProcessHandler", None, payload_name, 0, None, count, arrivals, completed)
+
+
+def run_suite(managers=MANAGERS, modes=("queue", "direct"), payloads=("signal", "64KiB", "1080p"),
+              rates=(0, 60), message_check_delays=(1, 15), count=100, timeout=60):
+    """
+    Sweep every combination of the given settings, yielding one result record per run.
+
+    :Parameters:
+        :param tuple of str managers: names from MANAGERS to benchmark.
+        :param tuple of str modes: keys of MODES, used by the hosts.
+        :param tuple of str payloads: keys of PAYLOADS. SyncCam only runs with frame shapes.
+        :param tuple of float rates: producer messages per second, 0 for unthrottled. Unused by the pool.
+        :param tuple of int message_check_delays: host message_check_delay values. Unused without a host.
+        :param int count: number of payloads per run.
+        :param float timeout: most seconds per run.
+    :rtype: generator
+    :return generator: result records.
+    """
+    for payload_name in payloads:
+        if "PoolProcessHandler" in managers:
+            yield bench_pool(payload_name, count, timeout=timeout)
+        for rate in rates:
+            if "SingleProcessHandler" in managers:
+                yield bench_handler(payload_name, count, rate, timeout)
+            for host_class in (ProcessHost, GreedyProcessHost):
+                if host_class.__name__ not in managers:
+                    continue
+                for mode in modes:
+                    if ((mode == "conflate" and host_class is not GreedyProcessHost)
+                            or mode in CAMERA_ONLY_MODES):
+                        continue
+                    for message_check_delay in message_check_delays:
+                        yield bench_host(host_class, mode, payload_name, count, rate, message_check_delay, timeout)
+            if "SyncCam" in managers and isinstance(PAYLOADS[payload_name], tuple):
+                for mode in modes:
+                    if mode == "conflate":
+                        continue
+                    for message_check_delay in message_check_delays:
+                        yield bench_camera(mode, payload_name, count, rate, message_check_delay, timeout)
+
+
+def run_staleness(modes=("queue", "direct", "conflate"), payloads=("signal", "VGA"), rate=200,
+                  message_check_delay=200, seconds=3.0, timeout=60):
+    """
+    Measure how old each message delivered by a GreedyProcessHost is when a fast producer outpaces a slowly polled
+    host - the host only wants the newest message, so latency here is staleness.
+
+    :Parameters:
+        :param tuple of str modes: keys of MODES usable by GreedyProcessHost.
+        :param tuple of str payloads: keys of PAYLOADS.
+        :param float rate: producer messages per second.
+        :param int message_check_delay: the host's message_check_delay, much longer than the producer's interval.
+        :param float seconds: how long each producer runs.
+        :param float timeout: most seconds per run.
+    :rtype: generator
+    :return generator: result records, with "suite" set to "staleness".
+    """
+    for payload_name in payloads:
+        for mode in modes:
+            record = bench_host(GreedyProcessHost, mode, payload_name, int(rate * seconds), rate,
+                                message_check_delay, timeout)
+            record["suite"] = "staleness"
+            yield record
+
+
+def main(arguments=None):
+    """
+    Run the suite from the command line, writing one JSON record per line.
+
+    :Parameters:
+        :param list of str arguments: command line arguments, defaulting to sys.argv.
+    :rtype: None
+    :return: None
+    """
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--managers", nargs="+", default=MANAGERS, choices=MANAGERS)
+    parser.add_argument("--modes", nargs="+", default=("queue", "direct"), choices=sorted(MODES))
+    parser.add_argument("--payloads", nargs="+", default=("signal", "64KiB", "1080p"), choices=list(PAYLOADS))
+    parser.add_argument("--rates", nargs="+", type=float, default=(0, 60))
+    parser.add_argument("--message-check-delays", nargs="+", type=int, default=(1, 15))
+    parser.add_argument("--count", type=int, default=100)
+    parser.add_argument("--timeout", type=float, default=60)
+    parser.add_argument("--staleness", action="store_true",
+                        help="measure the age of messages delivered by GreedyProcessHost instead of running the suite")
+    parser.add_argument("--output", help="file to write results to, instead of stdout")
+    options = parser.parse_args(arguments)
+    output = open(options.output, "w") if options.output else sys.stdout
+    if options.staleness:
+        records = run_staleness(timeout=options.timeout)
+    else:
+        records = run_suite(options.managers, options.modes, options.payloads, options.rates,
+                            options.message_check_delays, options.count, options.timeout)
+    try:
+        for record in records:
+            output.write(json.dumps(record) + "\n")
+            output.flush()
+    finally:
+        if output is not sys.stdout:
+            output.close()
+
+
+if __name__ == "__main__":
+    main()
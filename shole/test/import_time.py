@@ -0,0 +1,63 @@
+"""Measures how long a fresh interpreter takes to import a module, and which heavy modules it pulls in."""
+import os
+import subprocess
+import sys
+from collections import namedtuple
+
+PACKAGE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HEAVY_MODULES = ("cv2", "numpy", "asyncio", "PIL", "tkinter")
+MANAGER_BUDGET = 0.25  # Seconds; importing managers should stay well under this with only the stdlib.
+
+ImportCost = namedtuple("ImportCost", ("module", "seconds", "heavy_modules"))
+
+
+def measure_import(module_name="managers", heavy_modules=HEAVY_MODULES):
+    """
+    Import a module in a fresh interpreter with -X importtime and report its cumulative import time.
+
+    :Parameters:
+        :param str module_name: the module to be imported, relative to the shole package directory.
+        :param tuple of str heavy_modules: top-level modules to report if the import pulls them in.
+    :rtype: ImportCost
+    :return ImportCost: the module, its cumulative import time in seconds and the heavy modules it imported.
+    """
+    environment = dict(os.environ)
+    environment["PYTHONPATH"] = os.pathsep.join(filter(None, (PACKAGE_DIR, environment.get("PYTHONPATH"))))
+    completed = subprocess.run([sys.executable, "-X", "importtime", "-c", "import {}".format(module_name)],
+                               stderr=subprocess.PIPE, universal_newlines=True, env=environment, check=True)
+    seconds = 0.0
+    imported = set()
+    for line in completed.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        name = name.strip()
+        imported.add(name.split(".")[0])
+        if name == module_name:
+            seconds = int(cumulative) / 1e6
+    return ImportCost(module_name, seconds, sorted(imported.intersection(heavy_modules)))
+
+
+def check_manager_imports(budget=MANAGER_BUDGET):
+    """
+    Verify that managers imports within budget and without any heavy modules.
+
+    :Parameters:
+        :param float budget: most seconds importing managers may take.
+    :rtype: ImportCost
+    :return ImportCost: the measured cost.
+    :raises AssertionError: if managers is too slow to import or imports a heavy module.
+    """
+    cost = measure_import("managers")
+    assert not cost.heavy_modules, "managers imported {}.".format(", ".join(cost.heavy_modules))
+    assert cost.seconds <= budget, "managers took {:.3f}s to import (budget {:.3f}s).".format(cost.seconds, budget)
+    return cost
+
+
+if __name__ == "__main__":
+    for measured in ("constants", "channels", "managers", "drones"):
+        try:
+            print(measure_import(measured))
+        except subprocess.CalledProcessError:
+            print("{} could not be imported.".format(measured))
+    check_manager_imports()
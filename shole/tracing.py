@@ -0,0 +1,333 @@
+"""Span tracing for hosts, handlers and their processes, merged into one Chrome trace, and on-demand profiling."""
+import os
+from collections import deque, namedtuple
+from multiprocessing import current_process
+from threading import current_thread
+from time import monotonic
+try:
+    from contextlib import nullcontext
+except ImportError:  # Python < 3.7.
+    nullcontext = None
+try:
+    from threading import get_native_id
+except ImportError:  # Python < 3.8 - Python's own thread ids, which the trace viewer shows just as well.
+    from threading import get_ident as get_native_id
+
+
+class _NoSpan(object):
+    """Context which records nothing, in place of contextlib.nullcontext on Python < 3.7."""
+    def __enter__(self):
+        """Do nothing."""
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        """Do nothing, letting any exception propagate."""
+        return False
+
+
+NO_SPAN = nullcontext() if nullcontext is not None else _NoSpan()  # Used in place of a span when tracing is off.
+
+TraceEvents = namedtuple("TraceEvents", ("events",))  # A batch of Chrome trace events shipped from a process.
+
+
+class ProfileStats(namedtuple("ProfileStats", ("process_name", "pid", "seconds", "stats"))):
+    """cProfile results shipped from a process, with the seconds it was profiled for."""
+    __slots__ = ()
+
+    def pstats(self):
+        """
+        Load the results into a pstats.Stats for sorting and printing.
+
+        :rtype: pstats.Stats
+        :return pstats.Stats: the loaded statistics.
+        """
+        import pstats
+        return pstats.Stats(_LoadedProfile(self.stats))
+
+    def dump(self, path):
+        """
+        Write the results in the file format of cProfile's dump_stats, for snakeviz and similar viewers.
+
+        :Parameters:
+            :param str path: file to be written.
+        :rtype: None
+        :return: None
+        """
+        import marshal
+        with open(path, "wb") as stats_file:
+            marshal.dump(self.stats, stats_file)
+
+
+class _LoadedProfile(object):
+    """Stands in for a cProfile.Profile when loading shipped statistics into pstats.Stats."""
+    def __init__(self, stats):
+        """
+        Hold a copy of the statistics.
+
+        :Parameters:
+            :param dict stats: statistics from cProfile.Profile.create_stats.
+        :rtype: None
+        :return: None
+        """
+        self.stats = dict(stats)
+
+    def create_stats(self):
+        """Called by pstats.Stats; the statistics are already created."""
+
+
+def span(tracer, name, category="shole", **args):
+    """
+    Return tracer.span(name, category, **args), or a context which records nothing if tracer is None.
+
+    :Parameters:
+        :param Tracer or None tracer: the tracer to record into.
+        :param str name: name of the span.
+        :param str category: Chrome trace category of the span.
+        :param args: values shown with the span in the trace viewer.
+    :rtype: context manager
+    :return: the span.
+    """
+    if tracer is None:
+        return NO_SPAN
+    return tracer.span(name, category, **args)
+
+
+class _Span(object):
+    """Records a complete event covering the body of a with block."""
+    __slots__ = ("tracer", "name", "category", "args", "started")
+
+    def __init__(self, tracer, name, category, args):
+        """
+        Prepare the span.
+
+        :Parameters:
+            :param Tracer tracer: the tracer to record into.
+            :param str name: name of the span.
+            :param str category: Chrome trace category of the span.
+            :param dict args: values shown with the span in the trace viewer.
+        :rtype: None
+        :return: None
+        """
+        self.tracer = tracer
+        self.name = name
+        self.category = category
+        self.args = args
+        self.started = None
+
+    def __enter__(self):
+        """Start timing."""
+        self.started = monotonic()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        """Record the span, whether or not its body raised."""
+        self.tracer.complete(self.name, self.started, self.category, self.args)
+
+
+class Tracer(object):
+    """
+    Records spans as Chrome trace events, and collects events and profiles shipped from processes.
+
+    Timestamps come from time.monotonic, which reads a clock shared by every process on the machine, so events
+    recorded in different processes line up in one timeline. Load the file written by write in chrome://tracing or
+    https://ui.perfetto.dev.
+    """
+    def __init__(self, process_name=None, *, max_events=100000, ship_interval=1.0):
+        """
+        Start an empty trace.
+
+        :Parameters:
+            :param str process_name: name shown for this process in the trace viewer, defaulting to the
+                multiprocessing process name.
+            :param int max_events: most events kept - the oldest are discarded first.
+            :param float ship_interval: least seconds between batches sent by ship.
+        :rtype: None
+        :return: None
+        """
+        self.pid = os.getpid()
+        self.process_name = process_name if process_name is not None else current_process().name
+        self.events = deque(maxlen=max_events)
+        self.profiles = []  # ProfileStats collected from processes.
+        self.ship_interval = ship_interval
+        self._metadata = {(self.pid, None): _metadata_event("process_name", self.pid, None, self.process_name)}
+        self._next_ship = monotonic() + ship_interval
+        self._profile = None
+        self._profile_started = None
+
+    def span(self, name, category="shole", **args):
+        """
+        Return a context manager which records its body as a span on the calling thread.
+
+        :Parameters:
+            :param str name: name of the span.
+            :param str category: Chrome trace category of the span.
+            :param args: values shown with the span in the trace viewer.
+        :rtype: _Span
+        :return _Span: the span.
+        """
+        return _Span(self, name, category, args)
+
+    def complete(self, name, started, category="shole", args=None):
+        """
+        Record a span on the calling thread which started at started and ends now.
+
+        :Parameters:
+            :param str name: name of the span.
+            :param float started: time.monotonic() when the span started.
+            :param str category: Chrome trace category of the span.
+            :param dict args: values shown with the span in the trace viewer.
+        :rtype: None
+        :return: None
+        """
+        ended = monotonic()
+        thread_id = get_native_id()
+        if (self.pid, thread_id) not in self._metadata:
+            self._metadata[(self.pid, thread_id)] = _metadata_event("thread_name", self.pid, thread_id,
+                                                                    current_thread().name)
+        event = {"name": name, "cat": category, "ph": "X", "pid": self.pid, "tid": thread_id,
+                 "ts": started * 1e6, "dur": (ended - started) * 1e6}
+        if args:
+            event["args"] = args
+        self.events.append(event)
+
+    def counter(self, name, category="shole", **values):
+        """
+        Record the current value of one or more counters, drawn as a stacked track in the trace viewer.
+
+        :Parameters:
+            :param str name: name of the track.
+            :param str category: Chrome trace category of the track.
+            :param values: numbers to be recorded - None values are left out.
+        :rtype: None
+        :return: None
+        """
+        self.events.append({"name": name, "cat": category, "ph": "C", "pid": self.pid, "ts": monotonic() * 1e6,
+                            "args": {key: value for key, value in values.items() if value is not None}})
+
+    def drain(self):
+        """
+        Remove and return every recorded event, preceded by the process and thread name events.
+
+        :rtype: list of dict
+        :return list of dict: Chrome trace events.
+        """
+        events = list(self._metadata.values())
+        while self.events:
+            events.append(self.events.popleft())
+        return events
+
+    def ship(self, queue, force=False):
+        """
+        Send recorded events to the host as TraceEvents, if ship_interval has passed since the last batch.
+
+        :Parameters:
+            :param multiprocessing.Queue queue: the host's trace queue.
+            :param bool force: determines if events are sent regardless of ship_interval, as when the process ends.
+        :rtype: bool
+        :return bool: True if a batch was sent.
+        """
+        now = monotonic()
+        if self.events and (force or now >= self._next_ship):
+            queue.put(TraceEvents(self.drain()))
+            self._next_ship = now + self.ship_interval
+            return True
+        return False
+
+    def collect(self, msg):
+        """
+        Merge TraceEvents or ProfileStats shipped from a process into this tracer.
+
+        :Parameters:
+            :param TraceEvents or ProfileStats msg: the shipped message.
+        :rtype: None
+        :return: None
+        """
+        if msg.__class__ is ProfileStats:
+            self.profiles.append(msg)
+            return
+        for event in msg.events:
+            if event["ph"] == "M":
+                self._metadata[(event["pid"], event.get("tid"))] = event
+            else:
+                self.events.append(event)
+
+    @property
+    def is_profiling(self):
+        """
+        Determine if start_profiling has been called without a matching stop_profiling.
+
+        :rtype: bool
+        :return bool: True while profiling.
+        """
+        return self._profile is not None
+
+    def start_profiling(self):
+        """
+        Profile the calling thread with cProfile until stop_profiling.
+
+        :rtype: None
+        :return: None
+        """
+        if self._profile is not None:
+            return
+        import cProfile
+        self._profile = cProfile.Profile()
+        self._profile_started = monotonic()
+        self._profile.enable()
+
+    def stop_profiling(self):
+        """
+        Stop profiling, recording the profiled time as a span.
+
+        :rtype: ProfileStats or None
+        :return ProfileStats or None: the results, or None if not profiling.
+        """
+        if self._profile is None:
+            return None
+        self._profile.disable()
+        self._profile.create_stats()
+        stats = ProfileStats(self.process_name, self.pid, monotonic() - self._profile_started, self._profile.stats)
+        self.complete("profile", self._profile_started, "profile")
+        self._profile = None
+        return stats
+
+    def to_chrome(self):
+        """
+        Return the whole trace as a Chrome trace-event document.
+
+        :rtype: dict
+        :return dict: JSON-serializable trace, with events in time order.
+        """
+        events = sorted(self.events, key=lambda event: event["ts"])
+        return {"traceEvents": list(self._metadata.values()) + events, "displayTimeUnit": "ms"}
+
+    def write(self, path):
+        """
+        Write the whole trace as Chrome trace-event JSON.
+
+        :Parameters:
+            :param str path: file to be written.
+        :rtype: None
+        :return: None
+        """
+        import json
+        with open(path, "w") as trace_file:
+            json.dump(self.to_chrome(), trace_file)
+
+
+def _metadata_event(kind, pid, thread_id, name):
+    """
+    Create a Chrome trace metadata event naming a process or thread.
+
+    :Parameters:
+        :param str kind: "process_name" or "thread_name".
+        :param int pid: the process id.
+        :param int or None thread_id: the native thread id, or None for a process name.
+        :param str name: the name to be shown.
+    :rtype: dict
+    :return dict: the metadata event.
+    """
+    event = {"name": kind, "ph": "M", "pid": pid, "args": {"name": name}}
+    if thread_id is not None:
+        event["tid"] = thread_id
+    return event